@@ -1,11 +1,39 @@
+#
+# aes-cmac (rfc 4493). mac() runs all blocks through one persistent cbc
+# cipher in a single encrypt call. the cipher keeps chaining from the last
+# block of the previous message, so that block is xored out of the first
+# block again (the state is the previous tag). the lock keeps the state and
+# the cipher consistent across threads.
+#
+import threading
 from Crypto.Cipher import AES
 from struct import pack, unpack
+from collections import OrderedDict
 
 class AES_CMAC:
+
+    def __init__(self, K = None):
+        self.K = None
+        if K is not None:
+            self.set_key(K)
+
+    def set_key(self, K):
+        self.K = bytes(K)
+        self.cipher = AES.new(self.K, AES.MODE_ECB)
+        self.cbc = AES.new(self.K, AES.MODE_CBC, iv=b'\x00'*16)
+        self.state = 0
+        self.lock = threading.Lock()
+        K1, K2 = self.gen_subkey(self.K)
+        self.K1 = int.from_bytes(K1, 'big')
+        self.K2 = int.from_bytes(K2, 'big')
+
+    def get_key(self):
+        return self.K
+
     def gen_subkey(self, K):
-        AES_128 = AES.new(K)
+        AES_128 = AES.new(K, AES.MODE_ECB)
 
-        L = AES_128.encrypt('\x00'*16)
+        L = AES_128.encrypt(b'\x00'*16)
 
         LHigh = unpack('>Q',L[:8])[0]
         LLow  = unpack('>Q',L[8:])[0]
@@ -28,10 +56,8 @@ class AES_CMAC:
         return K1, K2
 
     def xor_128(self, N1, N2):
-        J = b''
-        for i in range(len(N1)):
-            J += bytes([N1[i] ^ N2[i]])
-        return J
+        n = len(N1)
+        return (int.from_bytes(N1, 'big') ^ int.from_bytes(N2[:n], 'big')).to_bytes(n, 'big')
 
     def pad(self, N):
         const_Bsize = 16
@@ -39,35 +65,54 @@ class AES_CMAC:
         return  N + b'\x80' + b'\x00'*(padLen-1)
 
     def encode(self, K, M):
-        const_Bsize = 16
-        const_Zero  = b'\x00'*16
+        if self.K is not None and bytes(K) == self.K:
+            return self.mac(M)
+        return cmac_cache.get(K).mac(M)
 
-        AES_128= AES.new(K)
-        K1, K2 = self.gen_subkey(K)
-        n      = int(len(M)/const_Bsize)
+    def mac(self, M):
+        const_Bsize = 16
 
-        if n == 0:
-            n = 1
-            flag = False
+        n = len(M)
+        if n and n % const_Bsize == 0:
+            last = n - const_Bsize
+            M_last = int.from_bytes(M[last:], 'big') ^ self.K1
         else:
-            if (len(M) % const_Bsize) == 0:
-                flag = True
+            last = n - n % const_Bsize
+            M_last = int.from_bytes(self.pad(bytes(M[last:])), 'big') ^ self.K2
+
+        with self.lock:
+            if last:
+                first = (int.from_bytes(M[:const_Bsize], 'big') ^ self.state).to_bytes(16, 'big')
+                T = self.cbc.encrypt(b''.join((first, M[const_Bsize:last], M_last.to_bytes(16, 'big'))))[-16:]
             else:
-                n += 1
-                flag = False
+                T = self.cbc.encrypt((M_last ^ self.state).to_bytes(16, 'big'))
+            self.state = int.from_bytes(T, 'big')
+        return T
 
-        M_n = M[(n-1)*const_Bsize:]
-        if flag is True:
-            M_last = self.xor_128(M_n,K1)
-        else:
-            M_last = self.xor_128(self.pad(M_n),K2)
 
-        X = const_Zero
-        for i in range(n-1):
-            M_i = M[(i)*const_Bsize:][:16]
-            Y   = self.xor_128(X, M_i)
-            X   = AES_128.encrypt(Y)
-        Y = self.xor_128(M_last, X)
-        T = AES_128.encrypt(Y)
+class CMACCache:
 
-        return T
+    def __init__(self, size = 1024):
+        self.size = size
+        self.contexts = OrderedDict()
+
+    def get(self, K):
+        K = bytes(K)
+        try:
+            context = self.contexts[K]
+            self.contexts.move_to_end(K)
+        except KeyError:
+            context = AES_CMAC(K)
+            self.contexts[K] = context
+            if len(self.contexts) > self.size:
+                self.contexts.popitem(last=False)
+        return context
+
+    def get_cipher(self, K):
+        return self.get(K).cipher
+
+    def clear(self):
+        self.contexts.clear()
+
+
+cmac_cache = CMACCache()
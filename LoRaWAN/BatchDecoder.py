@@ -0,0 +1,138 @@
+#
+# batch decode of data frames: frames are grouped by devaddr so every session
+# costs one key lookup and one keystream encrypt call for the whole group.
+# devaddrs are handed to key_lookup and returned most significant byte first,
+# the same order create() takes them in. key_lookup is either a SessionStore,
+# whose sessions sharing a devaddr are told apart by their mic, or a callable
+# returning the (nwkey, appkey) pair for a devaddr or None. with a store the
+# 32 bit frame counter is rebuilt from its tracker and replays are rejected.
+#
+from collections import namedtuple
+from .AES_CMAC import cmac_cache
+from .MHDR import MHDR
+from .Direction import Direction
+from .DataPayload import DataPayload
+from .Session import Session
+from .SessionStore import SessionStore
+
+DecodedFrame = namedtuple('DecodedFrame', ['error', 'mtype', 'devaddr', 'fcnt', 'fport', 'payload'])
+
+class BatchDecoder:
+
+    OK = 0
+    MALFORMED = 1
+    UNSUPPORTED_MTYPE = 2
+    UNKNOWN_DEVADDR = 3
+    INVALID_MIC = 4
+    INVALID_FCNT = 5
+
+    DATA_TYPES = (MHDR.UNCONF_DATA_UP, MHDR.UNCONF_DATA_DOWN, MHDR.CONF_DATA_UP, MHDR.CONF_DATA_DOWN)
+
+    def __init__(self, key_lookup):
+        self.key_lookup = key_lookup
+
+    def lookup(self, devaddr):
+        if isinstance(self.key_lookup, SessionStore):
+            return self.key_lookup.lookup(devaddr)
+        keys = self.key_lookup(devaddr)
+        if keys is None:
+            return []
+        return [Session(devaddr, keys[0], keys[1])]
+
+    def decode(self, frames):
+        results = [None] * len(frames)
+        groups = {}
+        for i, frame in enumerate(frames):
+            if not isinstance(frame, (bytes, bytearray, memoryview)):
+                frame = bytes(frame)
+            frame = memoryview(frame)
+            header = self.read_header(frame)
+            if header[0] != self.OK:
+                results[i] = DecodedFrame(header[0], header[1], None, None, None, None)
+                continue
+            groups.setdefault(header[2], []).append((i, frame, header))
+
+        for devaddr, group in groups.items():
+            self.decode_group(devaddr, group, results)
+        return results
+
+    def read_header(self, frame):
+        length = len(frame)
+        if length < 12 or frame[0] & MHDR.MHDR_MAJOR != MHDR.LORAWAN_V1:
+            return (self.MALFORMED, None)
+        mtype = frame[0] & MHDR.MHDR_TYPE
+        if mtype not in self.DATA_TYPES:
+            return (self.UNSUPPORTED_MTYPE, mtype)
+        fhdr_end = 8 + (frame[5] & 0xf)
+        if fhdr_end > length - 4:
+            return (self.MALFORMED, mtype)
+        fport = frame[fhdr_end] if fhdr_end < length - 4 else None
+        return (self.OK, mtype, bytes(frame[4:0:-1]), frame[6] | frame[7] << 8, fport, fhdr_end + 1)
+
+    def decode_group(self, devaddr, group, results):
+        sessions = self.lookup(devaddr)
+        if not sessions:
+            for i, frame, header in group:
+                results[i] = DecodedFrame(self.UNKNOWN_DEVADDR, header[1], devaddr, header[3], header[4], None)
+            return
+
+        tracker = self.key_lookup.fcnt if isinstance(self.key_lookup, SessionStore) else None
+        cmacs = [cmac_cache.get(session.nwkey) for session in sessions]
+        pending = {}
+        for i, frame, header in group:
+            mtype = header[1]
+            direction = Direction.DIRECTION[mtype]
+            msg = bytearray(b''.join((
+                b'\x49\x00\x00\x00\x00',
+                bytes((direction,)),
+                frame[1:5],
+                frame[6:8],
+                b'\x00\x00\x00',
+                bytes((len(frame) - 4,)),
+                frame[:-4])))
+            mic = frame[-4:]
+            fcnt = header[3]
+            stale = None
+            for session, cmac in zip(sessions, cmacs):
+                if tracker is not None:
+                    fcnt = tracker.reconstruct(session.slot, direction, header[3])
+                    # replays and jumps out of the window are counter errors, no mic needed
+                    if not tracker.check(session.slot, direction, fcnt):
+                        if stale is None:
+                            stale = fcnt
+                        continue
+                    msg[12:14] = (fcnt >> 16).to_bytes(2, 'little')
+                if cmac.mac(msg)[:4] == mic:
+                    break
+            else:
+                if stale is not None:
+                    results[i] = DecodedFrame(self.INVALID_FCNT, mtype, devaddr, stale, header[4], None)
+                else:
+                    results[i] = DecodedFrame(self.INVALID_MIC, mtype, devaddr, header[3], header[4], None)
+                continue
+            if tracker is not None and not self.key_lookup.accept_fcnt(session, direction, fcnt):
+                results[i] = DecodedFrame(self.INVALID_FCNT, mtype, devaddr, fcnt, header[4], None)
+                continue
+            key = session.nwkey if header[4] == 0 else session.appkey
+            pending.setdefault(key, []).append((i, frame, header[:3] + (fcnt,) + header[4:], direction))
+
+        for key, frames in pending.items():
+            self.decrypt_group(key, devaddr, frames, results)
+
+    def decrypt_group(self, key, devaddr, frames, results):
+        blocks = []
+        for i, frame, header, direction in frames:
+            k = (len(frame) - 4 - header[5] + 15) >> 4
+            if k > 0:
+                blocks.append(DataPayload.counter_blocks(direction, frame[1:5], header[3].to_bytes(4, 'little'), k))
+        s = cmac_cache.get_cipher(key).encrypt(b''.join(blocks)) if blocks else b''
+
+        offset = 0
+        for i, frame, header, direction in frames:
+            data = frame[header[5]:-4]
+            n = len(data)
+            payload = b''
+            if n:
+                payload = (int.from_bytes(data, 'big') ^ int.from_bytes(s[offset:offset + n], 'big')).to_bytes(n, 'big')
+                offset += ((n + 15) >> 4) << 4
+            results[i] = DecodedFrame(self.OK, header[1], devaddr, header[3], header[4], payload)
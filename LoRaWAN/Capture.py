@@ -0,0 +1,228 @@
+#
+# capture files of raw phy frames, read through mmap as generators so files
+# of any size are streamed in constant memory.
+#
+# log: magic(8) then records of timestamp(8, double) length(2) frame(length),
+# little endian. the length prefix is all a reader needs to skip a record.
+#
+# journal: magic(8) then records of timestamp(8, double) freq(4, hz) sf(1)
+# rssi(2, dbm) snr(2, quarter db) length(2) frame(length), written by Journal.
+#
+# pcap: link type 270 (LoRaTap), micro or nanosecond timestamps, either byte
+# order. the LoRaTap v0 header carries frequency, bandwidth, sf, rssi and snr,
+# its length field is used to skip newer and longer headers.
+#
+# hex: text with one frame per line, optionally preceded by its timestamp,
+# e.g. print output of the example scripts. # starts a comment.
+#
+# records are CaptureRecord(timestamp, frame, freq, sf, rssi, snr), frame is a
+# memoryview into the mapped file that is only valid until the generator moves
+# on. decode_capture() feeds them through a BatchDecoder in chunks and
+# CaptureSummary counts frames, mic failures and frame counter gaps per
+# devaddr.
+#
+import mmap
+import struct
+from collections import namedtuple
+from .BatchDecoder import BatchDecoder
+from .Direction import Direction
+from .FCntTracker import FCntTracker
+
+CaptureRecord = namedtuple('CaptureRecord', ['timestamp', 'frame', 'freq', 'sf', 'rssi', 'snr'])
+
+LOG_MAGIC = b'LORALOG\x01'
+LOG_RECORD = struct.Struct('<dH')
+
+JOURNAL_MAGIC = b'LORAJNL\x01'
+JOURNAL_RECORD = struct.Struct('<dIBhhH')
+
+PCAP_LORATAP = 270
+PCAP_HEADER = struct.Struct('IHHiIII')
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6), b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9), b'\xa1\xb2\x3c\x4d': ('>', 1e-9)
+}
+LORATAP = struct.Struct('>BBHIBBBBBBB')     # version, padding, length, freq, bw, sf, rssi x3, snr, sync word
+
+class LogWriter:
+
+    def __init__(self, f):
+        self.f = f
+        if f.tell() == 0:
+            f.write(LOG_MAGIC)
+
+    def write(self, frame, timestamp = 0.0):
+        self.f.write(LOG_RECORD.pack(timestamp, len(frame)))
+        self.f.write(frame)
+
+class PcapWriter:
+
+    def __init__(self, f):
+        self.f = f
+        if f.tell() == 0:
+            f.write(b'\xd4\xc3\xb2\xa1' + struct.pack('<HHiIII', 2, 4, 0, 0, 65535, PCAP_LORATAP))
+
+    def write(self, frame, timestamp = 0.0, freq = 868.1, sf = 7, bw = 125, rssi = None, snr = None, sync_word = 0x34):
+        header = LORATAP.pack(0, 0, LORATAP.size, int(round(freq * 1e6)), bw // 125, sf,
+                              0 if rssi is None else max(0, min(255, int(round(rssi)) + 139)), 0, 0,
+                              0 if snr is None else int(round(snr * 4)) & 0xFF, sync_word)
+        seconds, micros = divmod(int(round(timestamp * 1e6)), 1000000)
+        length = LORATAP.size + len(frame)
+        self.f.write(struct.pack('<IIII', seconds, micros, length, length))
+        self.f.write(header)
+        self.f.write(frame)
+
+def open_mmap(path):
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return memoryview(b'')          # empty file
+    if hasattr(data, 'madvise'):
+        data.madvise(mmap.MADV_SEQUENTIAL)
+    return memoryview(data)
+
+def read_log(view):
+    if bytes(view[:8]) != LOG_MAGIC:
+        raise ValueError("Not a capture log")
+    offset = 8
+    end = len(view)
+    unpack_from = LOG_RECORD.unpack_from
+    size = LOG_RECORD.size
+    while offset + size <= end:
+        timestamp, length = unpack_from(view, offset)
+        offset += size
+        if offset + length > end:
+            break                           # truncated last record
+        yield CaptureRecord(timestamp, view[offset:offset + length], None, None, None, None)
+        offset += length
+
+def read_journal(view, offset = 8, end = None):
+    if bytes(view[:8]) != JOURNAL_MAGIC:
+        raise ValueError("Not a journal")
+    end = len(view) if end is None else end
+    unpack_from = JOURNAL_RECORD.unpack_from
+    size = JOURNAL_RECORD.size
+    while offset + size <= end:
+        timestamp, freq, sf, rssi, snr, length = unpack_from(view, offset)
+        offset += size
+        if offset + length > end:
+            break
+        yield CaptureRecord(timestamp, view[offset:offset + length], freq / 1e6, sf, rssi, snr / 4.)
+        offset += length
+
+def read_pcap(view):
+    fmt = PCAP_MAGIC.get(bytes(view[:4]))
+    if fmt is None:
+        raise ValueError("Not a pcap file")
+    order, resolution = fmt
+    header = struct.Struct(order + PCAP_HEADER.format)
+    linktype = header.unpack_from(view, 0)[6] & 0x0FFFFFFF
+    if linktype != PCAP_LORATAP:
+        raise ValueError("Unsupported pcap link type %d" % linktype)
+    record = struct.Struct(order + 'IIII')
+    offset = header.size
+    end = len(view)
+    while offset + record.size <= end:
+        seconds, fraction, length, original = record.unpack_from(view, offset)
+        offset += record.size
+        if offset + length > end:
+            break
+        if length >= LORATAP.size:
+            version, padding, tap_length, freq, bw, sf, rssi, max_rssi, current_rssi, snr, sync_word = \
+                LORATAP.unpack_from(view, offset)
+            if version == 0 and LORATAP.size <= tap_length <= length:
+                yield CaptureRecord(seconds + fraction * resolution, view[offset + tap_length:offset + length],
+                                    freq / 1e6, sf, rssi - 139, (snr - 256 if snr > 127 else snr) / 4.)
+        offset += length
+
+def read_hex(path):
+    with open(path) as f:
+        for line in f:
+            fields = line.split('#', 1)[0].replace(',', ' ').split()
+            if not fields:
+                continue
+            try:
+                frame = bytes.fromhex(fields[-1])
+                timestamp = float(fields[0]) if len(fields) > 1 else 0.0
+            except ValueError:
+                continue
+            yield CaptureRecord(timestamp, frame, None, None, None, None)
+
+def read_capture(path):
+    view = open_mmap(path)
+    if not len(view):
+        return iter(())
+    if bytes(view[:8]) == LOG_MAGIC:
+        return read_log(view)
+    if bytes(view[:8]) == JOURNAL_MAGIC:
+        return read_journal(view)
+    if bytes(view[:4]) in PCAP_MAGIC:
+        return read_pcap(view)
+    return read_hex(path)
+
+def decode_capture(records, key_lookup, batch = 4096):
+    # yields (record, DecodedFrame). frames are copied out of the map per chunk
+    decoder = BatchDecoder(key_lookup)
+    chunk = []
+    for record in records:
+        chunk.append(record._replace(frame=bytes(record.frame)))
+        if len(chunk) >= batch:
+            yield from zip(chunk, decoder.decode([record.frame for record in chunk]))
+            chunk = []
+    if chunk:
+        yield from zip(chunk, decoder.decode([record.frame for record in chunk]))
+
+class CaptureSummary:
+
+    # per (devaddr, direction): frames, bytes, mic failures, repeated fcnts,
+    # missing fcnts, counter resets, first and last timestamp, last fcnt
+    FRAMES, BYTES, MIC_FAILURES, REPEATS, GAPS, RESETS, FIRST, LAST, FCNT = range(9)
+
+    def __init__(self):
+        self.devices = {}
+        self.frames = 0
+        self.errors = {}
+
+    def add(self, record, frame):
+        self.frames += 1
+        if frame.error != BatchDecoder.OK:
+            self.errors[frame.error] = self.errors.get(frame.error, 0) + 1
+        if frame.devaddr is None:
+            return
+        key = (frame.devaddr, Direction.DIRECTION[frame.mtype])
+        device = self.devices.get(key)
+        if device is None:
+            device = self.devices[key] = [0, 0, 0, 0, 0, 0, record.timestamp, record.timestamp, None]
+        device[self.FRAMES] += 1
+        device[self.BYTES] += len(record.frame)
+        device[self.LAST] = record.timestamp
+        if frame.error == BatchDecoder.INVALID_MIC:
+            device[self.MIC_FAILURES] += 1
+            return
+        fcnt = frame.fcnt & 0xFFFF
+        last = device[self.FCNT]
+        if last is not None:
+            delta = (fcnt - last) & 0xFFFF
+            if delta == 0:
+                device[self.REPEATS] += 1
+            elif delta > FCntTracker.MAX_FCNT_GAP:
+                device[self.RESETS] += 1
+            else:
+                device[self.GAPS] += delta - 1
+        device[self.FCNT] = fcnt
+
+    def report(self):
+        devices = {}
+        for (devaddr, direction), device in sorted(self.devices.items()):
+            devices['%s/%s' % (devaddr.hex(), 'up' if direction == Direction.UP else 'down')] = dict(
+                    frames       = device[self.FRAMES],
+                    bytes        = device[self.BYTES],
+                    mic_failures = device[self.MIC_FAILURES],
+                    repeats      = device[self.REPEATS],
+                    fcnt_gaps    = device[self.GAPS],
+                    fcnt_resets  = device[self.RESETS],
+                    first        = device[self.FIRST],
+                    last         = device[self.LAST]
+                )
+        return dict(frames=self.frames, errors=self.errors, devices=devices)
@@ -1,19 +1,19 @@
 #
 # frm_payload: data(0..N)
 #
-from .AES_CMAC import AES_CMAC
-from Crypto.Cipher import AES
-import math
+from .AES_CMAC import cmac_cache
 
 class DataPayload:
 
+    __slots__ = ('mac_payload', 'payload')
+
     def read(self, mac_payload, payload):
         self.mac_payload = mac_payload
         self.payload = payload
 
     def create(self, mac_payload, key, args):
         self.mac_payload = mac_payload
-        self.set_payload(key, 0x00, args['data'])
+        self.set_payload(key, 0x00, args.get('data', b''))
 
     def length(self):
         return len(self.payload)
@@ -25,74 +25,42 @@ class DataPayload:
         self.payload = self.encrypt_payload(key, direction, data)
 
     def compute_mic(self, key, direction, mhdr):
-        mic = [0x49]
-        mic += [0x00, 0x00, 0x00, 0x00]
-        mic += [direction]
-        mic += self.mac_payload.get_fhdr().get_devaddr()
-        mic += self.mac_payload.get_fhdr().get_fcnt()
-        mic += [0x00]
-        mic += [0x00]
-        mic += [0x00]
-        mic += [1 + self.mac_payload.length()]
-        mic += [mhdr.to_raw()]
-        mic += self.mac_payload.to_raw()
-
-        cmac = AES_CMAC()
-        computed_mic = cmac.encode(bytes(key), bytes(mic))[:4]
-        return list(map(int, computed_mic))
+        fhdr = self.mac_payload.get_fhdr()
+        mac_payload = self.mac_payload.to_raw()
+        mic = b''.join((
+            b'\x49\x00\x00\x00\x00',
+            bytes((direction,)),
+            fhdr.devaddr,
+            fhdr.fcnt32_to_raw(),
+            b'\x00',
+            bytes((1 + len(mac_payload), mhdr.to_raw())),
+            mac_payload))
+
+        return cmac_cache.get(key).mac(mic)[:4]
 
     def decrypt_payload(self, key, direction, mic):
-        k = int(math.ceil(len(self.payload) / 16.0))
-
-        a = []
-        for i in range(k):
-            a += [0x01]
-            a += [0x00, 0x00, 0x00, 0x00]
-            a += [direction]
-            a += self.mac_payload.get_fhdr().get_devaddr()
-            a += self.mac_payload.get_fhdr().get_fcnt()
-            a += [0x00] # fcnt 32bit
-            a += [0x00] # fcnt 32bit
-            a += [0x00]
-            a += [i+1]
-
-        cipher = AES.new(bytes(key))
-        s = cipher.encrypt(bytes(a))
-
-        padded_payload = []
-        for i in range(k):
-            idx = (i + 1) * 16
-            padded_payload += (self.payload[idx - 16:idx] + ([0x00] * 16))[:16]
-
-        payload = []
-        for i in range(len(self.payload)):
-            payload += [s[i] ^ padded_payload[i]]
-        return list(map(int, payload))
+        return self.cipher_payload(key, direction, self.payload)
 
     def encrypt_payload(self, key, direction, data):
-        k = int(math.ceil(len(data) / 16.0))
-
-        a = []
-        for i in range(k):
-            a += [0x01]
-            a += [0x00, 0x00, 0x00, 0x00]
-            a += [direction]
-            a += self.mac_payload.get_fhdr().get_devaddr()
-            a += self.mac_payload.get_fhdr().get_fcnt()
-            a += [0x00] # fcnt 32bit
-            a += [0x00] # fcnt 32bit
-            a += [0x00]
-            a += [i+1]
-
-        cipher = AES.new(bytes(key))
-        s = cipher.encrypt(bytes(a))
-
-        padded_payload = []
-        for i in range(k):
-            idx = (i + 1) * 16
-            padded_payload += (data[idx - 16:idx] + ([0x00] * 16))[:16]
-
-        payload = []
-        for i in range(len(data)):
-            payload += [s[i] ^ padded_payload[i]]
-        return list(map(int, payload))
+        return self.cipher_payload(key, direction, bytes(data))
+
+    def cipher_payload(self, key, direction, data):
+        n = len(data)
+        if n == 0:
+            return b''
+        fhdr = self.mac_payload.get_fhdr()
+        a = self.counter_blocks(direction, fhdr.devaddr, fhdr.fcnt32_to_raw(), (n + 15) >> 4)
+
+        s = cmac_cache.get_cipher(key).encrypt(a)
+        return (int.from_bytes(data, 'big') ^ int.from_bytes(s[:n], 'big')).to_bytes(n, 'big')
+
+    @staticmethod
+    def counter_blocks(direction, devaddr, fcnt, k):
+        a = bytearray(b''.join((
+            b'\x01\x00\x00\x00\x00',
+            bytes((direction,)),
+            devaddr,
+            fcnt,
+            b'\x00\x00'))) * k
+        a[15::16] = bytes(range(1, k + 1))
+        return a
@@ -0,0 +1,115 @@
+#
+# drops the extra copies of an uplink heard by several gateways, so only the
+# first copy is decoded. copies are matched on devaddr, fcnt and mic for data
+# frames and on the whole frame otherwise. the entry of a frame keeps the
+# metadata of its best copy (highest rssi, then snr) and the list of gateways
+# that heard it.
+#
+# the index is a row of dicts, each covering window / buckets seconds of first
+# arrivals. a bucket is dropped once all its entries are older than the
+# window, so memory stays proportional to the traffic of one window. copies
+# arriving up to one bucket width after the window can still be matched, they
+# are counted as late instead of being decoded again.
+#
+# ready() hands out the entries whose window has closed, in arrival order.
+#
+import time
+from collections import deque
+from .MHDR import MHDR
+
+class DedupEntry:
+
+    __slots__ = ('key', 'frame', 'first_seen', 'gateway', 'rssi', 'snr', 'meta', 'gateways', 'copies', 'result')
+
+    def __init__(self, key, frame, first_seen, gateway, rssi, snr, meta):
+        self.key = key
+        self.frame = frame
+        self.first_seen = first_seen
+        self.gateway = gateway
+        self.rssi = rssi
+        self.snr = snr
+        self.meta = meta
+        self.gateways = [gateway]
+        self.copies = 1
+        self.result = None
+
+    def add(self, gateway, rssi, snr, meta):
+        self.copies += 1
+        if gateway not in self.gateways:
+            self.gateways.append(gateway)
+        if (rssi, snr) > (self.rssi, self.snr):
+            self.gateway = gateway
+            self.rssi = rssi
+            self.snr = snr
+            self.meta = meta
+
+class Deduplicator:
+
+    DATA_TYPES = (MHDR.UNCONF_DATA_UP, MHDR.UNCONF_DATA_DOWN, MHDR.CONF_DATA_UP, MHDR.CONF_DATA_DOWN)
+
+    def __init__(self, window = 0.2, buckets = 4, clock = time.monotonic):
+        self.window = window
+        self.width = window / buckets
+        self.clock = clock
+        self.buckets = deque()
+        self.pending = deque()
+        self.frames = 0
+        self.duplicates = 0
+        self.late = 0
+
+    def __len__(self):
+        return sum(len(entries) for start, entries in self.buckets)
+
+    @classmethod
+    def key(cls, frame):
+        if len(frame) >= 12 and frame[0] & MHDR.MHDR_TYPE in cls.DATA_TYPES:
+            return bytes(frame[1:5]) + bytes(frame[6:8]) + bytes(frame[-4:])
+        return bytes(frame)
+
+    def expire(self, now):
+        buckets = self.buckets
+        while buckets and buckets[0][0] + self.width + self.window <= now:
+            buckets.popleft()
+
+    # returns (entry, True) for the first copy of a frame, (entry, False) for the others
+    def add(self, frame, gateway, rssi = None, snr = None, meta = None, now = None):
+        if now is None:
+            now = self.clock()
+        rssi = float('-inf') if rssi is None else rssi
+        snr = float('-inf') if snr is None else snr
+        self.expire(now)
+        key = self.key(frame)
+        for start, entries in self.buckets:
+            entry = entries.get(key)
+            if entry is not None:
+                entry.add(gateway, rssi, snr, meta)
+                self.duplicates += 1
+                if entry.first_seen + self.window <= now:
+                    self.late += 1
+                return entry, False
+
+        start = now - now % self.width
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append((start, {}))
+        entry = DedupEntry(key, frame, now, gateway, rssi, snr, meta)
+        self.buckets[-1][1][key] = entry
+        self.pending.append(entry)
+        self.frames += 1
+        return entry, True
+
+    def next_deadline(self):
+        return self.pending[0].first_seen + self.window if self.pending else None
+
+    def ready(self, now = None):
+        if now is None:
+            now = self.clock()
+        self.expire(now)
+        entries = []
+        pending = self.pending
+        while pending and pending[0].first_seen + self.window <= now:
+            entries.append(pending.popleft())
+        return entries
+
+    def stats(self):
+        return dict(frames=self.frames, duplicates=self.duplicates, late=self.late, indexed=len(self),
+                    buckets=len(self.buckets))
@@ -2,6 +2,8 @@ from .MHDR import MHDR
 
 class Direction:
 
+    __slots__ = ('direction',)
+
     UP = 0x00
     DOWN = 0x01
     DIRECTION = {
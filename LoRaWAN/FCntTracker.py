@@ -0,0 +1,58 @@
+#
+# 32 bit frame counters per session slot and direction, kept in flat arrays.
+# -1 marks a counter that has not seen a frame yet.
+#
+from array import array
+from .Direction import Direction
+
+class FCntTracker:
+
+    MAX_FCNT_GAP = 16384
+
+    def __init__(self):
+        self.counters = {Direction.UP: array('q'), Direction.DOWN: array('q')}
+        self.free = []
+
+    def allocate(self):
+        if self.free:
+            slot = self.free.pop()
+            self.reset(slot)
+            return slot
+        for counters in self.counters.values():
+            counters.append(-1)
+        return len(self.counters[Direction.UP]) - 1
+
+    def release(self, slot):
+        self.free.append(slot)
+
+    def reset(self, slot):
+        for counters in self.counters.values():
+            counters[slot] = -1
+
+    def get(self, slot, direction):
+        return self.counters[direction][slot]
+
+    def set(self, slot, direction, fcnt):
+        self.counters[direction][slot] = fcnt
+
+    # 32 bit counter of a 16 bit wire value. up to MAX_FCNT_GAP ahead of the last counter it counts on from there,
+    # across a rollover of the low half. any other value keeps the upper half of the last counter, so a replay or
+    # a jump too far ahead fails check() before any mic is computed with it
+    def reconstruct(self, slot, direction, fcnt):
+        last = self.counters[direction][slot]
+        if last < 0:
+            return fcnt
+        delta = (fcnt - last) & 0xFFFF
+        if 0 < delta <= self.MAX_FCNT_GAP:
+            return (last + delta) & 0xFFFFFFFF
+        return (last & ~0xFFFF) | fcnt
+
+    def check(self, slot, direction, fcnt):
+        last = self.counters[direction][slot]
+        return last < 0 or last < fcnt <= last + self.MAX_FCNT_GAP
+
+    def accept(self, slot, direction, fcnt):
+        if not self.check(slot, direction, fcnt):
+            return False
+        self.counters[direction][slot] = fcnt
+        return True
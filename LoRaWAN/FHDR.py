@@ -7,44 +7,42 @@ from .MHDR import MHDR
 
 class FHDR:
 
+    __slots__ = ('devaddr', 'fctrl', 'fcnt', 'fcnt_msb', 'fopts')
+
     def read(self, mac_payload):
         if len(mac_payload) < 7:
             raise MalformedPacketException("Invalid fhdr")
 
-        self.devaddr = mac_payload[:4]
+        self.devaddr = bytes(mac_payload[:4])
         self.fctrl = mac_payload[4]
-        self.fcnt = mac_payload[5:7]
-        self.fopts = mac_payload[7:7 + (self.fctrl & 0xf)]
-    
+        self.fcnt = bytes(mac_payload[5:7])
+        self.fcnt_msb = 0
+        self.fopts = bytes(mac_payload[7:7 + (self.fctrl & 0xf)])
+        if len(self.fopts) != self.fctrl & 0xf:
+            raise MalformedPacketException("Invalid fhdr")
+
     def create(self, mtype, args):
-        self.devaddr = [0x00, 0x00, 0x00, 0x00]
-        self.fctrl = 0x00
-        if 'fcnt' in args:
-            self.fcnt = args['fcnt'].to_bytes(2, byteorder='little')
-        else:
-            self.fcnt = [0x00, 0x00]
-        self.fopts = []
+        self.devaddr = b'\x00\x00\x00\x00'
+        self.fopts = bytes(args.get('fopts', b''))
+        if len(self.fopts) > 0xf:
+            raise MalformedPacketException("Invalid fopts")
+        self.fctrl = (args.get('fctrl', 0x00) & 0xf0) | len(self.fopts)
+        self.set_fcnt32(args.get('fcnt', 0))
         if mtype == MHDR.UNCONF_DATA_UP or mtype == MHDR.UNCONF_DATA_DOWN or\
                 mtype == MHDR.CONF_DATA_UP or mtype == MHDR.CONF_DATA_DOWN:
-            self.devaddr = list(reversed(args['devaddr']))
+            self.devaddr = bytes(reversed(args['devaddr']))
 
     def length(self):
         return 4 + 1 + 2 + (self.fctrl & 0xf)
 
     def to_raw(self):
-        fhdr = []
-        fhdr += self.devaddr
-        fhdr += [self.fctrl]
-        fhdr += self.fcnt
-        if self.fopts:
-            fhdr += self.fopts
-        return fhdr
+        return b''.join((self.devaddr, bytes((self.fctrl,)), self.fcnt, self.fopts))
 
     def get_devaddr(self):
         return self.devaddr
 
     def set_devaddr(self, devaddr):
-        self.devaddr = devaddr
+        self.devaddr = bytes(devaddr)
 
     def get_fctrl(self):
         return self.fctrl
@@ -56,10 +54,26 @@ class FHDR:
         return self.fcnt
 
     def set_fcnt(self, fcnt):
-        self.fcnt = fcnt
+        self.fcnt = bytes(fcnt)
+
+    def get_fcnt_msb(self):
+        return self.fcnt_msb
+
+    def set_fcnt_msb(self, fcnt_msb):
+        self.fcnt_msb = fcnt_msb
+
+    def get_fcnt32(self):
+        return (self.fcnt_msb << 16) | self.fcnt[0] | (self.fcnt[1] << 8)
+
+    def set_fcnt32(self, fcnt):
+        self.fcnt = (fcnt & 0xFFFF).to_bytes(2, byteorder='little')
+        self.fcnt_msb = (fcnt >> 16) & 0xFFFF
+
+    def fcnt32_to_raw(self):
+        return b''.join((self.fcnt, self.fcnt_msb.to_bytes(2, byteorder='little')))
 
     def get_fopts(self):
         return self.fopts
 
     def set_fopts(self, fopts):
-        self.fopts = fopts
+        self.fopts = bytes(fopts)
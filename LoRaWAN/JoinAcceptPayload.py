@@ -2,18 +2,28 @@
 # frm_payload: appnonce(3) netid(3) devaddr(4) dlsettings(1) rxdelay(1) cflist(0..16)
 #
 from .MalformedPacketException import MalformedPacketException
-from .AES_CMAC import AES_CMAC
-from Crypto.Cipher import AES
+from .AES_CMAC import cmac_cache
+from .MHDR import MHDR
+from .Direction import Direction
 
 class JoinAcceptPayload:
 
+    __slots__ = ('encrypted_payload', 'payload', 'appnonce', 'netid', 'devaddr', 'dlsettings', 'rxdelay', 'cflist')
+
     def read(self, payload):
-        if len(payload) < 12:
+        if len(payload) != 12 and len(payload) != 28:
             raise MalformedPacketException("Invalid join accept");
         self.encrypted_payload = payload
 
-    def create(self, args):
-        pass
+    def create(self, key, args):
+        self.appnonce = bytes(args['appnonce'])
+        self.netid = bytes(reversed(args['netid']))
+        self.devaddr = bytes(reversed(args['devaddr']))
+        self.dlsettings = args.get('dlsettings', 0x00)
+        self.rxdelay = args.get('rxdelay', 0x01)
+        self.cflist = bytes(args['cflist']) if args.get('cflist') else None
+        self.payload = b''.join((self.appnonce, self.netid, self.devaddr, bytes((self.dlsettings, self.rxdelay)), self.cflist or b''))
+        self.encrypted_payload = self.encrypt_payload(key, Direction.DOWN, MHDR(MHDR.JOIN_ACCEPT))[:-4]
 
     def length(self):
         return len(self.encrypted_payload)
@@ -31,7 +41,7 @@ class JoinAcceptPayload:
         return self.netid
 
     def get_devaddr(self):
-        return list(map(int, reversed(self.devaddr)))
+        return bytes(reversed(self.devaddr))
 
     def get_dlsettings(self):
         return self.dlsettings
@@ -43,21 +53,15 @@ class JoinAcceptPayload:
         return self.cflist
 
     def compute_mic(self, key, direction, mhdr):
-        mic = []
-        mic += [mhdr.to_raw()]
-        mic += self.to_clear_raw()
+        mic = bytes((mhdr.to_raw(),)) + self.to_clear_raw()
 
-        cmac = AES_CMAC()
-        computed_mic = cmac.encode(bytes(key), bytes(mic))[:4]
-        return list(map(int, computed_mic))
+        return cmac_cache.get(key).mac(mic)[:4]
 
     def decrypt_payload(self, key, direction, mic):
-        a = []
-        a += self.encrypted_payload
-        a += mic
+        a = b''.join((self.encrypted_payload, mic))
 
-        cipher = AES.new(bytes(key))
-        self.payload = cipher.encrypt(bytes(a))[:-4]
+        cipher = cmac_cache.get_cipher(key)
+        self.payload = cipher.encrypt(a)[:-4]
 
         self.appnonce = self.payload[:3]
         self.netid = self.payload[3:6]
@@ -68,32 +72,32 @@ class JoinAcceptPayload:
         if self.payload[12:]:
             self.cflist = self.payload[12:]
 
-        return list(map(int, self.payload))
+        return self.payload
 
     def encrypt_payload(self, key, direction, mhdr):
-        a = []
-        a += self.to_clear_raw()
-        a += self.compute_mic(key, direction, mhdr)
+        a = self.to_clear_raw() + self.compute_mic(key, direction, mhdr)
 
-        cipher = AES.new(bytes(key))
-        return list(map(int, cipher.decrypt(bytes(a))))
+        cipher = cmac_cache.get_cipher(key)
+        return cipher.decrypt(a)
 
     def derive_nwskey(self, key, devnonce):
-        a = [0x01]
-        a += self.get_appnonce()
-        a += self.get_netid()
-        a += devnonce
-        a += [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
-
-        cipher = AES.new(bytes(key))
-        return list(map(int, cipher.encrypt(bytes(a))))
+        return self.derive_skey(0x01, key, devnonce)
 
     def derive_appskey(self, key, devnonce):
-        a = [0x02]
-        a += self.get_appnonce()
-        a += self.get_netid()
-        a += devnonce
-        a += [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]
-
-        cipher = AES.new(bytes(key))
-        return list(map(int, cipher.encrypt(bytes(a))))
+        return self.derive_skey(0x02, key, devnonce)
+
+    def derive_skeys(self, key, devnonce):
+        a = self.derive_block(0x01, devnonce) + self.derive_block(0x02, devnonce)
+
+        cipher = cmac_cache.get_cipher(key)
+        s = cipher.encrypt(a)
+        return s[:16], s[16:]
+
+    def derive_block(self, prefix, devnonce):
+        return b''.join((bytes((prefix,)), self.get_appnonce(), self.get_netid(), bytes(devnonce), b'\x00' * 7))
+
+    def derive_skey(self, prefix, key, devnonce):
+        a = self.derive_block(prefix, devnonce)
+
+        cipher = cmac_cache.get_cipher(key)
+        return cipher.encrypt(a)
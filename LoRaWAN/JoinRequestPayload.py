@@ -2,11 +2,12 @@
 # frm_payload: appeui(8) deveui(8) devnonce(2)
 #
 from .MalformedPacketException import MalformedPacketException
-from .AES_CMAC import AES_CMAC
-from Crypto.Cipher import AES
+from .AES_CMAC import cmac_cache
 
 class JoinRequestPayload:
 
+    __slots__ = ('appeui', 'deveui', 'devnonce')
+
     def read(self, payload):
         if len(payload) != 18:
             raise MalformedPacketException("Invalid join request");
@@ -15,19 +16,15 @@ class JoinRequestPayload:
         self.devnonce = payload[16:18]
 
     def create(self, args):
-        self.deveui = list(reversed(args['deveui']))
-        self.appeui = list(reversed(args['appeui']))
-        self.devnonce = args['devnonce']
+        self.deveui = bytes(reversed(args['deveui']))
+        self.appeui = bytes(reversed(args['appeui']))
+        self.devnonce = bytes(args['devnonce'])
 
     def length(self):
         return 18
 
     def to_raw(self):
-        payload = []
-        payload += self.appeui
-        payload += self.deveui
-        payload += self.devnonce
-        return payload
+        return b''.join((self.appeui, self.deveui, self.devnonce))
 
     def get_appeui(self):
         return self.appeui
@@ -39,12 +36,9 @@ class JoinRequestPayload:
         return self.devnonce
 
     def compute_mic(self, key, direction, mhdr):
-        mic = [mhdr.to_raw()]
-        mic += self.to_raw()
+        mic = bytes((mhdr.to_raw(),)) + self.to_raw()
 
-        cmac = AES_CMAC()
-        computed_mic = cmac.encode(bytes(key), bytes(mic))[:4]
-        return list(map(int, computed_mic))
+        return cmac_cache.get(key).mac(mic)[:4]
 
     def decrypt_payload(self, key, direction, mic):
         return self.to_raw()
@@ -0,0 +1,89 @@
+#
+# otaa join server: checks join requests against the appkeys, rejects reused
+# devnonces, hands out devaddrs inside the netid's nwkid and answers with an
+# encrypted join accept. the new session goes into the session store, the
+# used devnonces and the appnonce counter are kept by the store as well.
+#
+# deveuis and netid are msb first, devaddr = nwkid(7) nwkaddr(25).
+#
+from .MalformedPacketException import MalformedPacketException
+from .MHDR import MHDR
+from .PhyPayload import PhyPayload
+from .Session import Session
+
+class JoinServer:
+
+    def __init__(self, netid, store, appkeys = None, dlsettings = 0x00, rxdelay = 0x01, cflist = None):
+        self.netid = bytes(netid)
+        self.store = store
+        self.appkeys = appkeys if appkeys is not None else {}
+        self.dlsettings = dlsettings
+        self.rxdelay = rxdelay
+        self.cflist = cflist
+        self.nwkid = self.netid[-1] & 0x7F
+        self.nwkaddr = 0
+
+    def add_device(self, deveui, appkey):
+        self.appkeys[bytes(deveui)] = bytes(appkey)
+
+    def remove_device(self, deveui):
+        self.appkeys.pop(bytes(deveui), None)
+        self.store.forget_devnonces(deveui)
+
+    def allocate_devaddr(self):
+        for i in range(1 << 25):
+            self.nwkaddr = (self.nwkaddr + 1) & 0x1FFFFFF
+            devaddr = ((self.nwkid << 25) | self.nwkaddr).to_bytes(4, 'big')
+            if not self.store.lookup(devaddr):
+                return devaddr
+        raise RuntimeError("No free devaddr left")
+
+    def next_appnonce(self):
+        return self.store.next_appnonce().to_bytes(3, 'little')
+
+    def join(self, packet):
+        join_request = PhyPayload([], [])
+        join_request.read(packet)
+        if join_request.get_mhdr().get_mtype() != MHDR.JOIN_REQUEST:
+            raise MalformedPacketException("Not a join request")
+
+        frm_payload = join_request.get_mac_payload().get_frm_payload()
+        deveui = bytes(reversed(frm_payload.get_deveui()))
+        appkey = self.appkeys.get(deveui)
+        if appkey is None:
+            raise MalformedPacketException("Unknown deveui")
+        join_request.nwkey = appkey
+        if not join_request.valid_mic():
+            raise MalformedPacketException("Invalid mic")
+
+        devnonce = frm_payload.get_devnonce()
+        nonce = devnonce[0] | devnonce[1] << 8
+        if not self.store.use_devnonce(deveui, nonce):
+            raise MalformedPacketException("Reused devnonce")
+
+        join_accept = PhyPayload([], appkey)
+        join_accept.create(MHDR.JOIN_ACCEPT, {
+            'appnonce': self.next_appnonce(),
+            'netid': self.netid,
+            'devaddr': self.allocate_devaddr(),
+            'dlsettings': self.dlsettings,
+            'rxdelay': self.rxdelay,
+            'cflist': self.cflist})
+        accept = join_accept.get_mac_payload().get_frm_payload()
+        nwskey, appskey = accept.derive_skeys(appkey, devnonce)
+        session = self.store.add(Session(bytes(reversed(accept.devaddr)), nwskey, appskey, deveui))
+        return join_accept.to_raw(), session
+
+    def join_batch(self, packets):
+        results = []
+        for packet in packets:
+            try:
+                results.append(self.join(packet))
+            except MalformedPacketException:
+                results.append(None)
+        return results
+
+    @staticmethod
+    def encode_cflist(frequencies):
+        cflist = b''.join(int(round(f * 1e4)).to_bytes(3, 'little') for f in frequencies[:5])
+        return cflist + b'\x00' * (16 - len(cflist))
@@ -0,0 +1,200 @@
+#
+# append-only journal of received frames with their radio metadata, in the
+# journal format of Capture.py. append() only packs the record into a buffer,
+# the buffer is written as one block once it is full or flush_interval has
+# passed, and fsync'd every fsync_interval. a background thread makes sure
+# both happen while no frames arrive.
+#
+# every written block gets an entry in the index file (path + '.idx'):
+#
+#   magic(8) then entries of first(8, double) last(8, double) offset(8)
+#   length(4) count(2) devaddr(4 * count, msb first)
+#
+# JournalReader bisects the index for a time range and only reads the blocks
+# that contain a devaddr. the index is written after its block, so a crash
+# in between leaves a block without an entry. such gaps between indexed
+# blocks, and a tail past the last one, are scanned record by record.
+#
+import bisect
+import os
+import struct
+import threading
+import time
+from .Capture import JOURNAL_MAGIC, JOURNAL_RECORD, open_mmap, read_journal
+from .MHDR import MHDR
+
+INDEX_MAGIC = b'LORAIDX\x01'
+INDEX_ENTRY = struct.Struct('<ddQIH')
+
+DATA_TYPES = (MHDR.UNCONF_DATA_UP, MHDR.UNCONF_DATA_DOWN, MHDR.CONF_DATA_UP, MHDR.CONF_DATA_DOWN)
+
+def frame_devaddr(frame):
+    if len(frame) >= 12 and frame[0] & MHDR.MHDR_TYPE in DATA_TYPES:
+        return bytes(frame[4:0:-1])
+    return None
+
+class Journal:
+
+    def __init__(self, path, buffer_size = 65536, flush_interval = 1.0, fsync_interval = 5.0, background = True):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.fd = self.open(path, JOURNAL_MAGIC)
+        self.index_fd = self.open(path + '.idx', INDEX_MAGIC)
+        self.offset = os.lseek(self.fd, 0, os.SEEK_END)
+        self.lock = threading.Lock()
+        self.buffer = bytearray()
+        self.first = None
+        self.last = None
+        self.devaddrs = set()
+        self.flushed = time.monotonic()
+        self.synced = self.flushed
+        self.dirty = False
+        self.records = 0
+        self.blocks = 0
+        self.fsyncs = 0
+        self.closed = threading.Event()
+        self.thread = None
+        if background:
+            self.thread = threading.Thread(target=self.run, name='journal', daemon=True)
+            self.thread.start()
+
+    @staticmethod
+    def open(path, magic):
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if os.lseek(fd, 0, os.SEEK_END) == 0:
+            os.write(fd, magic)
+        return fd
+
+    # timestamp is the wall clock time of reception, freq in mhz, rssi in dbm, snr in db
+    def append(self, frame, timestamp = None, freq = 0.0, sf = 0, rssi = 0, snr = 0.0):
+        if timestamp is None:
+            timestamp = time.time()
+        header = JOURNAL_RECORD.pack(timestamp, int(round(freq * 1e6)), sf, int(round(rssi)), int(round(snr * 4)),
+                                     len(frame))
+        devaddr = frame_devaddr(frame)
+        with self.lock:
+            self.buffer += header
+            self.buffer += frame
+            if self.first is None:
+                self.first = timestamp
+            self.last = timestamp
+            if devaddr is not None:
+                self.devaddrs.add(devaddr)
+            self.records += 1
+            if len(self.buffer) >= self.buffer_size or len(self.devaddrs) >= 0xFFFF:
+                self.write_block()
+
+    def write_block(self):
+        if not self.buffer:
+            return
+        os.write(self.fd, self.buffer)
+        entry = INDEX_ENTRY.pack(self.first, self.last, self.offset, len(self.buffer), len(self.devaddrs))
+        os.write(self.index_fd, entry + b''.join(sorted(self.devaddrs)))
+        self.offset += len(self.buffer)
+        self.buffer = bytearray()
+        self.first = None
+        self.devaddrs = set()
+        self.flushed = time.monotonic()
+        self.dirty = True
+        self.blocks += 1
+
+    def sync(self):
+        os.fsync(self.fd)
+        os.fsync(self.index_fd)
+        self.synced = time.monotonic()
+        self.dirty = False
+        self.fsyncs += 1
+
+    def flush(self, sync = False):
+        with self.lock:
+            self.write_block()
+            if sync and self.dirty:
+                self.sync()
+
+    def run(self):
+        interval = min(self.flush_interval, self.fsync_interval) / 2.
+        while not self.closed.wait(interval):
+            now = time.monotonic()
+            with self.lock:
+                if self.buffer and now - self.flushed >= self.flush_interval:
+                    self.write_block()
+                if self.dirty and now - self.synced >= self.fsync_interval:
+                    self.sync()
+
+    def close(self):
+        self.closed.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush(sync=True)
+        os.close(self.fd)
+        os.close(self.index_fd)
+
+    def stats(self):
+        return dict(records=self.records, blocks=self.blocks, fsyncs=self.fsyncs, bytes=self.offset + len(self.buffer))
+
+class JournalReader:
+
+    def __init__(self, path):
+        self.view = open_mmap(path)
+        if bytes(self.view[:8]) != JOURNAL_MAGIC:
+            raise ValueError("Not a journal")
+        self.blocks = []                    # (first, last, offset, length, devaddrs)
+        self.read_index(path + '.idx')
+        self.starts = [block[0] for block in self.blocks]
+        self.gaps = []                      # (offset, end) of blocks without an index entry
+        self.indexed = 8
+        for first, last, offset, length, devaddrs in self.blocks:
+            if offset > self.indexed:
+                self.gaps.append((self.indexed, offset))
+            self.indexed = offset + length
+
+    def read_index(self, path):
+        if not os.path.exists(path):
+            return
+        view = open_mmap(path)
+        if bytes(view[:8]) != INDEX_MAGIC:
+            return
+        offset = 8
+        end = len(view)
+        while offset + INDEX_ENTRY.size <= end:
+            first, last, block, length, count = INDEX_ENTRY.unpack_from(view, offset)
+            offset += INDEX_ENTRY.size
+            if offset + 4 * count > end or block + length > len(self.view):
+                break
+            devaddrs = frozenset(bytes(view[i:i + 4]) for i in range(offset, offset + 4 * count, 4))
+            offset += 4 * count
+            self.blocks.append((first, last, block, length, devaddrs))
+
+    # CaptureRecords received in [start, end), only those of devaddr (msb first) if given
+    def records(self, start = None, end = None, devaddr = None):
+        if devaddr is not None:
+            devaddr = bytes(devaddr)
+        # blocks are in append order, their first timestamps only go up as long as the clock does
+        i = 0 if start is None else max(bisect.bisect_right(self.starts, start) - 1, 0)
+        gaps = iter(self.gaps)
+        gap = next(gaps, None)
+        for first, last, offset, length, devaddrs in self.blocks[i:]:
+            # unindexed blocks before this one, their time range is unknown
+            while gap is not None and gap[0] < offset:
+                yield from self.filter(read_journal(self.view, gap[0], gap[1]), start, end, devaddr)
+                gap = next(gaps, None)
+            if end is not None and first >= end:
+                return
+            if start is not None and last < start or devaddr is not None and devaddr not in devaddrs:
+                continue
+            yield from self.filter(read_journal(self.view, offset, offset + length), start, end, devaddr)
+        yield from self.filter(read_journal(self.view, self.indexed), start, end, devaddr)
+
+    @staticmethod
+    def filter(records, start, end, devaddr):
+        for record in records:
+            if start is not None and record.timestamp < start or end is not None and record.timestamp >= end:
+                continue
+            if devaddr is not None and frame_devaddr(record.frame) != devaddr:
+                continue
+            yield record
+
+    def __iter__(self):
+        return self.records()
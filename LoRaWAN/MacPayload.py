@@ -10,13 +10,17 @@ from .DataPayload import DataPayload
 
 class MacPayload:
 
+    __slots__ = ('mtype', 'fhdr', 'fport', 'frm_payload')
+
+    DATA_TYPES = (MHDR.UNCONF_DATA_UP, MHDR.UNCONF_DATA_DOWN, MHDR.CONF_DATA_UP, MHDR.CONF_DATA_DOWN)
+
     def read(self, mtype, mac_payload):
         if len(mac_payload) < 1:
             raise MalformedPacketException("Invalid mac payload")
 
-        self.fhdr = FHDR()
-        self.fhdr.read(mac_payload)
-        self.fport = mac_payload[self.fhdr.length()]
+        self.mtype = mtype
+        self.fhdr = None
+        self.fport = None
         self.frm_payload = None
         if mtype == MHDR.JOIN_REQUEST:
             self.frm_payload = JoinRequestPayload()
@@ -24,24 +28,28 @@ class MacPayload:
         if mtype == MHDR.JOIN_ACCEPT:
             self.frm_payload = JoinAcceptPayload()
             self.frm_payload.read(mac_payload)
-        if mtype == MHDR.UNCONF_DATA_UP or mtype == MHDR.UNCONF_DATA_DOWN or\
-                mtype == MHDR.CONF_DATA_UP or mtype == MHDR.CONF_DATA_DOWN:
+        if mtype in self.DATA_TYPES:
+            self.fhdr = FHDR()
+            self.fhdr.read(mac_payload)
+            fhdr_length = self.fhdr.length()
+            if len(mac_payload) > fhdr_length:
+                self.fport = mac_payload[fhdr_length]
             self.frm_payload = DataPayload()
-            self.frm_payload.read(self, mac_payload[self.fhdr.length() + 1:])
+            self.frm_payload.read(self, mac_payload[fhdr_length + 1:])
 
     def create(self, mtype, key, args):
+        self.mtype = mtype
         self.fhdr = FHDR()
         self.fhdr.create(mtype, args)
-        self.fport = 0x01
+        self.fport = 0x01 if len(args.get('data', b'')) else None
         self.frm_payload = None
         if mtype == MHDR.JOIN_REQUEST:
             self.frm_payload = JoinRequestPayload()
             self.frm_payload.create(args)
         if mtype == MHDR.JOIN_ACCEPT:
             self.frm_payload = JoinAcceptPayload()
-            self.frm_payload.create(args)
-        if mtype == MHDR.UNCONF_DATA_UP or mtype == MHDR.UNCONF_DATA_DOWN or\
-                mtype == MHDR.CONF_DATA_UP or mtype == MHDR.CONF_DATA_DOWN:
+            self.frm_payload.create(key, args)
+        if mtype in self.DATA_TYPES:
             self.frm_payload = DataPayload()
             self.frm_payload.create(self, key, args)
 
@@ -49,14 +57,11 @@ class MacPayload:
         return len(self.to_raw())
 
     def to_raw(self):
-        mac_payload = []
-        if self.fhdr.get_devaddr() != [0x00, 0x00, 0x00, 0x00]:
-            mac_payload += self.fhdr.to_raw()
-        if self.frm_payload != None:
-            if self.fhdr.get_devaddr() != [0x00, 0x00, 0x00, 0x00]:
-                mac_payload += [self.fport]
-            mac_payload += self.frm_payload.to_raw()
-        return mac_payload
+        if self.mtype not in self.DATA_TYPES:
+            return self.frm_payload.to_raw() if self.frm_payload != None else b''
+        if self.fport == None:
+            return self.fhdr.to_raw()
+        return b''.join((self.fhdr.to_raw(), bytes((self.fport,)), self.frm_payload.to_raw()))
 
     def get_fhdr(self):
         return self.fhdr
@@ -0,0 +1,339 @@
+#
+# semtech udp packet forwarder protocol (v1 and v2), network server side:
+#
+#   PUSH_DATA  gw -> ns  ver(1) token(2) 0x00 gweui(8) json {"rxpk": [...], "stat": {...}}
+#   PUSH_ACK   ns -> gw  ver(1) token(2) 0x01
+#   PULL_DATA  gw -> ns  ver(1) token(2) 0x02 gweui(8)
+#   PULL_ACK   ns -> gw  ver(1) token(2) 0x04
+#   PULL_RESP  ns -> gw  ver(1) token(2) 0x03 json {"txpk": {...}}
+#   TX_ACK     gw -> ns  ver(1) token(2) 0x05 gweui(8) [json {"txpk_ack": {"error": ...}}]
+#
+# datagram_received() only acks and queues the datagram. run() takes the
+# queued datagrams in batches, parses the json, base64 decodes every rxpk with
+# a good or no crc and hands all frames of the batch to one BatchDecoder call.
+# the handler gets a list of Uplink(gateway, rxpk, payload, frame, gateways),
+# frame is the DecodedFrame. with a Deduplicator only the first copy of a
+# frame is decoded, the handler gets it once its window has closed with the
+# gateway and rxpk of the best copy and all gateways that heard it.
+#
+# send() and reply() queue a txpk on the address a gateway last sent
+# PULL_DATA from, the returned future resolves on its TX_ACK.
+#
+# FakeForwarder is the gateway side, for running the server without one.
+#
+import asyncio
+import binascii
+import json
+import time
+from collections import deque, namedtuple
+from .BatchDecoder import BatchDecoder
+
+Uplink = namedtuple('Uplink', ['gateway', 'rxpk', 'payload', 'frame', 'gateways'])
+
+PUSH_DATA = 0x00
+PUSH_ACK = 0x01
+PULL_DATA = 0x02
+PULL_RESP = 0x03
+PULL_ACK = 0x04
+TX_ACK = 0x05
+
+VERSIONS = (1, 2)
+
+class Gateway:
+
+    __slots__ = ('eui', 'addr', 'pull_addr', 'version', 'push_data', 'pull_data', 'rxpk', 'crc_errors', 'malformed',
+                 'duplicates', 'decoded', 'errors', 'tx_sent', 'tx_acked', 'tx_errors', 'last_seen', 'stat')
+
+    def __init__(self, eui):
+        self.eui = eui
+        self.addr = None
+        self.pull_addr = None
+        self.version = 2
+        self.push_data = 0
+        self.pull_data = 0
+        self.rxpk = 0
+        self.crc_errors = 0
+        self.malformed = 0
+        self.duplicates = 0
+        self.decoded = 0
+        self.errors = {}
+        self.tx_sent = 0
+        self.tx_acked = 0
+        self.tx_errors = 0
+        self.last_seen = None
+        self.stat = None
+
+    def stats(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__ if name != 'eui')
+
+class PacketForwarderServer(asyncio.DatagramProtocol):
+
+    def __init__(self, key_lookup, handler, batch = 256, queue_size = 4096, dedup = None):
+        self.decoder = BatchDecoder(key_lookup)
+        self.handler = handler
+        self.dedup = dedup
+        self.batch = batch
+        self.queue_size = queue_size
+        self.datagrams = deque()
+        self.ready = None
+        self.transport = None
+        self.gateways = {}
+        self.pending = {}
+        self.token = 0
+        self.received = 0
+        self.dropped = 0
+        self.invalid = 0
+
+    async def start(self, host = '0.0.0.0', port = 1700):
+        loop = asyncio.get_running_loop()
+        self.ready = asyncio.Event()
+        await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        return self.transport.get_extra_info('sockname')
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        for future, gateway in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def gateway(self, eui):
+        gateway = self.gateways.get(eui)
+        if gateway is None:
+            gateway = self.gateways[eui] = Gateway(eui)
+        return gateway
+
+    def datagram_received(self, data, addr):
+        if len(data) < 4 or data[0] not in VERSIONS:
+            self.invalid += 1
+            return
+        ident = data[3]
+        if ident == TX_ACK:
+            self.tx_ack(data)
+            return
+        if len(data) < 12 or ident not in (PUSH_DATA, PULL_DATA):
+            self.invalid += 1
+            return
+        gateway = self.gateway(bytes(data[4:12]))
+        gateway.version = data[0]
+        gateway.last_seen = time.monotonic()
+        if ident == PULL_DATA:
+            gateway.pull_data += 1
+            gateway.pull_addr = addr
+            self.transport.sendto(data[:3] + bytes((PULL_ACK,)), addr)
+            return
+
+        gateway.push_data += 1
+        gateway.addr = addr
+        self.transport.sendto(data[:3] + bytes((PUSH_ACK,)), addr)
+        self.received += 1
+        if len(self.datagrams) >= self.queue_size:
+            self.datagrams.popleft()
+            self.dropped += 1
+        self.datagrams.append((gateway, data))
+        if self.ready is not None:
+            self.ready.set()
+
+    def tx_ack(self, data):
+        entry = self.pending.pop(int.from_bytes(data[1:3], 'big'), None)
+        if entry is None:
+            return
+        future, gateway = entry
+        error = 'NONE'
+        if len(data) > 12:
+            try:
+                error = json.loads(data[12:].rstrip(b'\x00'))['txpk_ack'].get('error', 'NONE')
+            except (ValueError, KeyError, TypeError, AttributeError):
+                error = 'MALFORMED'
+        if error == 'NONE':
+            gateway.tx_acked += 1
+        else:
+            gateway.tx_errors += 1
+        if not future.done():
+            future.set_result(error)
+
+    async def run(self):
+        if self.ready is None:
+            self.ready = asyncio.Event()
+        dedup = self.dedup
+        while True:
+            if self.datagrams:
+                batch = [self.datagrams.popleft() for i in range(min(self.batch, len(self.datagrams)))]
+                uplinks = self.ingest(batch)
+            else:
+                self.ready.clear()
+                deadline = dedup.next_deadline() if dedup is not None else None
+                try:
+                    await asyncio.wait_for(self.ready.wait(), None if deadline is None else
+                                           max(deadline - dedup.clock(), 0))
+                except asyncio.TimeoutError:
+                    pass
+                uplinks = []
+            if dedup is not None:
+                uplinks = [Uplink(entry.gateway, entry.meta, entry.frame, entry.result, entry.gateways)
+                           for entry in dedup.ready()]
+            if uplinks:
+                result = self.handler(uplinks)
+                if asyncio.iscoroutine(result):
+                    await result
+
+    def ingest(self, datagrams):
+        received = []
+        frames = []
+        for gateway, data in datagrams:
+            try:
+                message = json.loads(data[12:])
+                rxpks = message.get('rxpk', ())
+                if 'stat' in message:
+                    gateway.stat = message['stat']
+            except (ValueError, AttributeError):
+                gateway.malformed += 1
+                continue
+            for rxpk in rxpks:
+                gateway.rxpk += 1
+                try:
+                    if rxpk.get('stat', 1) == -1:
+                        gateway.crc_errors += 1
+                        continue
+                    payload = binascii.a2b_base64(rxpk['data'])
+                except (binascii.Error, KeyError, TypeError, AttributeError):
+                    gateway.malformed += 1
+                    continue
+                entry = None
+                if self.dedup is not None:
+                    entry, first = self.dedup.add(payload, gateway.eui, rxpk.get('rssi'), rxpk.get('lsnr'), rxpk)
+                    if not first:
+                        gateway.duplicates += 1
+                        continue
+                received.append((gateway, rxpk, entry))
+                frames.append(payload)
+
+        uplinks = []
+        for (gateway, rxpk, entry), payload, frame in zip(received, frames, self.decoder.decode(frames)):
+            if frame.error == BatchDecoder.OK:
+                gateway.decoded += 1
+            else:
+                gateway.errors[frame.error] = gateway.errors.get(frame.error, 0) + 1
+            if entry is not None:
+                entry.result = frame
+            else:
+                uplinks.append(Uplink(gateway.eui, rxpk, payload, frame, [gateway.eui]))
+        return uplinks
+
+    @staticmethod
+    def txpk(payload, freq, datr, tmst = None, codr = '4/5', powe = 14, rfch = 0, ipol = True):
+        txpk = {'imme': tmst is None}
+        if tmst is not None:
+            txpk['tmst'] = tmst & 0xFFFFFFFF
+        txpk.update(freq=freq, rfch=rfch, powe=powe, modu='LORA', datr=datr, codr=codr, ipol=ipol,
+                    size=len(payload), data=binascii.b2a_base64(bytes(payload), newline=False).decode('ascii'))
+        return txpk
+
+    def send(self, gateway, payload, freq, datr, tmst = None, **kwargs):
+        gateway = self.gateways.get(bytes(gateway))
+        if gateway is None or gateway.pull_addr is None:
+            raise RuntimeError("Gateway has not sent PULL_DATA yet")
+        self.token = (self.token + 1) & 0xFFFF
+        message = json.dumps({'txpk': self.txpk(payload, freq, datr, tmst, **kwargs)}, separators=(',', ':'))
+        future = asyncio.get_running_loop().create_future()
+        if gateway.version == 1:
+            future.set_result(None)             # v1 gateways do not send TX_ACK
+        else:
+            self.pending.pop(self.token, None)
+            while len(self.pending) >= 256:
+                self.pending.pop(next(iter(self.pending)))[0].cancel()
+            self.pending[self.token] = (future, gateway)
+        self.transport.sendto(bytes((gateway.version,)) + self.token.to_bytes(2, 'big') + bytes((PULL_RESP,)) +
+                              message.encode('ascii'), gateway.pull_addr)
+        gateway.tx_sent += 1
+        return future
+
+    # class a downlink in rx1 of an uplink: same frequency and data rate, delay seconds after it
+    def reply(self, uplink, payload, delay = 1.0, **kwargs):
+        rxpk = uplink.rxpk
+        kwargs.setdefault('codr', rxpk.get('codr', '4/5'))
+        return self.send(uplink.gateway, payload, rxpk['freq'], rxpk['datr'], rxpk['tmst'] + int(delay * 1000000),
+                         **kwargs)
+
+    def stats(self):
+        return dict((gateway.eui.hex(), gateway.stats()) for gateway in self.gateways.values())
+
+class FakeForwarder(asyncio.DatagramProtocol):
+
+    def __init__(self, eui, server = ('127.0.0.1', 1700), version = 2, timeout = 1.0):
+        self.eui = bytes(eui)
+        self.server = server
+        self.version = version
+        self.timeout = timeout
+        self.transport = None
+        self.token = 0
+        self.pending = {}
+        self.downlinks = None
+        self.start_time = time.monotonic()
+
+    async def start(self):
+        self.downlinks = asyncio.Queue()
+        await asyncio.get_running_loop().create_datagram_endpoint(lambda: self, remote_addr=self.server)
+        return self
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 4:
+            return
+        token = int.from_bytes(data[1:3], 'big')
+        if data[3] == PULL_RESP:
+            self.downlinks.put_nowait(json.loads(data[4:])['txpk'])
+            if self.version > 1:
+                self.transport.sendto(data[:3] + bytes((TX_ACK,)) + self.eui +
+                                      b'{"txpk_ack":{"error":"NONE"}}')
+            return
+        future = self.pending.pop((token, data[3]), None)
+        if future is not None and not future.done():
+            future.set_result(True)
+
+    async def request(self, ident, ack, body = b''):
+        self.token = (self.token + 1) & 0xFFFF
+        future = asyncio.get_running_loop().create_future()
+        self.pending[(self.token, ack)] = future
+        self.transport.sendto(bytes((self.version,)) + self.token.to_bytes(2, 'big') + bytes((ident,)) +
+                              self.eui + body)
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.pending.pop((self.token, ack), None)
+            return False
+
+    def tmst(self):
+        return int((time.monotonic() - self.start_time) * 1000000) & 0xFFFFFFFF
+
+    def rxpk(self, payload, **meta):
+        rxpk = dict(tmst=self.tmst(), chan=0, rfch=0, freq=868.1, stat=1, modu='LORA', datr='SF7BW125', codr='4/5',
+                    rssi=-60, lsnr=7.5, size=len(payload),
+                    data=binascii.b2a_base64(bytes(payload), newline=False).decode('ascii'))
+        rxpk.update(meta)
+        return rxpk
+
+    # all frames go out in one PUSH_DATA, with the gateway status object if
+    # given. meta overrides rxpk fields. True once it is acked
+    async def push(self, frames, status = None, **meta):
+        message = {'rxpk': [self.rxpk(frame, **meta) for frame in frames]}
+        if status is not None:
+            message['stat'] = status
+        return await self.request(PUSH_DATA, PUSH_ACK, json.dumps(message, separators=(',', ':')).encode('ascii'))
+
+    # keepalive that opens the downlink path, True once it is acked
+    async def pull(self):
+        return await self.request(PULL_DATA, PULL_ACK)
+
+    # next txpk sent to this gateway, its data still base64 encoded
+    async def receive(self, timeout = None):
+        return await asyncio.wait_for(self.downlinks.get(), timeout)
@@ -1,6 +1,10 @@
 #
 # lorawan packet: mhdr(1) mac_payload(1..N) mic(4)
 #
+# read(packet, lazy=True) only checks the length, the headers are decoded on
+# first access. the peek_* helpers read single fields straight off a raw
+# packet, peek_devaddr returns the devaddr msb first like SessionStore.lookup.
+#
 from .MalformedPacketException import MalformedPacketException
 from .MHDR import MHDR
 from .Direction import Direction
@@ -8,21 +12,44 @@ from .MacPayload import MacPayload
 
 class PhyPayload:
 
-    def __init__(self, nwkey, appkey):
+    __slots__ = ('nwkey', 'appkey', 'store', 'session', 'packet', 'mhdr', 'direction', 'mac_payload', 'mic', 'resolved')
+
+    def __init__(self, nwkey, appkey, store = None):
         self.nwkey = nwkey
         self.appkey = appkey
-
-    def read(self, packet):
+        self.store = store
+        self.session = None
+
+    def read(self, packet, lazy = False):
+        if isinstance(packet, bytearray):
+            packet = memoryview(packet)
+        elif not isinstance(packet, (bytes, memoryview)):
+            packet = bytes(packet)
         if len(packet) < 12:
             raise MalformedPacketException("Invalid lorawan packet");
 
-        self.mhdr = MHDR(packet[0])
-        self.set_direction()
-        self.mac_payload = MacPayload()
-        self.mac_payload.read(self.get_mhdr().get_mtype(), packet[1:-4])
-        self.mic = packet[-4:]
+        self.packet = packet
+        self.mhdr = None
+        self.direction = None
+        self.mac_payload = None
+        self.mic = bytes(packet[-4:])
+        self.resolved = self.store == None
+        if not lazy:
+            self.get_mac_payload()
+            self.resolve_session()
+
+    def resolve_session(self):
+        if self.resolved:
+            return
+        self.resolved = True
+        self.set_session(self.store.resolve(self))
+        fhdr = self.get_mac_payload().get_fhdr()
+        if self.session != None and not self.store.accept_fcnt(self.session, self.get_direction(), fhdr.get_fcnt32()):
+            raise MalformedPacketException("Invalid frame counter")
 
     def create(self, mhdr, args):
+        self.packet = None
+        self.resolved = True
         self.mhdr = MHDR(mhdr)
         self.set_direction()
         self.mac_payload = MacPayload()
@@ -33,24 +60,41 @@ class PhyPayload:
         return len(self.to_raw())
 
     def to_raw(self):
-        phy_payload = [self.get_mhdr().to_raw()]
-        phy_payload += self.mac_payload.to_raw()
-        phy_payload += self.get_mic()
-        return phy_payload
+        return b''.join((bytes((self.get_mhdr().to_raw(),)), self.get_mac_payload().to_raw(), self.get_mic()))
+
+    def to_list(self):
+        return list(self.to_raw())
+
+    def get_session(self):
+        self.resolve_session()
+        return self.session
+
+    def set_session(self, session):
+        self.session = session
+        if session != None:
+            self.nwkey = session.nwkey
+            self.appkey = session.appkey
 
     def get_mhdr(self):
+        if self.mhdr == None:
+            self.mhdr = MHDR(self.packet[0])
         return self.mhdr;
 
     def set_mhdr(self, mhdr):
         self.mhdr = mhdr
 
     def get_direction(self):
-        return self.direction.get()
+        if self.direction == None:
+            self.set_direction()
+        return self.direction
 
     def set_direction(self):
-        self.direction = Direction(self.get_mhdr())
+        self.direction = Direction.DIRECTION[self.get_mhdr().get_mtype()]
 
     def get_mac_payload(self):
+        if self.mac_payload == None:
+            self.mac_payload = MacPayload()
+            self.mac_payload.read(self.get_mhdr().get_mtype(), memoryview(self.packet)[1:-4])
         return self.mac_payload
 
     def set_mac_payload(self, mac_payload):
@@ -65,28 +109,47 @@ class PhyPayload:
         self.mic = mic
 
     def compute_mic(self):
+        self.resolve_session()
+        frm_payload = self.get_mac_payload().get_frm_payload()
         if self.get_mhdr().get_mtype() == MHDR.JOIN_ACCEPT:
-            return self.mac_payload.frm_payload.encrypt_payload(self.appkey, self.get_direction(), self.get_mhdr())[-4:]
+            return frm_payload.encrypt_payload(self.appkey, self.get_direction(), self.get_mhdr())[-4:]
         else:
-            return self.mac_payload.frm_payload.compute_mic(self.nwkey, self.get_direction(), self.get_mhdr())
+            return frm_payload.compute_mic(self.nwkey, self.get_direction(), self.get_mhdr())
 
     def valid_mic(self):
-        if self.get_mhdr().get_mtype() == MHDR.JOIN_ACCEPT:
-            return self.get_mic() == self.mac_payload.frm_payload.encrypt_payload(self.appkey, self.get_direction(), self.get_mhdr())[-4:]
-        else:
-            return self.get_mic() == self.mac_payload.frm_payload.compute_mic(self.nwkey, self.get_direction(), self.get_mhdr())
+        return self.get_mic() == self.compute_mic()
 
     def get_devaddr(self):
+        mac_payload = self.get_mac_payload()
         if self.get_mhdr().get_mtype() == MHDR.JOIN_ACCEPT:
-            return self.mac_payload.frm_payload.get_devaddr()
-        else:
-            return self.mac_payload.fhdr.get_devaddr()
+            return mac_payload.get_frm_payload().get_devaddr()
+        elif mac_payload.get_fhdr() != None:
+            return mac_payload.get_fhdr().get_devaddr()
 
     def get_payload(self):
-        return self.mac_payload.frm_payload.decrypt_payload(self.appkey, self.get_direction(), self.mic)
+        self.resolve_session()
+        return self.get_mac_payload().get_frm_payload().decrypt_payload(self.appkey, self.get_direction(), self.mic)
 
     def derive_nwskey(self, devnonce):
-        return self.mac_payload.frm_payload.derive_nwskey(self.appkey, devnonce)
+        return self.get_mac_payload().get_frm_payload().derive_nwskey(self.appkey, devnonce)
 
     def derive_appskey(self, devnonce):
-        return self.mac_payload.frm_payload.derive_appskey(self.appkey, devnonce)
+        return self.get_mac_payload().get_frm_payload().derive_appskey(self.appkey, devnonce)
+
+    @staticmethod
+    def peek_mtype(packet):
+        if len(packet) < 12:
+            raise MalformedPacketException("Invalid lorawan packet");
+        return packet[0] & MHDR.MHDR_TYPE
+
+    @staticmethod
+    def peek_devaddr(packet):
+        if PhyPayload.peek_mtype(packet) not in MacPayload.DATA_TYPES:
+            return None
+        return bytes((packet[4], packet[3], packet[2], packet[1]))
+
+    @staticmethod
+    def peek_fcnt(packet):
+        if PhyPayload.peek_mtype(packet) not in MacPayload.DATA_TYPES:
+            return None
+        return packet[6] | (packet[7] << 8)
@@ -0,0 +1,107 @@
+#
+# replays recorded frames (CaptureRecords, e.g. from Capture.read_capture)
+# through the per frame path: PhyPayload.read with a session store, so the
+# session is resolved by mic and the frame counter checked, then
+# valid_mic() and get_payload(). join requests go to the JoinServer if one is
+# given, otherwise they are only counted. the JoinServer makes sessions with
+# its own devaddrs and keys, so uplinks after a join in the recording only
+# decode when the store already has the session the device really got.
+#
+# speed None replays as fast as possible, otherwise frame i is due at
+# start + (timestamp_i - timestamp_0) / speed, 1 being the original timing.
+# speed has to be greater than 0.
+# latency is the time from a frame being due (or taken, as fast as possible)
+# until it is decoded, so it includes any backlog when the codec falls behind.
+#
+import time
+from array import array
+from .MalformedPacketException import MalformedPacketException
+from .MHDR import MHDR
+from .PhyPayload import PhyPayload
+
+class Replay:
+
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self, store, speed = None, join_server = None, clock = time.perf_counter, sleep = time.sleep):
+        if speed is not None and not speed > 0:
+            raise ValueError("Invalid speed %r" % (speed,))
+        self.store = store
+        self.speed = speed
+        self.join_server = join_server
+        self.clock = clock
+        self.sleep = sleep
+        self.latencies = array('d')
+        self.errors = {}
+        self.frames = 0
+        self.bytes = 0
+        self.late = 0
+        self.elapsed = 0.0
+
+    def process(self, frame):
+        lorawan = PhyPayload([], [], self.store)
+        try:
+            lorawan.read(frame)
+            mtype = lorawan.get_mhdr().get_mtype()
+            if mtype == MHDR.JOIN_REQUEST:
+                if self.join_server is None:
+                    return 'join_request'
+                self.join_server.join(frame)
+                return 'ok'
+            if mtype == MHDR.JOIN_ACCEPT:
+                return 'join_accept'
+            if lorawan.get_session() is None:
+                devaddr = bytes(reversed(lorawan.get_devaddr()))
+                return 'invalid_mic' if self.store.lookup(devaddr) else 'unknown_devaddr'
+            if not lorawan.valid_mic():
+                return 'invalid_mic'
+            lorawan.get_payload()
+            return 'ok'
+        except MalformedPacketException as e:
+            return str(e).lower().replace(' ', '_')
+        except (IndexError, KeyError, ValueError):
+            return 'malformed'
+
+    def run(self, records):
+        clock = self.clock
+        speed = self.speed
+        start = clock()
+        origin = None
+        for record in records:
+            if speed is None:
+                due = clock()
+            else:
+                if origin is None:
+                    origin = record.timestamp
+                due = start + (record.timestamp - origin) / speed
+                wait = due - clock()
+                if wait > 0:
+                    self.sleep(wait)
+                elif wait < -0.001:
+                    self.late += 1
+            result = self.process(bytes(record.frame))
+            self.latencies.append(clock() - due)
+            self.errors[result] = self.errors.get(result, 0) + 1
+            self.frames += 1
+            self.bytes += len(record.frame)
+        self.elapsed = clock() - start
+        return self.report()
+
+    def percentile(self, latencies, p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.))] * 1e6
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        report = dict(
+                frames         = self.frames,
+                bytes          = self.bytes,
+                elapsed        = self.elapsed,
+                frames_per_sec = self.frames / self.elapsed if self.elapsed else None,
+                late           = self.late,
+                results        = dict(sorted(self.errors.items()))
+            )
+        if latencies:
+            report['latency_us'] = dict([('p%g' % p, self.percentile(latencies, p)) for p in self.PERCENTILES] +
+                                        [('max', latencies[-1] * 1e6),
+                                         ('mean', sum(latencies) / len(latencies) * 1e6)])
+        return report
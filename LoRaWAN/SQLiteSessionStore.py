@@ -0,0 +1,140 @@
+#
+# session store persisted to sqlite. all sessions are loaded into the in-memory
+# index on open and every add/remove is written through. frame counters live in
+# the in-memory tracker. with save_interval 0 every accepted counter is written
+# through as well. otherwise a background thread writes the changed counters
+# every save_interval seconds, so a crash loses up to save_interval seconds of
+# accepted counters and frames from that window are accepted once more after a
+# restart. save_fcnt() and close() write all counters. the join state, used
+# devnonces and the appnonce counter, is always written through.
+#
+# readonly opens an existing database without creating or writing anything,
+# sessions and counters then only change in memory.
+#
+import sqlite3
+import threading
+from urllib.parse import quote
+from .Session import Session
+from .Direction import Direction
+from .SessionStore import SessionStore
+
+class SQLiteSessionStore(SessionStore):
+
+    def __init__(self, path, save_interval = 0.0, readonly = False):
+        SessionStore.__init__(self)
+        self.save_interval = save_interval
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.dirty = set()
+        if readonly:
+            self.db = sqlite3.connect('file:%s?mode=ro' % quote(path), uri=True, check_same_thread=False)
+        else:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "devaddr BLOB NOT NULL, nwkey BLOB NOT NULL, appkey BLOB NOT NULL, deveui BLOB UNIQUE, "
+                "fcnt_up INTEGER NOT NULL DEFAULT -1, fcnt_down INTEGER NOT NULL DEFAULT -1, "
+                "PRIMARY KEY (devaddr, nwkey))")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS devnonces (deveui BLOB NOT NULL, devnonce INTEGER NOT NULL, "
+                "PRIMARY KEY (deveui, devnonce))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.db.commit()
+        rows = self.db.execute("SELECT devaddr, nwkey, appkey, deveui, fcnt_up, fcnt_down FROM sessions")
+        for devaddr, nwkey, appkey, deveui, fcnt_up, fcnt_down in rows:
+            session = SessionStore.add(self, Session(devaddr, nwkey, appkey, deveui))
+            self.set_fcnt(session, Direction.UP, fcnt_up)
+            self.set_fcnt(session, Direction.DOWN, fcnt_down)
+        self.load_join_state()
+        self.closed = threading.Event()
+        self.thread = None
+        if save_interval > 0 and not readonly:
+            self.thread = threading.Thread(target=self.run, name='fcnt', daemon=True)
+            self.thread.start()
+
+    def add(self, session):
+        # the in-memory add removes replaced sessions, and with them their rows, so it goes first
+        SessionStore.add(self, session)
+        if self.readonly:
+            return session
+        with self.lock, self.db:
+            if session.deveui is not None:
+                self.db.execute("DELETE FROM sessions WHERE deveui = ?", (session.deveui,))
+            self.db.execute("INSERT OR REPLACE INTO sessions (devaddr, nwkey, appkey, deveui) VALUES (?, ?, ?, ?)",
+                            (session.devaddr, session.nwkey, session.appkey, session.deveui))
+        return session
+
+    def remove(self, session):
+        if not self.readonly:
+            with self.lock, self.db:
+                self.db.execute("DELETE FROM sessions WHERE devaddr = ? AND nwkey = ?",
+                                (session.devaddr, session.nwkey))
+        SessionStore.remove(self, session)
+
+    def load_join_state(self):
+        try:
+            for deveui, devnonce in self.db.execute("SELECT deveui, devnonce FROM devnonces"):
+                self.devnonces.setdefault(deveui, set()).add(devnonce)
+            for value, in self.db.execute("SELECT value FROM state WHERE name = 'appnonce'"):
+                self.appnonce = value
+        except sqlite3.OperationalError:
+            pass                            # read-only database from before the join state was kept
+
+    def use_devnonce(self, deveui, devnonce):
+        if not SessionStore.use_devnonce(self, deveui, devnonce):
+            return False
+        if not self.readonly:
+            with self.lock, self.db:
+                self.db.execute("INSERT OR IGNORE INTO devnonces (deveui, devnonce) VALUES (?, ?)",
+                                (bytes(deveui), devnonce))
+        return True
+
+    def forget_devnonces(self, deveui):
+        SessionStore.forget_devnonces(self, deveui)
+        if not self.readonly:
+            with self.lock, self.db:
+                self.db.execute("DELETE FROM devnonces WHERE deveui = ?", (bytes(deveui),))
+
+    def next_appnonce(self):
+        appnonce = SessionStore.next_appnonce(self)
+        if not self.readonly:
+            with self.lock, self.db:
+                self.db.execute("INSERT OR REPLACE INTO state (name, value) VALUES ('appnonce', ?)", (appnonce,))
+        return appnonce
+
+    def accept_fcnt(self, session, direction, fcnt):
+        if not SessionStore.accept_fcnt(self, session, direction, fcnt):
+            return False
+        if self.save_interval > 0:
+            with self.lock:
+                self.dirty.add(session)
+        else:
+            self.write_fcnt([session])
+        return True
+
+    def write_fcnt(self, sessions):
+        if self.readonly:
+            return
+        with self.lock, self.db:
+            self.db.executemany("UPDATE sessions SET fcnt_up = ?, fcnt_down = ? WHERE devaddr = ? AND nwkey = ?",
+                                [(self.get_fcnt(session, Direction.UP), self.get_fcnt(session, Direction.DOWN),
+                                  session.devaddr, session.nwkey) for session in sessions if session.slot is not None])
+
+    def save_fcnt(self):
+        with self.lock:
+            self.dirty = set()
+        self.write_fcnt(list(self))
+
+    def run(self):
+        while not self.closed.wait(self.save_interval):
+            with self.lock:
+                dirty, self.dirty = self.dirty, set()
+            if dirty:
+                self.write_fcnt(dirty)
+
+    def close(self):
+        self.closed.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.save_fcnt()
+        self.db.close()
@@ -0,0 +1,25 @@
+#
+# session: devaddr(4) nwkey(16) appkey(16) deveui(8, otaa only)
+#
+class Session:
+
+    __slots__ = ('devaddr', 'nwkey', 'appkey', 'deveui', 'slot')
+
+    def __init__(self, devaddr, nwkey, appkey, deveui = None):
+        self.devaddr = bytes(devaddr)
+        self.nwkey = bytes(nwkey)
+        self.appkey = bytes(appkey)
+        self.deveui = bytes(deveui) if deveui is not None else None
+        self.slot = None
+
+    def get_devaddr(self):
+        return self.devaddr
+
+    def get_nwkey(self):
+        return self.nwkey
+
+    def get_appkey(self):
+        return self.appkey
+
+    def get_deveui(self):
+        return self.deveui
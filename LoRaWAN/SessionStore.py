@@ -0,0 +1,109 @@
+#
+# in-memory session store, indexed by devaddr (msb first). several sessions can
+# share a devaddr, resolve() picks the one whose nwkey matches the frame mic.
+# each session gets a slot in the store's frame counter tracker.
+#
+# the store also keeps the join state of JoinServer: the devnonces used per
+# deveui and the last appnonce. in memory they are lost on a restart, so the
+# appnonce starts at a random value. SQLiteSessionStore persists both.
+#
+import os
+from .MHDR import MHDR
+from .FCntTracker import FCntTracker
+
+class SessionStore:
+
+    def __init__(self):
+        self.sessions = {}
+        self.deveuis = {}
+        self.fcnt = FCntTracker()
+        self.devnonces = {}
+        self.appnonce = int.from_bytes(os.urandom(3), 'little')
+
+    def __len__(self):
+        return sum(len(sessions) for sessions in self.sessions.values())
+
+    def __iter__(self):
+        for sessions in self.sessions.values():
+            yield from sessions
+
+    def add(self, session):
+        if session.deveui is not None and session.deveui in self.deveuis:
+            self.remove(self.deveuis[session.deveui])
+        for existing in list(self.lookup(session.devaddr)):
+            if existing.nwkey == session.nwkey:
+                self.remove(existing)
+        session.slot = self.fcnt.allocate()
+        self.sessions.setdefault(session.devaddr, []).append(session)
+        if session.deveui is not None:
+            self.deveuis[session.deveui] = session
+        return session
+
+    def remove(self, session):
+        sessions = self.sessions.get(session.devaddr, [])
+        if session in sessions:
+            sessions.remove(session)
+            if not sessions:
+                del self.sessions[session.devaddr]
+            self.fcnt.release(session.slot)
+            session.slot = None
+        if session.deveui is not None and self.deveuis.get(session.deveui) is session:
+            del self.deveuis[session.deveui]
+
+    def lookup(self, devaddr):
+        return self.sessions.get(bytes(devaddr), [])
+
+    def get(self, deveui):
+        return self.deveuis.get(bytes(deveui))
+
+    def get_fcnt(self, session, direction):
+        return self.fcnt.get(session.slot, direction)
+
+    def set_fcnt(self, session, direction, fcnt):
+        self.fcnt.set(session.slot, direction, fcnt)
+
+    def accept_fcnt(self, session, direction, fcnt):
+        return self.fcnt.accept(session.slot, direction, fcnt)
+
+    # False if the devnonce was used by deveui before, otherwise it is recorded
+    def use_devnonce(self, deveui, devnonce):
+        devnonces = self.devnonces.setdefault(bytes(deveui), set())
+        if devnonce in devnonces:
+            return False
+        devnonces.add(devnonce)
+        return True
+
+    def forget_devnonces(self, deveui):
+        self.devnonces.pop(bytes(deveui), None)
+
+    def next_appnonce(self):
+        self.appnonce = (self.appnonce + 1) & 0xFFFFFF
+        return self.appnonce
+
+    def resolve(self, phy_payload):
+        mtype = phy_payload.get_mhdr().get_mtype()
+        if mtype == MHDR.JOIN_REQUEST or mtype == MHDR.JOIN_ACCEPT:
+            return None
+        frm_payload = phy_payload.get_mac_payload().get_frm_payload()
+        fhdr = phy_payload.get_mac_payload().get_fhdr()
+        fcnt = fhdr.get_fcnt32() & 0xFFFF
+        direction = phy_payload.get_direction()
+        devaddr = bytes(reversed(phy_payload.get_devaddr()))
+        # a counter outside a session's window is rejected without a mic. if no other session matches, that
+        # session is returned with the counter, so the frame fails as a frame counter error
+        stale = None
+        for session in self.lookup(devaddr):
+            full = self.fcnt.reconstruct(session.slot, direction, fcnt)
+            if not self.fcnt.check(session.slot, direction, full):
+                if stale is None:
+                    stale = (session, full)
+                continue
+            fhdr.set_fcnt_msb(full >> 16)
+            mic = frm_payload.compute_mic(session.nwkey, direction, phy_payload.get_mhdr())
+            if mic == phy_payload.get_mic():
+                return session
+        if stale is not None:
+            fhdr.set_fcnt_msb(stale[1] >> 16)
+            return stale[0]
+        fhdr.set_fcnt_msb(0)
+        return None
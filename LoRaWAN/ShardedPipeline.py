@@ -0,0 +1,357 @@
+#
+# multi-process batch decode. frames are sharded by devaddr over worker
+# processes, so all frames of a device go to the same worker in arrival order
+# and its frame counters live in that worker's own SessionStore. each worker
+# only gets the sessions of its shard.
+#
+# frames go to a worker through a SharedRing in shared memory and the results
+# come back through another one, nothing is pickled per frame. the semaphores
+# are only released once per published batch and also order the ring writes
+# against the reads on the other side. results are put back in input order
+# before imap() yields them.
+#
+#   with ShardedPipeline(sessions, workers=4) as pipeline:
+#       for result in pipeline.imap(frames):
+#           ...
+#
+# results are DecodedFrames as from BatchDecoder. sessions is a SessionStore
+# or a list of Sessions, which are put in a store of their own (self.store).
+# the workers start from the store's frame counters and stop() writes their
+# final counters back into it, a SQLiteSessionStore saves them. the store
+# must not decode frames itself while the pipeline runs.
+#
+# frames longer than MAX_FRAME, the largest lorawan phy payload, are
+# MALFORMED. a slot holds a frame or a result with its payload.
+#
+import multiprocessing
+import os
+import queue
+import struct
+from multiprocessing import shared_memory
+from .AES_CMAC import cmac_cache
+from .BatchDecoder import BatchDecoder, DecodedFrame
+from .Direction import Direction
+from .Session import Session
+from .SessionStore import SessionStore
+from .SQLiteSessionStore import SQLiteSessionStore
+
+FRAME = struct.Struct('<IH')                 # seq, length
+RESULT = struct.Struct('<IBhqhh4s')          # seq, error, mtype, fcnt, fport, payload length, devaddr
+STOP = 0xFFFF
+MAX_FRAME = 255
+
+class SharedRing:
+
+    # spsc ring of fixed size slots. head is only written by the producer,
+    # tail only by the consumer, they sit on separate cache lines.
+    HEADER = 128
+
+    def __init__(self, slots, slot_size, name = None):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=self.HEADER + slots * slot_size)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self.counters = self.buf[:self.HEADER].cast('Q')
+        if name is None:
+            self.counters[0] = 0
+            self.counters[8] = 0
+
+    def __len__(self):
+        return self.counters[0] - self.counters[8]
+
+    def get_head(self):
+        return self.counters[0]
+
+    def set_head(self, head):
+        self.counters[0] = head
+
+    def get_tail(self):
+        return self.counters[8]
+
+    def set_tail(self, tail):
+        self.counters[8] = tail
+
+    def offset(self, i):
+        return self.HEADER + (i % self.slots) * self.slot_size
+
+    def close(self, unlink = False):
+        self.counters.release()
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+def run_shard(shard, sessions, in_name, out_name, slots, slot_size, ready, done, counters):
+    inbox = SharedRing(slots, slot_size, in_name)
+    outbox = SharedRing(slots, slot_size, out_name)
+    # keep the nwkey and appkey contexts of the whole shard cached
+    cmac_cache.size = max(cmac_cache.size, 2 * len(sessions))
+    store = SessionStore()
+    shard_sessions = []
+    for devaddr, nwkey, appkey, deveui, fcnt_up, fcnt_down in sessions:
+        session = store.add(Session(devaddr, nwkey, appkey, deveui))
+        store.set_fcnt(session, Direction.UP, fcnt_up)
+        store.set_fcnt(session, Direction.DOWN, fcnt_down)
+        shard_sessions.append(session)
+    decoder = BatchDecoder(store)
+    try:
+        while True:
+            ready.acquire()
+            tail = inbox.get_tail()
+            head = inbox.get_head()
+            if head == tail:
+                continue
+            buf = inbox.buf
+            seqs = []
+            frames = []
+            stop = False
+            for i in range(tail, head):
+                offset = inbox.offset(i)
+                seq, length = FRAME.unpack_from(buf, offset)
+                if length == STOP:
+                    stop = True
+                    break
+                offset += FRAME.size
+                seqs.append(seq)
+                frames.append(bytes(buf[offset:offset + length]))
+            inbox.set_tail(head)
+
+            out = outbox.get_head()
+            buf = outbox.buf
+            for seq, result in zip(seqs, decoder.decode(frames)):
+                offset = outbox.offset(out)
+                payload = result.payload
+                RESULT.pack_into(buf, offset, seq, result.error, -1 if result.mtype is None else result.mtype,
+                                 -1 if result.fcnt is None else result.fcnt, -1 if result.fport is None else result.fport,
+                                 -1 if payload is None else len(payload), result.devaddr or b'')
+                if payload:
+                    offset += RESULT.size
+                    buf[offset:offset + len(payload)] = payload
+                out += 1
+            outbox.set_head(out)
+            done.release()
+            if stop:
+                counters.put((shard, [(store.get_fcnt(session, Direction.UP), store.get_fcnt(session, Direction.DOWN))
+                                      for session in shard_sessions]))
+                return
+    finally:
+        inbox.close()
+        outbox.close()
+
+class ShardedPipeline:
+
+    def __init__(self, sessions, workers = None, slots = 1024, slot_size = 288, chunk = 256, context = None):
+        if slot_size < max(FRAME.size, RESULT.size) + MAX_FRAME:
+            raise ValueError("slot_size must be at least %d" % (max(FRAME.size, RESULT.size) + MAX_FRAME))
+        if not isinstance(sessions, SessionStore):
+            store = SessionStore()
+            for session in sessions:
+                store.add(session)
+            sessions = store
+        self.store = sessions
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = slots
+        self.slot_size = slot_size
+        self.chunk = chunk
+        self.context = multiprocessing.get_context(context)
+        self.processes = []
+        self.inboxes = []
+        self.outboxes = []
+        self.ready = []
+        self.done = None
+        self.counters = None
+        self.shards = []
+        self.inflight = []
+        self.frames = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def shard(self, devaddr):
+        return int.from_bytes(devaddr, 'big') % self.workers
+
+    def start(self):
+        self.done = self.context.Semaphore(0)
+        self.counters = self.context.Queue()
+        for shard in range(self.workers):
+            inbox = SharedRing(self.slots, self.slot_size)
+            outbox = SharedRing(self.slots, self.slot_size)
+            ready = self.context.Semaphore(0)
+            sessions = [session for session in self.store if self.shard(session.devaddr) == shard]
+            keys = [(session.devaddr, session.nwkey, session.appkey, session.deveui,
+                     self.store.get_fcnt(session, Direction.UP), self.store.get_fcnt(session, Direction.DOWN))
+                    for session in sessions]
+            process = self.context.Process(target=run_shard, name='lorawan-shard-%d' % shard, daemon=True,
+                                           args=(shard, keys, inbox.name, outbox.name, self.slots, self.slot_size,
+                                                 ready, self.done, self.counters))
+            process.start()
+            self.processes.append(process)
+            self.inboxes.append(inbox)
+            self.outboxes.append(outbox)
+            self.ready.append(ready)
+            self.shards.append(sessions)
+            self.inflight.append(0)
+            self.frames.append(0)
+        return self
+
+    def stop(self):
+        stopped = 0
+        for shard, process in enumerate(self.processes):
+            inbox = self.inboxes[shard]
+            if process.is_alive() and len(inbox) < self.slots:
+                head = inbox.get_head()
+                FRAME.pack_into(inbox.buf, inbox.offset(head), 0, STOP)
+                inbox.set_head(head + 1)
+                self.ready[shard].release()
+                stopped += 1
+        # the final counters of every stopped worker, read before the join so no worker waits on the queue
+        for i in range(stopped):
+            try:
+                shard, counters = self.counters.get(timeout=1.0)
+            except queue.Empty:
+                break
+            for session, (fcnt_up, fcnt_down) in zip(self.shards[shard], counters):
+                if session.slot is not None:
+                    self.store.set_fcnt(session, Direction.UP, fcnt_up)
+                    self.store.set_fcnt(session, Direction.DOWN, fcnt_down)
+        if stopped and isinstance(self.store, SQLiteSessionStore):
+            self.store.save_fcnt()
+        for process in self.processes:
+            process.join(1.0)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for ring in self.inboxes + self.outboxes:
+            ring.close(unlink=True)
+        self.processes = []
+        self.inboxes = []
+        self.outboxes = []
+        self.ready = []
+        self.shards = []
+        self.inflight = []
+        self.frames = []
+        if self.counters is not None:
+            self.counters.close()
+            self.counters = None
+
+    def decode(self, frames):
+        return list(self.imap(frames))
+
+    def imap(self, frames):
+        if not self.processes:
+            raise RuntimeError("Pipeline not started")
+        self.drain()
+        frames = iter(frames)
+        results = {}
+        heads = [inbox.get_head() for inbox in self.inboxes]
+        published = list(heads)
+        bufs = [inbox.buf for inbox in self.inboxes]
+        inflight = self.inflight
+        workers = self.workers
+        slots = self.slots
+        slot_size = self.slot_size
+        header = SharedRing.HEADER
+        pack_into = FRAME.pack_into
+        frame_size = FRAME.size
+        max_length = MAX_FRAME
+        submitted = 0
+        emitted = 0
+        waiting = None
+        exhausted = False
+
+        while True:
+            blocked = False
+            count = 0
+            while not exhausted and count < self.chunk:
+                if waiting is None:
+                    try:
+                        frame = next(frames)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if not isinstance(frame, (bytes, bytearray, memoryview)):
+                        frame = bytes(frame)
+                    length = len(frame)
+                    if length < 12 or length > max_length:
+                        results[submitted] = DecodedFrame(BatchDecoder.MALFORMED, None, None, None, None, None)
+                        submitted += 1
+                        continue
+                    waiting = frame
+                shard = int.from_bytes(waiting[1:5], 'little') % workers
+                if inflight[shard] >= slots:
+                    blocked = True
+                    break
+                head = heads[shard]
+                offset = header + (head % slots) * slot_size
+                buf = bufs[shard]
+                pack_into(buf, offset, submitted & 0xFFFFFFFF, length)
+                offset += frame_size
+                buf[offset:offset + length] = waiting
+                heads[shard] = head + 1
+                inflight[shard] += 1
+                submitted += 1
+                count += 1
+                waiting = None
+
+            for shard, head in enumerate(heads):
+                if head != published[shard]:
+                    self.inboxes[shard].set_head(head)
+                    self.frames[shard] += head - published[shard]
+                    published[shard] = head
+                    self.ready[shard].release()
+
+            while emitted in results:
+                yield results.pop(emitted)
+                emitted += 1
+            if exhausted and emitted == submitted:
+                return
+
+            if blocked or exhausted:
+                while not self.done.acquire(timeout=1.0):
+                    self.check_workers()
+            elif not self.done.acquire(False):
+                continue
+            self.collect(results, emitted)
+
+    def collect(self, results, emitted):
+        unpack_from = RESULT.unpack_from
+        result_size = RESULT.size
+        no_devaddr = (BatchDecoder.MALFORMED, BatchDecoder.UNSUPPORTED_MTYPE)
+        for shard, outbox in enumerate(self.outboxes):
+            tail = outbox.get_tail()
+            head = outbox.get_head()
+            if head == tail:
+                continue
+            buf = outbox.buf
+            for i in range(tail, head):
+                offset = outbox.offset(i)
+                seq, error, mtype, fcnt, fport, length, devaddr = unpack_from(buf, offset)
+                offset += result_size
+                results[emitted + ((seq - emitted) & 0xFFFFFFFF)] = DecodedFrame(
+                    error,
+                    None if mtype < 0 else mtype,
+                    None if error in no_devaddr else devaddr,
+                    None if fcnt < 0 else fcnt,
+                    None if fport < 0 else fport,
+                    None if length < 0 else bytes(buf[offset:offset + length]))
+            outbox.set_tail(head)
+            self.inflight[shard] -= head - tail
+
+    # throw away the results of an imap() that was not run to the end
+    def drain(self):
+        while any(self.inflight):
+            while not self.done.acquire(timeout=1.0):
+                self.check_workers()
+            self.collect({}, 0)
+
+    def check_workers(self):
+        for process in self.processes:
+            if not process.is_alive():
+                raise RuntimeError("Worker %s exited with %s" % (process.name, process.exitcode))
+
+    def stats(self):
+        return dict(workers=self.workers, frames=list(self.frames), inflight=list(self.inflight))
@@ -0,0 +1,125 @@
+#
+# synthetic uplink traffic of many devices for load tests. every device sends
+# data up every period seconds from a random phase, with a mix of payload
+# sizes and confirmed frames, and loses frames now and then, which leaves a
+# gap in its frame counter. join_storm() has devices send join requests in a
+# short window, as after a power cut.
+#
+# data frames are made by PhyPayload.create (fport 1), join requests by
+# PhyPayload.create with the JoinRequestPayload fields. the key contexts of
+# all devices are set up once in cmac_cache, so a frame only costs its
+# keystream and mic. lost frames are not built at all.
+#
+# frames() yields (timestamp, frame) in time order. sessions() fills a
+# SessionStore with the device sessions, joins() a JoinServer with the
+# appkeys.
+#
+import bisect
+import random
+from .AES_CMAC import cmac_cache
+from .MHDR import MHDR
+from .PhyPayload import PhyPayload
+from .Session import Session
+
+class SimDevice:
+
+    __slots__ = ('devaddr', 'nwkey', 'appkey', 'deveui', 'appeui', 'joinkey', 'phase', 'fcnt', 'index')
+
+    def __init__(self, devaddr, nwkey, appkey, deveui, appeui, joinkey, phase):
+        self.devaddr = devaddr
+        self.nwkey = nwkey
+        self.appkey = appkey
+        self.deveui = deveui
+        self.appeui = appeui
+        self.joinkey = joinkey
+        self.phase = phase
+        self.fcnt = 0
+        self.index = 0
+
+class TrafficGenerator:
+
+    def __init__(self, devices = 1000, period = 60.0, sizes = (5, 11, 24, 51), weights = None, confirmed = 0.1,
+                 loss = 0.01, jitter = 0.5, burst = 32, nwkid = 0x13, appeui = None, seed = None):
+        self.rng = random.Random(seed)
+        self.period = period
+        self.sizes = sizes
+        self.weights = weights
+        self.confirmed = confirmed
+        self.loss = loss
+        self.jitter = jitter
+        self.burst = burst
+        self.appeui = bytes(appeui) if appeui is not None else bytes.fromhex('70b3d57ef0005134')
+        randbytes = self.rng.randbytes
+        self.devices = [SimDevice(((nwkid & 0x7F) << 25 | i + 1).to_bytes(4, 'big'), randbytes(16), randbytes(16),
+                                  (i + 1).to_bytes(8, 'big'), self.appeui, randbytes(16),
+                                  self.rng.uniform(0, period))
+                        for i in range(devices)]
+        # keep the key contexts of all devices cached
+        cmac_cache.size = max(cmac_cache.size, 3 * devices)
+        for device in self.devices:
+            cmac_cache.get(device.nwkey)
+            cmac_cache.get(device.appkey)
+        self.frames_made = 0
+        self.lost = 0
+
+    def sessions(self, store):
+        for device in self.devices:
+            store.add(Session(device.devaddr, device.nwkey, device.appkey))
+        return store
+
+    def joins(self, join_server):
+        for device in self.devices:
+            join_server.add_device(device.deveui, device.joinkey)
+        return join_server
+
+    def data_frames(self, device, count):
+        # the next count frames of a device as (timestamp, frame), lost frames left out
+        rng = self.rng
+        random = rng.random
+        result = []
+        timestamp = device.phase + device.index * self.period
+        device.index += count
+        for size in rng.choices(self.sizes, self.weights, k=count):
+            device.fcnt += 1
+            if random() < self.loss:
+                self.lost += 1
+            else:
+                lorawan = PhyPayload(device.nwkey, device.appkey)
+                lorawan.create(MHDR.CONF_DATA_UP if random() < self.confirmed else MHDR.UNCONF_DATA_UP,
+                               {'devaddr': device.devaddr, 'fcnt': device.fcnt, 'data': rng.randbytes(size)})
+                result.append((timestamp + rng.uniform(-self.jitter, self.jitter), lorawan.to_raw()))
+            timestamp += self.period
+        return result
+
+    def frames(self, count = None):
+        # (timestamp, frame) in time order, count frames or endless. the devices make burst frames at a time, a
+        # frame is only handed out once no later burst can have an earlier one
+        pending = []
+        made = 0
+        window = self.burst * self.period
+        horizon = 0.0
+        while count is None or made < count:
+            horizon += window
+            for device in self.devices:
+                while device.phase + device.index * self.period - self.jitter < horizon:
+                    pending += self.data_frames(device, self.burst)
+            pending.sort()
+            ready = bisect.bisect_left(pending, (horizon - self.jitter,))
+            if count is not None:
+                ready = min(ready, count - made)
+            yield from pending[:ready]
+            del pending[:ready]
+            made += ready
+            self.frames_made += ready
+
+    def join_storm(self, fraction = 1.0, start = 0.0, window = 10.0):
+        # join requests of a fraction of the devices spread over window seconds, in time order
+        rng = self.rng
+        joins = []
+        for device in rng.sample(self.devices, int(len(self.devices) * fraction)):
+            lorawan = PhyPayload(device.joinkey, [])
+            lorawan.create(MHDR.JOIN_REQUEST, {'deveui': device.deveui, 'appeui': device.appeui,
+                                               'devnonce': rng.randbytes(2)})
+            joins.append((start + rng.uniform(0, window), lorawan.to_raw()))
+        joins.sort()
+        return joins
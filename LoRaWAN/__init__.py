@@ -1,4 +1,21 @@
 from .PhyPayload import PhyPayload
+from .BatchDecoder import BatchDecoder
+from .Session import Session
+from .SessionStore import SessionStore
+from .SQLiteSessionStore import SQLiteSessionStore
+from .JoinServer import JoinServer
+from .ShardedPipeline import ShardedPipeline
+from .Journal import Journal, JournalReader
+from .Deduplicator import Deduplicator
+from .PacketForwarder import PacketForwarderServer, FakeForwarder
+from .TrafficGenerator import TrafficGenerator
 
-def new(nwkey = [], appkey = []):
-    return PhyPayload(nwkey, appkey)
+def new(nwkey = [], appkey = [], store = None):
+    return PhyPayload(nwkey, appkey, store)
+
+peek_mtype = PhyPayload.peek_mtype
+peek_devaddr = PhyPayload.peek_devaddr
+peek_fcnt = PhyPayload.peek_fcnt
+
+def decode_batch(frames, key_lookup):
+    return BatchDecoder(key_lookup).decode(frames)
@@ -0,0 +1,194 @@
+""" Defines AsyncLoRa, an asyncio front end for the LoRa class. """
+
+import asyncio
+import threading
+import time
+
+from .constants import *
+from .LoRa import LoRa
+from .RxRing import RxPacket
+
+
+class LockedSpiDev(object):
+    """ Wraps the board's SpiDev so that single transfers from different threads never interleave. """
+
+    def __init__(self, spi, lock):
+        self.spi = spi
+        self.lock = lock
+
+    def xfer(self, data):
+        with self.lock:
+            return self.spi.xfer(data)
+
+    def __getattr__(self, name):
+        return getattr(self.spi, name)
+
+
+class AsyncLoRa(LoRa):
+    """ asyncio front end for the LoRa class.
+
+        The GPIO callback threads only hand the DIO interrupt, with its monotonic timestamp, over to the event loop with
+        call_soon_threadsafe(). The on_* handlers then run in the loop thread. Every sequence of SPI transfers holds
+        spi_lock, so other threads can still use the radio safely.
+
+        async with radio.lock:             # optional, to keep other tasks off the radio for a while
+            ...
+        await radio.transmit(frame)
+        packet = await radio.receive(timeout=5)
+        async for packet in radio:
+            ...
+    """
+
+    def __init__(self, verbose=False, loop=None, queue_size=64, rx_profile=None, **kwargs):
+        """ Init the radio.
+        :param loop: Event loop to deliver interrupts to. Default is the running loop of the first await
+        :param queue_size: Number of received packets kept until receive() picks them up, the oldest are dropped
+        :param rx_profile: RadioProfile applied whenever continuous receive is (re)started
+        """
+        self.spi_lock = threading.RLock()
+        self.spi = LockedSpiDev(LoRa.spi, self.spi_lock)
+        self.loop = loop
+        self.queue_size = queue_size
+        self.rx_profile = rx_profile
+        self.queue = None
+        self.lock = None
+        self.tx_future = None
+        self.listening = False
+        self.irq_time = None
+        self.rx_dropped = 0
+        self.crc_errors = 0
+        super(AsyncLoRa, self).__init__(verbose, **kwargs)
+
+    def attach(self):
+        """ Bind to the running event loop. Called by every coroutine. """
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.queue_size)
+            self.lock = asyncio.Lock()
+
+    # Interrupts: GPIO thread -> event loop
+
+    def bridge(self, handler, channel):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self.dispatch, handler, channel, time.monotonic())
+
+    def dispatch(self, handler, channel, timestamp):
+        self.irq_time = timestamp
+        handler(self, channel)
+
+    def _dio0(self, channel):
+        self.bridge(LoRa._dio0, channel)
+
+    def _dio1(self, channel):
+        self.bridge(LoRa._dio1, channel)
+
+    def _dio2(self, channel):
+        self.bridge(LoRa._dio2, channel)
+
+    def _dio3(self, channel):
+        self.bridge(LoRa._dio3, channel)
+
+    # Event handlers, these run in the event loop thread
+
+    def on_tx_done(self):
+        with self.spi_lock:
+            self.clear_irq_flags(TxDone=1)
+            self.set_mode(MODE.STDBY)
+            if self.listening:
+                self.start_rx()
+        if self.tx_future is not None and not self.tx_future.done():
+            self.tx_future.set_result(self.irq_time)
+
+    def on_rx_done(self):
+        with self.spi_lock:
+            flags = self.get_irq_flags()
+            self.clear_irq_flags(RxDone=1, PayloadCrcError=1, ValidHeader=1)
+            if flags['crc_error']:
+                self.crc_errors += 1
+                return
+            payload = bytes(self.read_payload(nocheck=True))
+            packet = RxPacket(payload, self.get_pkt_rssi_value(), self.get_pkt_snr_value(), self.irq_time)
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.rx_dropped += 1
+        self.queue.put_nowait(packet)
+
+    # Coroutines
+
+    def start_rx(self):
+        """ Put the radio into continuous receive. The caller holds spi_lock. """
+        self.set_mode(MODE.STDBY)
+        if self.rx_profile is not None:
+            self.apply_profile(self.rx_profile)
+        self.set_dio_mapping([0] * 6)
+        self.reset_ptr_rx()
+        self.set_mode(MODE.RXCONT)
+
+    async def start_receive(self, rx_profile=None):
+        """ Start continuous receive, received packets are queued for receive() and the async iterator.
+        :param rx_profile: Replace the RadioProfile used while receiving
+        """
+        self.attach()
+        if rx_profile is not None:
+            self.rx_profile = rx_profile
+        self.listening = True
+        with self.spi_lock:
+            self.start_rx()
+
+    async def stop_receive(self):
+        """ Leave continuous receive, already queued packets are kept. """
+        self.attach()
+        self.listening = False
+        with self.spi_lock:
+            self.set_mode(MODE.STDBY)
+
+    async def transmit(self, frame, profile=None, timeout=None):
+        """ Send a frame and wait for TxDone. Continuous receive is resumed afterwards if it was on.
+        :param frame: Frame to send (bytes or list)
+        :param profile: RadioProfile applied before sending
+        :param timeout: Seconds to wait for TxDone, None waits forever
+        :return: Monotonic time of the TxDone interrupt
+        :rtype: float
+        """
+        self.attach()
+        async with self.lock:
+            self.tx_future = self.loop.create_future()
+            with self.spi_lock:
+                self.set_mode(MODE.STDBY)
+                if profile is not None:
+                    self.apply_profile(profile)
+                self.set_dio_mapping([1, 0, 0, 0, 0, 0])
+                self.write_payload(frame)
+                self.set_mode(MODE.TX)
+            try:
+                return await asyncio.wait_for(self.tx_future, timeout)
+            except asyncio.TimeoutError:
+                with self.spi_lock:
+                    self.set_mode(MODE.STDBY)
+                    if self.listening:
+                        self.start_rx()
+                raise
+            finally:
+                self.tx_future = None
+
+    async def receive(self, timeout=None):
+        """ Wait for the next received packet. Starts continuous receive if needed.
+        :param timeout: Seconds to wait, None waits forever
+        :return: RxPacket, or None on timeout
+        """
+        self.attach()
+        if not self.listening:
+            await self.start_receive()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.receive()
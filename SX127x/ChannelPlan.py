@@ -0,0 +1,143 @@
+""" Defines ChannelPlan and the EU868, US915 and AS923 regional plans with precomputed frequency and modem registers. """
+
+from .constants import *
+from .RadioProfile import RadioProfile, BW_HZ
+
+
+class ChannelPlan(object):
+    """ The channels and data rates of a region. The FRF register bytes of every channel and the modem config words of
+        every allowed channel/data rate pair are computed once, so hopping is a table lookup followed by
+        LoRa.set_frf() and LoRa.set_modem_config().
+        Modem config words are (MODEM_CONFIG_1, MODEM_CONFIG_2, MODEM_CONFIG_3) with the SymbTimeout MSB, TxContinuousMode
+        and AgcAutoOn bits left at 0; LoRa.set_modem_config() keeps the values already in the chip for those.
+    """
+
+    def __init__(self, name, data_rates, uplink, downlink, rx2, rx1_dr, sub_bands=(), coding_rate=CODING_RATE.CR4_5):
+        """ Precompute the register tables.
+        :param name: Region name
+        :param data_rates: List indexed by DR of (spreading_factor, bw) or None for RFU data rates
+        :param uplink: List of (freq in MHz, allowed data rates) per uplink channel
+        :param downlink: List of (freq in MHz, allowed data rates) per downlink channel, RX1 uses channel % len(downlink)
+        :param rx2: (freq in MHz, data rate) of the RX2 window
+        :param rx1_dr: Table rx1_dr[uplink_dr][rx1_dr_offset] -> RX1 data rate
+        :param sub_bands: List of (lowest freq, highest freq, duty cycle) of the regulated sub-bands
+        :param coding_rate: Coding rate used on all data rates
+        """
+        self.name = name
+        self.data_rates = data_rates
+        self.uplink_freqs = [f for f, drs in uplink]
+        self.downlink_freqs = [f for f, drs in downlink]
+        self.rx2_freq, self.rx2_dr = rx2
+        self.rx1_dr_table = rx1_dr
+        self.sub_bands = list(sub_bands)
+        self.coding_rate = coding_rate
+
+        self.uplink_frf = [RadioProfile.freq_to_frf(f) for f in self.uplink_freqs]
+        self.downlink_frf = [RadioProfile.freq_to_frf(f) for f in self.downlink_freqs]
+        self.rx2_frf = RadioProfile.freq_to_frf(self.rx2_freq)
+        # uplinks carry a payload CRC, downlinks don't
+        self.uplink_config = [self.modem_config_words(dr, 1) for dr in range(len(data_rates))]
+        self.downlink_config = [self.modem_config_words(dr, 0) for dr in range(len(data_rates))]
+        self.uplink_table = {(ch, dr): (self.uplink_frf[ch], self.uplink_config[dr])
+                             for ch, (f, drs) in enumerate(uplink) for dr in drs}
+        self.downlink_table = {(ch, dr): (self.downlink_frf[ch], self.downlink_config[dr])
+                               for ch, (f, drs) in enumerate(downlink) for dr in drs}
+
+    def modem_config_words(self, dr, rx_crc):
+        if self.data_rates[dr] is None:
+            return None
+        spreading_factor, bw = self.data_rates[dr]
+        low_data_rate_optim = (1 << spreading_factor) / BW_HZ[bw] > 0.016
+        return ((bw << 4) | (self.coding_rate << 1),
+                (spreading_factor << 4) | (rx_crc << 2),
+                int(low_data_rate_optim) << 3)
+
+    def uplink(self, channel, dr):
+        """ Look up the registers of an uplink.
+        :return: (frf, modem config words)
+        :rtype: tuple
+        """
+        try:
+            return self.uplink_table[(channel, dr)]
+        except KeyError:
+            raise ValueError("%s: DR%d is not allowed on uplink channel %d" % (self.name, dr, channel))
+
+    def rx1(self, channel, dr, rx1_dr_offset=0):
+        """ Look up the registers of the RX1 window that follows an uplink on channel with data rate dr.
+        :return: (frf, modem config words)
+        :rtype: tuple
+        """
+        downlink_dr = self.rx1_dr_table[dr][rx1_dr_offset]
+        return self.downlink_table[(channel % len(self.downlink_freqs), downlink_dr)]
+
+    def rx2(self, dr=None):
+        """ Look up the registers of the RX2 window.
+        :return: (frf, modem config words)
+        :rtype: tuple
+        """
+        return self.rx2_frf, self.downlink_config[self.rx2_dr if dr is None else dr]
+
+    def sub_band(self, freq):
+        """ Find the regulated sub-band of a frequency.
+        :param freq: Frequency in MHz
+        :return: Index into sub_bands, or None when no duty cycle limit applies
+        """
+        for i, (low, high, duty_cycle) in enumerate(self.sub_bands):
+            if low <= freq <= high:
+                return i
+        return None
+
+    def profile(self, registers, uplink=True, **kwargs):
+        """ Build a full RadioProfile from a (frf, modem config words) lookup result.
+        :param registers: Result of uplink(), rx1() or rx2()
+        :param uplink: False inverts IQ, as needed to receive downlinks
+        :param kwargs: Any other RadioProfile parameter
+        :return: RadioProfile
+        """
+        frf, config = registers
+        kwargs.setdefault('invert_iq', 0 if uplink else 1)
+        return RadioProfile(frf=frf, bw=config[0] >> 4, coding_rate=config[0] >> 1 & 0x07,
+                            spreading_factor=config[1] >> 4, rx_crc=config[1] >> 2 & 0x01,
+                            low_data_rate_optim=config[2] >> 3 & 0x01, **kwargs)
+
+
+def _rx1_dr_offset(data_rates, max_offset, min_dr=0):
+    return [[max(dr - offset, min_dr) for offset in range(max_offset + 1)] for dr in range(len(data_rates))]
+
+
+EU868_DATA_RATES = [(12, BW.BW125), (11, BW.BW125), (10, BW.BW125), (9, BW.BW125), (8, BW.BW125), (7, BW.BW125),
+                    (7, BW.BW250)]
+
+EU868 = ChannelPlan(
+    'EU868', EU868_DATA_RATES,
+    uplink=[(868.1, range(6)), (868.3, range(7)), (868.5, range(6)), (867.1, range(6)), (867.3, range(6)),
+            (867.5, range(6)), (867.7, range(6)), (867.9, range(6))],
+    downlink=[(868.1, range(6)), (868.3, range(7)), (868.5, range(6)), (867.1, range(6)), (867.3, range(6)),
+              (867.5, range(6)), (867.7, range(6)), (867.9, range(6))],
+    rx2=(869.525, 0),
+    rx1_dr=_rx1_dr_offset(EU868_DATA_RATES, 5),
+    sub_bands=[(863.0, 865.0, 0.001), (865.0, 868.0, 0.01), (868.0, 868.6, 0.01), (868.7, 869.2, 0.001),
+               (869.4, 869.65, 0.1), (869.7, 870.0, 0.01)])
+
+US915_DATA_RATES = [(10, BW.BW125), (9, BW.BW125), (8, BW.BW125), (7, BW.BW125), (8, BW.BW500), None, None, None,
+                    (12, BW.BW500), (11, BW.BW500), (10, BW.BW500), (9, BW.BW500), (8, BW.BW500), (7, BW.BW500)]
+
+US915 = ChannelPlan(
+    'US915', US915_DATA_RATES,
+    uplink=[(round(902.3 + 0.2 * i, 1), range(4)) for i in range(64)] +
+           [(round(903.0 + 1.6 * i, 1), [4]) for i in range(8)],
+    downlink=[(round(923.3 + 0.6 * i, 1), range(8, 14)) for i in range(8)],
+    rx2=(923.3, 8),
+    rx1_dr=[[10, 9, 8, 8], [11, 10, 9, 8], [12, 11, 10, 9], [13, 12, 11, 10], [13, 13, 12, 11]])
+
+AS923_DATA_RATES = EU868_DATA_RATES
+
+AS923 = ChannelPlan(
+    'AS923', AS923_DATA_RATES,
+    uplink=[(923.2, range(7)), (923.4, range(7))],
+    downlink=[(923.2, range(7)), (923.4, range(7))],
+    rx2=(923.2, 2),
+    rx1_dr=_rx1_dr_offset(AS923_DATA_RATES, 5),
+    sub_bands=[(915.0, 928.0, 0.01)])
+
+REGIONS = {plan.name: plan for plan in (EU868, US915, AS923)}
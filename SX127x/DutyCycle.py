@@ -0,0 +1,120 @@
+""" Defines DutyCycleScheduler, which releases queued frames at the earliest time their sub-band duty cycle allows. """
+
+import asyncio
+import time
+from collections import deque, namedtuple
+
+from .constants import *
+from .TimeOnAir import time_on_air_cache, modem_config_from_profile
+
+
+QueuedFrame = namedtuple('QueuedFrame', ['frame', 'raw', 'profile', 'sub_band', 'airtime', 'sequence'])
+
+
+class DutyCycleScheduler(object):
+    """ Queues outgoing frames (PhyPayload objects or raw bytes) together with the RadioProfile to send them with.
+
+        After a transmission of airtime T on a sub-band with duty cycle d, the sub-band stays off for T / d - T (the
+        T_off of the regional parameters). A sub-band with a non-empty queue is therefore used at exactly its limit.
+        Frames outside any regulated sub-band only wait for the radio. Among the frames that may go, the one submitted
+        first is released first.
+    """
+
+    def __init__(self, plan, clock=time.monotonic, airtime=time_on_air_cache):
+        """ Create the scheduler.
+        :param plan: ChannelPlan with the regulated sub-bands
+        :param clock: Monotonic clock in seconds
+        :param airtime: TimeOnAirCache
+        """
+        self.plan = plan
+        self.clock = clock
+        self.airtime = airtime
+        bands = len(plan.sub_bands) + 1         # the last queue is for unregulated frequencies
+        self.queues = [deque() for i in range(bands)]
+        self.available_at = [0.0] * bands
+        self.airtime_used = [0.0] * bands
+        self.radio_free_at = 0.0
+        self.sequence = 0
+        self.sent = 0
+        self.wakeup = None
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues)
+
+    def submit(self, frame, profile):
+        """ Queue a frame.
+        :param frame: PhyPayload or bytes
+        :param profile: RadioProfile to transmit with, its frequency selects the sub-band
+        :return: QueuedFrame
+        """
+        raw = frame.to_raw() if hasattr(frame, 'to_raw') else bytes(frame)
+        registers = profile.registers
+        freq = (registers[REG.LORA.FR_MSB] << 16 | registers[REG.LORA.FR_MID] << 8 | registers[REG.LORA.FR_LSB]) / 16384.
+        sub_band = self.plan.sub_band(freq)
+        if sub_band is None:
+            sub_band = len(self.plan.sub_bands)
+        airtime = self.airtime.get(modem_config_from_profile(profile), len(raw))
+        self.sequence += 1
+        item = QueuedFrame(frame, raw, profile, sub_band, airtime, self.sequence)
+        self.queues[sub_band].append(item)
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return item
+
+    def release_time(self, sub_band):
+        return max(self.available_at[sub_band], self.radio_free_at)
+
+    def next_release(self):
+        """ Earliest time any queued frame may be sent
+        :return: Clock time, or None when the queue is empty
+        """
+        times = [self.release_time(i) for i, queue in enumerate(self.queues) if queue]
+        return min(times) if times else None
+
+    def pop(self, now=None):
+        """ Take the frame to send now and account for its transmission as starting now.
+        :return: QueuedFrame, or None when nothing may be sent yet
+        """
+        if now is None:
+            now = self.clock()
+        best = None
+        for i, queue in enumerate(self.queues):
+            if queue and self.release_time(i) <= now and \
+                    (best is None or queue[0].sequence < self.queues[best][0].sequence):
+                best = i
+        if best is None:
+            return None
+        item = self.queues[best].popleft()
+        self.complete(item, now + item.airtime)
+        self.airtime_used[best] += item.airtime
+        self.sent += 1
+        return item
+
+    def complete(self, item, end):
+        """ Correct the accounting once the real end of the transmission (TxDone) is known. """
+        self.radio_free_at = end
+        if item.sub_band < len(self.plan.sub_bands):
+            duty_cycle = self.plan.sub_bands[item.sub_band][2]
+            self.available_at[item.sub_band] = end + item.airtime / duty_cycle - item.airtime
+
+    async def run(self, radio):
+        """ Transmit queued frames with an AsyncLoRa as soon as they are legal. Runs until cancelled. """
+        self.wakeup = asyncio.Event()
+        while True:
+            release = self.next_release()
+            if release is None:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            delay = release - self.clock()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                continue
+            item = self.pop()
+            if item is not None:
+                end = await radio.transmit(item.raw, item.profile)
+                self.complete(item, end)
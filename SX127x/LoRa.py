@@ -21,8 +21,10 @@
 
 
 import sys
+import time
 from .constants import *
 from .board_config import BOARD
+from .TimeOnAir import time_on_air_cache, modem_config_from_lora
 
 
 ################################################## Some utility functions ##############################################
@@ -52,7 +54,7 @@ def getter(register_address):
     """
     def decorator(func):
         def wrapper(self):
-            return func(self, self.spi.xfer([register_address, 0])[1])
+            return func(self, self.get_register(register_address))
         return wrapper
     return decorator
 
@@ -66,7 +68,7 @@ def setter(register_address):
     """
     def decorator(func):
         def wrapper(self, val):
-            return self.spi.xfer([register_address | 0x80, func(self, val)])[1]
+            return self.set_register(register_address, func(self, val))
         return wrapper
     return decorator
 
@@ -80,6 +82,16 @@ class LoRa(object):
     backup_registers = []
     verbose = True
     dio_mapping = [None] * 6          # store the dio mapping here
+    shadow = None                     # write-through copy of the configuration registers
+
+    # Registers the chip changes by itself. These are never served from the shadow.
+    VOLATILE_REGISTERS = frozenset([
+        REG.LORA.FIFO, REG.LORA.OP_MODE, REG.LORA.FIFO_ADDR_PTR, REG.LORA.FIFO_RX_CURR_ADDR, REG.LORA.IRQ_FLAGS,
+        REG.LORA.RX_NB_BYTES, REG.LORA.RX_HEADER_CNT_MSB, REG.LORA.RX_HEADER_CNT_MSB + 1,
+        REG.LORA.RX_PACKET_CNT_MSB, REG.LORA.RX_PACKET_CNT_MSB + 1, REG.LORA.MODEM_STAT, REG.LORA.PKT_SNR_VALUE,
+        REG.LORA.PKT_RSSI_VALUE, REG.LORA.RSSI_VALUE, REG.LORA.HOP_CHANNEL, REG.LORA.FIFO_RX_BYTE_ADDR,
+        REG.LORA.FEI_MSB, REG.LORA.FEI_MSB + 1, REG.LORA.FEI_MSB + 2, 0x2C, REG.FSK.IMAGE_CAL, 0x3C
+    ])
 
     def __init__(self, verbose=True, do_calibration=True, calibration_freq=868):
         """ Init the object
@@ -90,6 +102,7 @@ class LoRa(object):
         :param do_calibration: Call rx_chain_calibration, default is True.
         """
         self.verbose = verbose
+        self.shadow = [None] * 0x80
         # set the callbacks for DIO0..5 IRQs.
         BOARD.add_events(self._dio0, self._dio1, self._dio2, self._dio3, self._dio4, self._dio5)
         # set mode to sleep and read all registers
@@ -119,6 +132,8 @@ class LoRa(object):
         for register_address, value in lookup_fsk:
             self.set_register(register_address, value)
         self.set_mode(MODE.SLEEP)
+        # seed the register shadow, switching to FSK mode above has cleared it
+        self.get_all_registers()
         # set the dio_ mapping by calling the two get_dio_mapping_* functions
         self.get_dio_mapping_1()
         self.get_dio_mapping_2()
@@ -219,12 +234,14 @@ class LoRa(object):
             return mode
         if self.verbose:
             sys.stderr.write("Mode <- %s\n" % MODE.lookup[mode])
+        if self.mode is None or (mode ^ self.mode) & 0x80:
+            self.invalidate_shadow()
         self.mode = mode
         return self.spi.xfer([REG.LORA.OP_MODE | 0x80, mode])[1]
 
     def write_payload(self, payload):
         """ Get FIFO ready for TX: Set FifoAddrPtr to FifoTxBaseAddr. The transceiver is put into STDBY mode.
-        :param payload: Payload to write (list)
+        :param payload: Payload to write (list or bytes)
         :return:    Written payload
         """
         payload_size = len(payload)
@@ -233,7 +250,7 @@ class LoRa(object):
         self.set_mode(MODE.STDBY)
         base_addr = self.get_fifo_tx_base_addr()
         self.set_fifo_addr_ptr(base_addr)
-        return self.spi.xfer([REG.LORA.FIFO | 0x80] + payload)[1:]
+        return self.spi.xfer([REG.LORA.FIFO | 0x80] + list(payload))[1:]
 
     def reset_ptr_rx(self):
         """ Get FIFO ready for RX: Set FifoAddrPtr to FifoRxBaseAddr. The transceiver is put into STDBY mode. """
@@ -263,12 +280,37 @@ class LoRa(object):
         payload = self.spi.xfer([REG.LORA.FIFO] + [0] * rx_nb_bytes)[1:]
         return payload
 
+    def drain_rx_fifo(self, ring):
+        """ RxDone fast path for the DIO0 callback: copy the packet into an RxRing with its RSSI, SNR and a monotonic
+            timestamp, and keep receiving. Decoding is left to the ring's consumers. It takes 5 SPI transfers: one read
+            from FIFO_RX_CURR_ADDR up to RX_NB_BYTES, clearing the IRQ flags, the FIFO pointer, the FIFO and the packet
+            SNR/RSSI.
+        :param ring: RxRing
+        :return: True if the packet was stored
+        :rtype: bool
+        """
+        timestamp = time.monotonic()
+        current_addr, mask, flags, nb_bytes = self.spi.xfer([REG.LORA.FIFO_RX_CURR_ADDR] + [0] * 4)[1:]
+        self.spi.xfer([REG.LORA.IRQ_FLAGS | 0x80, flags])
+        if flags >> MASK.IRQ_FLAGS.PayloadCrcError & 0x01:
+            ring.crc_errors += 1
+            stored = False
+        else:
+            self.spi.xfer([REG.LORA.FIFO_ADDR_PTR | 0x80, current_addr])
+            payload = self.spi.xfer([REG.LORA.FIFO] + [0] * nb_bytes)[1:]
+            snr, rssi = self.spi.xfer([REG.LORA.PKT_SNR_VALUE, 0, 0])[1:]
+            snr = (snr - 256 if snr > 127 else snr) / 4.    # signed, 0.25 dB steps
+            stored = ring.put(payload, rssi - 157, snr, timestamp)
+        if self.mode != MODE.RXCONT:
+            self.set_mode(MODE.RXCONT)
+        return stored
+
     def get_freq(self):
         """ Get the frequency (MHz)
         :return:    Frequency in MHz
         :rtype:     float
         """
-        msb, mid, lsb = self.spi.xfer([REG.LORA.FR_MSB, 0, 0, 0])[1:]
+        msb, mid, lsb = self.get_registers(REG.LORA.FR_MSB, 3)
         f = lsb + 256*(mid + 256*msb)
         return f / 16384.
 
@@ -286,10 +328,23 @@ class LoRa(object):
         mid = i // 256
         i -= mid * 256
         lsb = i
-        return self.spi.xfer([REG.LORA.FR_MSB | 0x80, msb, mid, lsb])
+        return self.set_registers(REG.LORA.FR_MSB, [msb, mid, lsb])
+
+    def set_frf(self, frf):
+        """ Set the frequency from precomputed FRF register bytes, e.g. from a ChannelPlan. Nothing is written when the
+            chip is already on that frequency.
+        :param frf: [msb, mid, lsb]
+        :return: True if the registers were written
+        :rtype: bool
+        """
+        assert self.mode == MODE.SLEEP or self.mode == MODE.STDBY or self.mode == MODE.FSK_STDBY
+        if self.shadow[REG.LORA.FR_MSB:REG.LORA.FR_MSB + 3] == list(frf):
+            return False
+        self.set_registers(REG.LORA.FR_MSB, frf)
+        return True
 
     def get_pa_config(self, convert_dBm=False):
-        v = self.spi.xfer([REG.LORA.PA_CONFIG, 0])[1]
+        v = self.get_register(REG.LORA.PA_CONFIG)
         pa_select    = v >> 7
         max_power    = v >> 4 & 0b111
         output_power = v & 0b1111
@@ -314,7 +369,7 @@ class LoRa(object):
         current = self.get_pa_config()
         loc = {s: current[s] if loc[s] is None else loc[s] for s in loc}
         val = (loc['pa_select'] << 7) | (loc['max_power'] << 4) | (loc['output_power'])
-        return self.spi.xfer([REG.LORA.PA_CONFIG | 0x80, val])[1]
+        return self.set_register(REG.LORA.PA_CONFIG, val)
 
     @getter(REG.LORA.PA_RAMP)
     def get_pa_ramp(self, val):
@@ -325,7 +380,7 @@ class LoRa(object):
         return val & 0b1111
 
     def get_ocp(self, convert_mA=False):
-        v = self.spi.xfer([REG.LORA.OCP, 0])[1]
+        v = self.get_register(REG.LORA.OCP)
         ocp_on = v >> 5 & 0x01
         ocp_trim = v & 0b11111
         if convert_mA:
@@ -342,16 +397,16 @@ class LoRa(object):
 
     def set_ocp_trim(self, I_mA):
         assert(I_mA >= 45 and I_mA <= 240)
-        ocp_on = self.spi.xfer([REG.LORA.OCP, 0])[1] >> 5 & 0x01
+        ocp_on = self.get_register(REG.LORA.OCP) >> 5 & 0x01
         if I_mA <= 120:
             v = int(round((I_mA-45.)/5.))
         else:
             v = int(round((I_mA+30.)/10.))
         v = set_bit(v, 5, ocp_on)
-        return self.spi.xfer([REG.LORA.OCP | 0x80, v])[1]
+        return self.set_register(REG.LORA.OCP, v)
 
     def get_lna(self):
-        v = self.spi.xfer([REG.LORA.LNA, 0])[1]
+        v = self.get_register(REG.LORA.LNA)
         return dict(
                 lna_gain     = v >> 5,
                 lna_boost_lf = v >> 3 & 0b11,
@@ -368,7 +423,7 @@ class LoRa(object):
         current = self.get_lna()
         loc = {s: current[s] if loc[s] is None else loc[s] for s in loc}
         val = (loc['lna_gain'] << 5) | (loc['lna_boost_lf'] << 3) | (loc['lna_boost_hf'])
-        retval = self.spi.xfer([REG.LORA.LNA | 0x80, val])[1]
+        retval = self.set_register(REG.LORA.LNA, val)
         if lna_gain is not None:
             # agc_auto_on must track lna_gain: GAIN=NOT_USED -> agc_auto=ON, otherwise =OFF
             self.set_agc_auto_on(lna_gain == GAIN.NOT_USED)
@@ -378,31 +433,31 @@ class LoRa(object):
         self.set_lna(lna_gain=lna_gain)
 
     def get_fifo_addr_ptr(self):
-        return self.spi.xfer([REG.LORA.FIFO_ADDR_PTR, 0])[1]
+        return self.get_register(REG.LORA.FIFO_ADDR_PTR)
 
     def set_fifo_addr_ptr(self, ptr):
-        return self.spi.xfer([REG.LORA.FIFO_ADDR_PTR | 0x80, ptr])[1]
+        return self.set_register(REG.LORA.FIFO_ADDR_PTR, ptr)
 
     def get_fifo_tx_base_addr(self):
-        return self.spi.xfer([REG.LORA.FIFO_TX_BASE_ADDR, 0])[1]
+        return self.get_register(REG.LORA.FIFO_TX_BASE_ADDR)
 
     def set_fifo_tx_base_addr(self, ptr):
-        return self.spi.xfer([REG.LORA.FIFO_TX_BASE_ADDR | 0x80, ptr])[1]
+        return self.set_register(REG.LORA.FIFO_TX_BASE_ADDR, ptr)
 
     def get_fifo_rx_base_addr(self):
-        return self.spi.xfer([REG.LORA.FIFO_RX_BASE_ADDR, 0])[1]
+        return self.get_register(REG.LORA.FIFO_RX_BASE_ADDR)
 
     def set_fifo_rx_base_addr(self, ptr):
-        return self.spi.xfer([REG.LORA.FIFO_RX_BASE_ADDR | 0x80, ptr])[1]
+        return self.set_register(REG.LORA.FIFO_RX_BASE_ADDR, ptr)
 
     def get_fifo_rx_current_addr(self):
-        return self.spi.xfer([REG.LORA.FIFO_RX_CURR_ADDR, 0])[1]
+        return self.get_register(REG.LORA.FIFO_RX_CURR_ADDR)
 
     def get_fifo_rx_byte_addr(self):
-        return self.spi.xfer([REG.LORA.FIFO_RX_BYTE_ADDR, 0])[1]
+        return self.get_register(REG.LORA.FIFO_RX_BYTE_ADDR)
 
     def get_irq_flags_mask(self):
-        v = self.spi.xfer([REG.LORA.IRQ_FLAGS_MASK, 0])[1]
+        v = self.get_register(REG.LORA.IRQ_FLAGS_MASK)
         return dict(
                 rx_timeout     = v >> 7 & 0x01,
                 rx_done        = v >> 6 & 0x01,
@@ -418,16 +473,16 @@ class LoRa(object):
                            rx_timeout=None, rx_done=None, crc_error=None, valid_header=None, tx_done=None,
                            cad_done=None, fhss_change_ch=None, cad_detected=None):
         loc = locals()
-        v = self.spi.xfer([REG.LORA.IRQ_FLAGS_MASK, 0])[1]
+        v = self.get_register(REG.LORA.IRQ_FLAGS_MASK)
         for i, s in enumerate(['cad_detected', 'fhss_change_ch', 'cad_done', 'tx_done', 'valid_header',
                                'crc_error', 'rx_done', 'rx_timeout']):
             this_bit = locals()[s]
             if this_bit is not None:
                 v = set_bit(v, i, this_bit)
-        return self.spi.xfer([REG.LORA.IRQ_FLAGS_MASK | 0x80, v])[1]
+        return self.set_register(REG.LORA.IRQ_FLAGS_MASK, v)
 
     def get_irq_flags(self):
-        v = self.spi.xfer([REG.LORA.IRQ_FLAGS, 0])[1]
+        v = self.get_register(REG.LORA.IRQ_FLAGS)
         return dict(
                 rx_timeout     = v >> 7 & 0x01,
                 rx_done        = v >> 6 & 0x01,
@@ -442,13 +497,13 @@ class LoRa(object):
     def set_irq_flags(self,
                       rx_timeout=None, rx_done=None, crc_error=None, valid_header=None, tx_done=None,
                       cad_done=None, fhss_change_ch=None, cad_detected=None):
-        v = self.spi.xfer([REG.LORA.IRQ_FLAGS, 0])[1]
+        v = self.get_register(REG.LORA.IRQ_FLAGS)
         for i, s in enumerate(['cad_detected', 'fhss_change_ch', 'cad_done', 'tx_done', 'valid_header',
                                'crc_error', 'rx_done', 'rx_timeout']):
             this_bit = locals()[s]
             if this_bit is not None:
                 v = set_bit(v, i, this_bit)
-        return self.spi.xfer([REG.LORA.IRQ_FLAGS | 0x80, v])[1]
+        return self.set_register(REG.LORA.IRQ_FLAGS, v)
 
     def clear_irq_flags(self,
                         RxTimeout=None, RxDone=None, PayloadCrcError=None, 
@@ -461,22 +516,22 @@ class LoRa(object):
             this_bit = locals()[s]
             if this_bit is not None:
                 v = set_bit(v, eval('MASK.IRQ_FLAGS.' + s), this_bit)
-        return self.spi.xfer([REG.LORA.IRQ_FLAGS | 0x80, v])[1]
+        return self.set_register(REG.LORA.IRQ_FLAGS, v)
 
 
     def get_rx_nb_bytes(self):
-        return self.spi.xfer([REG.LORA.RX_NB_BYTES, 0])[1]
+        return self.get_register(REG.LORA.RX_NB_BYTES)
 
     def get_rx_header_cnt(self):
-        msb, lsb = self.spi.xfer([REG.LORA.RX_HEADER_CNT_MSB, 0, 0])[1:]
+        msb, lsb = self.get_registers(REG.LORA.RX_HEADER_CNT_MSB, 2)
         return lsb + 256 * msb
 
     def get_rx_packet_cnt(self):
-        msb, lsb = self.spi.xfer([REG.LORA.RX_PACKET_CNT_MSB, 0, 0])[1:]
+        msb, lsb = self.get_registers(REG.LORA.RX_PACKET_CNT_MSB, 2)
         return lsb + 256 * msb
 
     def get_modem_status(self):
-        status = self.spi.xfer([REG.LORA.MODEM_STAT, 0])[1]
+        status = self.get_register(REG.LORA.MODEM_STAT)
         return dict(
                 rx_coding_rate    = status >> 5 & 0x03,
                 modem_clear       = status >> 4 & 0x01,
@@ -487,19 +542,19 @@ class LoRa(object):
             )
 
     def get_pkt_snr_value(self):
-        v = self.spi.xfer([REG.LORA.PKT_SNR_VALUE, 0])[1]
+        v = self.get_register(REG.LORA.PKT_SNR_VALUE)
         return float(256-v) / 4.
 
     def get_pkt_rssi_value(self):
-        v = self.spi.xfer([REG.LORA.PKT_RSSI_VALUE, 0])[1]
+        v = self.get_register(REG.LORA.PKT_RSSI_VALUE)
         return v - 157
 
     def get_rssi_value(self):
-        v = self.spi.xfer([REG.LORA.RSSI_VALUE, 0])[1]
+        v = self.get_register(REG.LORA.RSSI_VALUE)
         return v - 157
 
     def get_hop_channel(self):
-        v = self.spi.xfer([REG.LORA.HOP_CHANNEL, 0])[1]
+        v = self.get_register(REG.LORA.HOP_CHANNEL)
         return dict(
                 pll_timeout          = v >> 7,
                 crc_on_payload       = v >> 6 & 0x01,
@@ -507,7 +562,7 @@ class LoRa(object):
             )
 
     def get_modem_config_1(self):
-        val = self.spi.xfer([REG.LORA.MODEM_CONFIG_1, 0])[1]
+        val = self.get_register(REG.LORA.MODEM_CONFIG_1)
         return dict(
                 bw = val >> 4 & 0x0F,
                 coding_rate = val >> 1 & 0x07,
@@ -519,7 +574,7 @@ class LoRa(object):
         current = self.get_modem_config_1()
         loc = {s: current[s] if loc[s] is None else loc[s] for s in loc}
         val = loc['implicit_header_mode'] | (loc['coding_rate'] << 1) | (loc['bw'] << 4)
-        return self.spi.xfer([REG.LORA.MODEM_CONFIG_1 | 0x80, val])[1]
+        return self.set_register(REG.LORA.MODEM_CONFIG_1, val)
 
     def set_bw(self, bw):
         """ Set the bandwidth 0=7.8kHz ... 9=500kHz
@@ -539,7 +594,7 @@ class LoRa(object):
         self.set_modem_config_1(implicit_header_mode=implicit_header_mode)
         
     def get_modem_config_2(self, include_symb_timout_lsb=False):
-        val = self.spi.xfer([REG.LORA.MODEM_CONFIG_2, 0])[1]
+        val = self.get_register(REG.LORA.MODEM_CONFIG_2)
         d = dict(
                 spreading_factor = val >> 4 & 0x0F,
                 tx_cont_mode = val >> 3 & 0x01,
@@ -555,7 +610,7 @@ class LoRa(object):
         current = self.get_modem_config_2(include_symb_timout_lsb=True)
         loc = {s: current[s] if loc[s] is None else loc[s] for s in loc}
         val = (loc['spreading_factor'] << 4) | (loc['tx_cont_mode'] << 3) | (loc['rx_crc'] << 2) | current['symb_timout_lsb']
-        return self.spi.xfer([REG.LORA.MODEM_CONFIG_2 | 0x80, val])[1]
+        return self.set_register(REG.LORA.MODEM_CONFIG_2, val)
 
     def set_spreading_factor(self, spreading_factor):
         self.set_modem_config_2(spreading_factor=spreading_factor)
@@ -564,7 +619,7 @@ class LoRa(object):
         self.set_modem_config_2(rx_crc=rx_crc)
 
     def get_modem_config_3(self):
-        val = self.spi.xfer([REG.LORA.MODEM_CONFIG_3, 0])[1]
+        val = self.get_register(REG.LORA.MODEM_CONFIG_3)
         return dict(
                 low_data_rate_optim = val >> 3 & 0x01,
                 agc_auto_on = val >> 2 & 0x01
@@ -575,7 +630,7 @@ class LoRa(object):
         current = self.get_modem_config_3()
         loc = {s: current[s] if loc[s] is None else loc[s] for s in loc}
         val = (loc['low_data_rate_optim'] << 3) | (loc['agc_auto_on'] << 2)
-        return self.spi.xfer([REG.LORA.MODEM_CONFIG_3 | 0x80, val])[1]
+        return self.set_register(REG.LORA.MODEM_CONFIG_3, val)
 
     @setter(REG.LORA.INVERT_IQ)
     def set_invert_iq(self, invert):
@@ -604,31 +659,59 @@ class LoRa(object):
     def set_low_data_rate_optim(self, low_data_rate_optim):
         self.set_modem_config_3(low_data_rate_optim=low_data_rate_optim)
 
+    def set_modem_config(self, config):
+        """ Set MODEM_CONFIG_1..3 from precomputed words, e.g. from a ChannelPlan. The SymbTimeout MSB, TxContinuousMode
+            and AgcAutoOn bits keep their current values.
+        :param config: (MODEM_CONFIG_1, MODEM_CONFIG_2, MODEM_CONFIG_3)
+        :return: Number of SPI writes
+        :rtype: int
+        """
+        current_2 = self.get_register(REG.LORA.MODEM_CONFIG_2)
+        current_3 = self.get_register(REG.LORA.MODEM_CONFIG_3)
+        values = [config[0], (config[1] & 0xF4) | (current_2 & 0x0B)]
+        writes = 0
+        if self.shadow[REG.LORA.MODEM_CONFIG_1:REG.LORA.MODEM_CONFIG_1 + 2] != values:
+            self.set_registers(REG.LORA.MODEM_CONFIG_1, values)
+            writes += 1
+        value = (config[2] & 0x08) | (current_3 & 0xF7)
+        if value != current_3:
+            self.set_register(REG.LORA.MODEM_CONFIG_3, value)
+            writes += 1
+        return writes
+
     def get_symb_timeout(self):
         SYMB_TIMEOUT_MSB = REG.LORA.MODEM_CONFIG_2
-        msb, lsb = self.spi.xfer([SYMB_TIMEOUT_MSB, 0, 0])[1:]    # the MSB bits are stored in REG.LORA.MODEM_CONFIG_2
+        msb, lsb = self.get_registers(SYMB_TIMEOUT_MSB, 2)    # the MSB bits are stored in REG.LORA.MODEM_CONFIG_2
         msb = msb & 0b11
         return lsb + 256 * msb
 
     def set_symb_timeout(self, timeout):
-        bkup_reg_modem_config_2 = self.spi.xfer([REG.LORA.MODEM_CONFIG_2, 0])[1]
+        bkup_reg_modem_config_2 = self.get_register(REG.LORA.MODEM_CONFIG_2)
         msb = timeout >> 8 & 0b11    # bits 8-9
         lsb = timeout - 256 * msb    # bits 0-7
         reg_modem_config_2 = bkup_reg_modem_config_2 & 0xFC | msb    # bits 2-7 of bkup_reg_modem_config_2 ORed with the two msb bits
-        old_msb = self.spi.xfer([REG.LORA.MODEM_CONFIG_2  | 0x80, reg_modem_config_2])[1] & 0x03
-        old_lsb = self.spi.xfer([REG.LORA.SYMB_TIMEOUT_LSB | 0x80, lsb])[1]
+        old_msb = self.set_register(REG.LORA.MODEM_CONFIG_2, reg_modem_config_2) & 0x03
+        old_lsb = self.set_register(REG.LORA.SYMB_TIMEOUT_LSB, lsb)
         return old_lsb + 256 * old_msb
 
     def get_preamble(self):
-        msb, lsb = self.spi.xfer([REG.LORA.PREAMBLE_MSB, 0, 0])[1:]
+        msb, lsb = self.get_registers(REG.LORA.PREAMBLE_MSB, 2)
         return lsb + 256 * msb
 
     def set_preamble(self, preamble):
         msb = preamble >> 8
         lsb = preamble - msb * 256
-        old_msb, old_lsb = self.spi.xfer([REG.LORA.PREAMBLE_MSB | 0x80, msb, lsb])[1:]
+        old_msb, old_lsb = self.set_registers(REG.LORA.PREAMBLE_MSB, [msb, lsb])
         return old_lsb + 256 * old_msb
         
+    def get_time_on_air(self, payload_length):
+        """ Time on air of a payload with the current modem settings
+        :param payload_length: Bytes
+        :return: Seconds
+        :rtype: float
+        """
+        return time_on_air_cache.get(modem_config_from_lora(self), payload_length)
+
     @getter(REG.LORA.PAYLOAD_LENGTH)
     def get_payload_length(self, val):
         return val
@@ -654,7 +737,7 @@ class LoRa(object):
         return hop_period
 
     def get_fei(self):
-        msb, mid, lsb = self.spi.xfer([REG.LORA.FEI_MSB, 0, 0, 0])[1:]
+        msb, mid, lsb = self.get_registers(REG.LORA.FEI_MSB, 3)
         msb &= 0x0F
         freq_error = lsb + 256 * (mid + 256 * msb)
         return freq_error
@@ -864,7 +947,7 @@ class LoRa(object):
         values = self.get_all_registers()
         skip_set = set([REG.LORA.FIFO])
         result_list = []
-        for i, s in REG.LORA.lookup.iteritems():
+        for i, s in REG.LORA.lookup.items():
             if i in skip_set:
                 continue
             v = values[i]
@@ -872,15 +955,77 @@ class LoRa(object):
         return result_list
 
     def get_register(self, register_address):
-        return self.spi.xfer([register_address & 0x7F, 0])[1]
+        return self.get_registers(register_address, 1)[0]
 
     def set_register(self, register_address, val):
-        return self.spi.xfer([register_address | 0x80, val])[1]
+        return self.set_registers(register_address, [val])[0]
+
+    def get_registers(self, register_address, n):
+        """ Read n consecutive registers. Configuration registers are served from the shadow when all of them are
+            known, volatile registers always go to the chip.
+        :param register_address: Address of the first register
+        :param n: Number of registers
+        :return: Register values
+        :rtype: list[int]
+        """
+        register_address &= 0x7F
+        values = self.shadow[register_address:register_address + n]
+        if None not in values and len(values) == n and \
+                self.VOLATILE_REGISTERS.isdisjoint(range(register_address, register_address + n)):
+            return values
+        values = self.spi.xfer([register_address] + [0] * n)[1:]
+        self.update_shadow(register_address, values)
+        return values
+
+    def set_registers(self, register_address, values):
+        """ Write consecutive registers in one burst and keep the shadow in sync.
+        :param register_address: Address of the first register
+        :param values: Register values
+        :return: Values returned by the chip during the write
+        :rtype: list[int]
+        """
+        register_address &= 0x7F
+        retval = self.spi.xfer([register_address | 0x80] + list(values))[1:]
+        self.update_shadow(register_address, values)
+        return retval
+
+    def update_shadow(self, register_address, values):
+        if self.shadow is None or self.mode is None or not self.mode & 0x80:
+            return
+        for i, v in enumerate(values, register_address):
+            if i not in self.VOLATILE_REGISTERS:
+                self.shadow[i] = v
+
+    def invalidate_shadow(self):
+        """ Forget all shadowed register values, e.g. after the chip was reset. """
+        self.shadow = [None] * 0x80
+
+    def apply_profile(self, profile):
+        """ Configure the radio from a precomputed RadioProfile. Each run of contiguous registers is written with one
+            burst transfer, and only the part of a run that differs from the register shadow is sent.
+        :param profile: RadioProfile
+        :return: Number of SPI transfers used
+        :rtype: int
+        """
+        assert self.mode == MODE.SLEEP or self.mode == MODE.STDBY or self.mode == MODE.FSK_STDBY
+        transfers = 0
+        for register_address, values in profile.bursts:
+            current = self.shadow[register_address:register_address + len(values)]
+            changed = [i for i, v in enumerate(values) if current[i] != v]
+            if not changed:
+                continue
+            first, last = changed[0], changed[-1] + 1
+            self.set_registers(register_address + first, values[first:last])
+            transfers += 1
+        self.dio_mapping = list(profile.dio_mapping)
+        return transfers
 
     def get_all_registers(self):
         # read all registers
         reg = [0] + self.spi.xfer([1]+[0]*0x3E)[1:]
         self.mode = reg[1]
+        self.invalidate_shadow()
+        self.update_shadow(1, reg[1:])
         return reg
 
     def __del__(self):
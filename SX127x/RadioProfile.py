@@ -0,0 +1,92 @@
+""" Defines RadioProfile: a complete LoRa radio configuration precomputed into register bursts for LoRa.apply_profile(). """
+
+from .constants import *
+
+
+BW_HZ = [7.8e3, 10.4e3, 15.6e3, 20.8e3, 31.25e3, 41.7e3, 62.5e3, 125e3, 250e3, 500e3]
+
+
+class RadioProfile(object):
+    """ A radio configuration (frequency, SF, BW, CR, power, sync word, IQ inversion, DIO mapping, preamble, ...)
+        translated once into register values. The values are grouped into runs of contiguous registers so that
+        LoRa.apply_profile() can write each run with a single burst transfer.
+    """
+
+    def __init__(self, freq=868.1, spreading_factor=7, bw=BW.BW125, coding_rate=CODING_RATE.CR4_5,
+                 implicit_header_mode=0, rx_crc=1, pa_select=1, max_power=0x0F, output_power=0x0E, sync_word=0x34,
+                 invert_iq=0, dio_mapping=(0, 0, 0, 0, 0, 0), preamble=8, symb_timeout=0x64,
+                 low_data_rate_optim=None, agc_auto_on=1, payload_length=None, frf=None):
+        """ Compute the register values of the profile.
+        :param freq: Frequency in MHz (ignored when frf is given)
+        :param frf: Ready-made [msb, mid, lsb] frequency register bytes
+        :param low_data_rate_optim: None turns it on automatically for symbols longer than 16 ms
+        :param payload_length: Only written when not None (needed for implicit header mode)
+        """
+        self.params = dict(freq=freq, spreading_factor=spreading_factor, bw=bw, coding_rate=coding_rate,
+                           implicit_header_mode=implicit_header_mode, rx_crc=rx_crc, pa_select=pa_select,
+                           max_power=max_power, output_power=output_power, sync_word=sync_word, invert_iq=invert_iq,
+                           dio_mapping=tuple(dio_mapping), preamble=preamble, symb_timeout=symb_timeout,
+                           low_data_rate_optim=low_data_rate_optim, agc_auto_on=agc_auto_on,
+                           payload_length=payload_length, frf=frf)
+        if frf is None:
+            frf = self.freq_to_frf(freq)
+        if low_data_rate_optim is None:
+            low_data_rate_optim = (1 << spreading_factor) / BW_HZ[bw] > 0.016
+        self.dio_mapping = list(dio_mapping)
+
+        registers = {
+            REG.LORA.FR_MSB:           frf[0],
+            REG.LORA.FR_MID:           frf[1],
+            REG.LORA.FR_LSB:           frf[2],
+            REG.LORA.PA_CONFIG:        (pa_select << 7) | (max_power << 4) | output_power,
+            REG.LORA.MODEM_CONFIG_1:   (bw << 4) | (coding_rate << 1) | implicit_header_mode,
+            REG.LORA.MODEM_CONFIG_2:   (spreading_factor << 4) | (rx_crc << 2) | (symb_timeout >> 8 & 0b11),
+            REG.LORA.SYMB_TIMEOUT_LSB: symb_timeout & 0xFF,
+            REG.LORA.PREAMBLE_MSB:     preamble >> 8,
+            REG.LORA.PREAMBLE_MSB + 1: preamble & 0xFF,
+            REG.LORA.MODEM_CONFIG_3:   (int(low_data_rate_optim) << 3) | (agc_auto_on << 2),
+            REG.LORA.INVERT_IQ:        0x27 | (invert_iq & 0x01) << 6,
+            REG.LORA.SYNC_WORD:        sync_word,
+            REG.LORA.DIO_MAPPING_1:    (dio_mapping[0] & 0x03) << 6 | (dio_mapping[1] & 0x03) << 4 |
+                                       (dio_mapping[2] & 0x03) << 2 | dio_mapping[3] & 0x03,
+            REG.LORA.DIO_MAPPING_2:    (dio_mapping[4] & 0x03) << 6 | (dio_mapping[5] & 0x03) << 4,
+        }
+        if payload_length is not None:
+            registers[REG.LORA.PAYLOAD_LENGTH] = payload_length
+        self.registers = registers
+        self.bursts = self.group_bursts(registers)
+
+    @staticmethod
+    def freq_to_frf(freq):
+        """ Convert a frequency to the 3 FRF register bytes, exactly like LoRa.set_freq()
+        :param freq: Frequency in MHz
+        :return: [msb, mid, lsb]
+        :rtype: list[int]
+        """
+        i = int(freq * 16384.)
+        return [i >> 16 & 0xFF, i >> 8 & 0xFF, i & 0xFF]
+
+    @staticmethod
+    def group_bursts(registers):
+        """ Group register values into runs of contiguous addresses.
+        :param registers: dict register address -> value
+        :return: List of (first register address, [values]) tuples
+        :rtype: list[tuple]
+        """
+        bursts = []
+        for address in sorted(registers):
+            if bursts and bursts[-1][0] + len(bursts[-1][1]) == address:
+                bursts[-1][1].append(registers[address])
+            else:
+                bursts.append((address, [registers[address]]))
+        return bursts
+
+    def replace(self, **changes):
+        """ Return a new profile with some parameters changed, e.g. uplink.replace(invert_iq=1) for the RX windows.
+        :return: New RadioProfile
+        """
+        params = dict(self.params)
+        params.update(changes)
+        if 'freq' in changes and 'frf' not in changes:
+            params['frf'] = None
+        return RadioProfile(**params)
@@ -0,0 +1,149 @@
+""" Defines RxRing, a preallocated receive ring between the DIO0 interrupt and a pool of packet consumers. """
+
+import threading
+import traceback
+from array import array
+from collections import namedtuple
+
+
+RxPacket = namedtuple('RxPacket', ['payload', 'rssi', 'snr', 'timestamp'])
+
+
+class RxRing(object):
+    """ Single producer ring of fixed-size packet slots.
+
+        The producer (LoRa.drain_rx_fifo() in the DIO0 callback thread) only copies the FIFO into the next free slot
+        and advances head, it never waits for a consumer. When the ring is full the packet is dropped and counted in
+        overruns. Consumers take packets out in order, several consumer threads share the tail under their own lock.
+    """
+
+    def __init__(self, slots=64, slot_size=256):
+        """ Allocate the ring.
+        :param slots: Number of slots, rounded up to a power of two
+        :param slot_size: Bytes per slot, longer packets are truncated and counted
+        """
+        size = 1
+        while size < slots:
+            size <<= 1
+        self.size = size
+        self.mask = size - 1
+        self.slot_size = slot_size
+        self.buffers = [bytearray(slot_size) for i in range(size)]
+        self.lengths = array('H', [0]) * size
+        self.rssi = array('h', [0]) * size
+        self.snr = array('f', [0]) * size
+        self.timestamps = array('d', [0]) * size
+        self.head = 0                  # written by the producer only
+        self.tail = 0                  # written by consumers only, under tail_lock
+        self.tail_lock = threading.Lock()
+        self.ready = threading.Semaphore(0)
+        self.received = 0
+        self.overruns = 0
+        self.truncated = 0
+        self.crc_errors = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def put(self, payload, rssi, snr, timestamp):
+        """ Producer side: copy a packet into the next slot.
+        :return: False if the ring was full and the packet was dropped
+        :rtype: bool
+        """
+        head = self.head
+        used = head - self.tail
+        if used >= self.size:
+            self.overruns += 1
+            return False
+        slot = head & self.mask
+        n = len(payload)
+        if n > self.slot_size:
+            n = self.slot_size
+            self.truncated += 1
+        self.buffers[slot][:n] = payload[:n]
+        self.lengths[slot] = n
+        self.rssi[slot] = rssi
+        self.snr[slot] = snr
+        self.timestamps[slot] = timestamp
+        self.head = head + 1
+        self.received += 1
+        if used + 1 > self.high_water:
+            self.high_water = used + 1
+        self.ready.release()
+        return True
+
+    def get(self, timeout=None):
+        """ Consumer side: take the oldest packet.
+        :param timeout: Seconds to wait, None waits forever
+        :return: RxPacket, or None on timeout
+        """
+        if not self.ready.acquire(timeout=timeout):
+            return None
+        with self.tail_lock:
+            slot = self.tail & self.mask
+            packet = RxPacket(bytes(self.buffers[slot][:self.lengths[slot]]), self.rssi[slot], self.snr[slot],
+                              self.timestamps[slot])
+            self.tail += 1
+        return packet
+
+    def get_batch(self, max_packets, timeout=None):
+        """ Consumer side: wait for one packet, then take whatever else is ready up to max_packets.
+        :return: List of RxPacket, empty on timeout
+        """
+        packets = []
+        packet = self.get(timeout)
+        while packet is not None:
+            packets.append(packet)
+            if len(packets) >= max_packets:
+                break
+            packet = self.get(0)
+        return packets
+
+    def stats(self):
+        return dict(
+                received   = self.received,
+                pending    = len(self),
+                overruns   = self.overruns,
+                truncated  = self.truncated,
+                crc_errors = self.crc_errors,
+                high_water = self.high_water
+            )
+
+
+class RxConsumerPool(object):
+    """ Worker threads that take batches of packets from an RxRing and hand them to handler(list of RxPacket).
+        With more than one worker the handler must be thread safe, and batches may finish out of order, which a
+        frame counter check will see as replays. Keep one worker when decoding against a SessionStore.
+    """
+
+    def __init__(self, ring, handler, workers=1, batch=16):
+        self.ring = ring
+        self.handler = handler
+        self.batch = batch
+        self.running = False
+        self.errors = 0
+        self.threads = [threading.Thread(target=self.run, name='rx-consumer-%d' % i, daemon=True)
+                        for i in range(workers)]
+
+    def start(self):
+        self.running = True
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self.running = False
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def run(self):
+        while self.running:
+            packets = self.ring.get_batch(self.batch, timeout=0.1)
+            if not packets:
+                continue
+            try:
+                self.handler(packets)
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
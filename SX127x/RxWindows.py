@@ -0,0 +1,169 @@
+""" Defines RxWindowScheduler, which opens the class A RX1/RX2 receive windows after an uplink. """
+
+import math
+import threading
+import time
+from array import array
+
+from .constants import *
+from .RadioProfile import BW_HZ
+
+
+class JitterHistogram(object):
+    """ Histogram of window opening errors in microseconds (actual - target), with under/overflow bins. """
+
+    def __init__(self, bin_us=5, range_us=200):
+        self.bin_us = bin_us
+        self.range_us = range_us
+        self.counts = array('L', [0]) * (2 * range_us // bin_us + 2)
+        self.n = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, error_us):
+        i = int(math.floor((error_us + self.range_us) / self.bin_us)) + 1
+        self.counts[min(max(i, 0), len(self.counts) - 1)] += 1
+        self.n += 1
+        self.total += error_us
+        self.min = error_us if self.min is None else min(self.min, error_us)
+        self.max = error_us if self.max is None else max(self.max, error_us)
+
+    def bins(self):
+        """ List of (lower edge in us, count), the first and last bin are the under- and overflow """
+        edges = [-math.inf] + [-self.range_us + i * self.bin_us for i in range(len(self.counts) - 1)]
+        return list(zip(edges, self.counts))
+
+    def percentile(self, p):
+        """ Upper bin edge below which p percent of the samples lie """
+        if not self.n:
+            return None
+        needed = self.n * p / 100.
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= needed:
+                return math.inf if i == len(self.counts) - 1 else -self.range_us + i * self.bin_us
+        return math.inf
+
+    def within(self, limit_us=20):
+        """ Fraction of the samples within +-limit_us """
+        if not self.n:
+            return None
+        lo = int(math.floor((-limit_us + self.range_us) / self.bin_us)) + 1
+        hi = int(math.floor((limit_us + self.range_us) / self.bin_us)) + 1
+        return sum(self.counts[max(lo, 0):min(hi, len(self.counts) - 1)]) / float(self.n)
+
+    def stats(self):
+        return dict(
+                n      = self.n,
+                mean   = self.total / self.n if self.n else None,
+                min    = self.min,
+                max    = self.max,
+                p50    = self.percentile(50),
+                p99    = self.percentile(99),
+                within_20us = self.within(20)
+            )
+
+
+class RxWindowScheduler(object):
+    """ Class A receive windows. Call tx_done(), rx_done() and rx_timeout() from the LoRa object's on_tx_done(),
+        on_rx_done() and on_rx_timeout().
+
+        TxDone is timestamped with time.perf_counter(). A window thread then applies the precomputed RX1 profile
+        (frequency, data rate, inverted IQ and the symbol timeout for the window), sleeps until just before the window
+        and spins for the last part, and puts the radio into RXSINGLE at tx_done + rx1_delay. The measured latency of
+        the mode change is subtracted from the next wake-up. If RX1 times out the same happens for RX2. The opening
+        error of every window goes into jitter[1] and jitter[2].
+    """
+
+    SPIN = 0.002            # seconds spent busy-waiting before a window instead of sleeping
+    MIN_SYMBOLS = 6         # symbols the radio needs to detect a preamble
+
+    def __init__(self, lora, on_downlink, rx1_delay=1.0, rx2_delay=None, margin=0.0005):
+        """ Create the scheduler.
+        :param lora: LoRa object
+        :param on_downlink: Called as on_downlink(payload, window) with window 1 or 2, or on_downlink(None, None)
+        :param rx1_delay: RECEIVE_DELAY1 or JOIN_ACCEPT_DELAY1 in seconds
+        :param rx2_delay: Default rx1_delay + 1
+        :param margin: Timing uncertainty in seconds the symbol timeout has to cover on both sides
+        """
+        self.lora = lora
+        self.on_downlink = on_downlink
+        self.rx1_delay = rx1_delay
+        self.rx2_delay = rx1_delay + 1.0 if rx2_delay is None else rx2_delay
+        self.margin = margin
+        self.profiles = None
+        self.tx_time = None
+        self.latency = 0.0
+        self.result = None
+        self.event = threading.Event()
+        self.jitter = {1: JitterHistogram(), 2: JitterHistogram()}
+        self.stats = dict(rx1=0, rx2=0, missed=0)
+
+    def window_profile(self, profile):
+        """ Precompute the profile of a receive window: RxDone on DIO0, RxTimeout on DIO1 and a symbol timeout that
+            covers the margin on both sides of the window.
+        """
+        params = profile.params
+        t_sym = (1 << params['spreading_factor']) / BW_HZ[params['bw']]
+        symb_timeout = min(1023, self.MIN_SYMBOLS + int(math.ceil(2 * self.margin / t_sym)))
+        return profile.replace(dio_mapping=[0, 0, 0, 0, 0, 0], symb_timeout=symb_timeout)
+
+    def arm(self, rx1_profile, rx2_profile):
+        """ Set the window profiles for the next uplink, e.g. from ChannelPlan.rx1() and rx2() """
+        self.profiles = {1: self.window_profile(rx1_profile), 2: self.window_profile(rx2_profile)}
+
+    def tx_done(self):
+        """ Call first thing in on_tx_done() """
+        self.tx_time = time.perf_counter()
+        self.lora.clear_irq_flags(TxDone=1)
+        threading.Thread(target=self.run, args=(self.tx_time, self.profiles), name='rx-windows', daemon=True).start()
+
+    def rx_done(self):
+        self.lora.clear_irq_flags(RxDone=1)
+        if self.lora.get_irq_flags()['crc_error']:
+            self.lora.clear_irq_flags(PayloadCrcError=1)
+            self.result = None
+        else:
+            self.result = bytes(self.lora.read_payload(nocheck=True))
+        self.event.set()
+
+    def rx_timeout(self):
+        self.lora.clear_irq_flags(RxTimeout=1)
+        self.result = None
+        self.event.set()
+
+    def run(self, tx_time, profiles):
+        for window, delay in ((1, self.rx1_delay), (2, self.rx2_delay)):
+            profile = profiles[window]
+            self.lora.set_mode(MODE.STDBY)
+            self.lora.apply_profile(profile)
+            self.lora.reset_ptr_rx()
+            self.event.clear()
+            self.result = None
+            self.open_window(window, tx_time + delay)
+            # RxDone or RxTimeout ends the window, the timeout is a fallback for a lost interrupt
+            t_sym = (1 << profile.params['spreading_factor']) / BW_HZ[profile.params['bw']]
+            self.event.wait(profile.params['symb_timeout'] * t_sym + 4.0)
+            if self.result is not None:
+                self.stats['rx%d' % window] += 1
+                self.on_downlink(self.result, window)
+                return
+        self.stats['missed'] += 1
+        self.lora.set_mode(MODE.STDBY)
+        self.on_downlink(None, None)
+
+    def open_window(self, window, target):
+        wake = target - self.latency
+        remaining = wake - time.perf_counter()
+        if remaining > self.SPIN:
+            time.sleep(remaining - self.SPIN)
+        while time.perf_counter() < wake:
+            pass
+        before = time.perf_counter()
+        self.lora.set_mode(MODE.RXSINGLE)
+        opened = time.perf_counter()
+        # the window opens when the OP_MODE write completes, keep a running estimate of how long that takes
+        self.latency += ((opened - before) - self.latency) / 8.
+        self.jitter[window].add((opened - target) * 1e6)
@@ -0,0 +1,403 @@
+""" Defines a simulated BOARD with a software SX127x, so the driver and the scripts run without a Raspberry Pi.
+
+    Select it with the environment variable SX127X_BOARD=sim. SX127X_SIM_SPEED (default 1) runs airtime and timeouts
+    that many times faster, SX127X_SIM_LOSS (default 0) is the probability an injected packet is lost and
+    SX127X_SIM_SEED seeds the loss model.
+"""
+
+import heapq
+import os
+import random
+import threading
+import time
+
+from .constants import *
+from .RadioProfile import RadioProfile, BW_HZ
+from .TimeOnAir import time_on_air
+
+# IRQ_FLAGS bits
+RX_TIMEOUT   = 0x80
+RX_DONE      = 0x40
+CRC_ERROR    = 0x20
+VALID_HEADER = 0x10
+TX_DONE      = 0x08
+CAD_DONE     = 0x04
+FHSS_CHANGE  = 0x02
+CAD_DETECTED = 0x01
+
+# OP_MODE low bits
+SLEEP, STDBY, FSTX, TX, FSRX, RXCONT, RXSINGLE, CAD = range(8)
+
+
+class SimPacket(object):
+    """ A packet on the simulated air. None parameters of an injected packet match any receiver setting. """
+
+    __slots__ = ('payload', 'freq', 'sf', 'bw', 'cr', 'invert_iq', 'rssi', 'snr', 'crc_error', 'start', 'end',
+                 'detected')
+
+    def __init__(self, payload, freq=None, sf=None, bw=None, cr=None, invert_iq=None, rssi=-60, snr=7.0,
+                 crc_error=False):
+        self.payload = bytes(payload)
+        self.freq = freq
+        self.sf = sf
+        self.bw = bw
+        self.cr = cr
+        self.invert_iq = invert_iq
+        self.rssi = rssi
+        self.snr = snr
+        self.crc_error = crc_error
+        self.start = None
+        self.end = None
+        self.detected = False
+
+    def __repr__(self):
+        return "SimPacket(%s, freq=%s, sf=%s, bw=%s, invert_iq=%s)" % (
+            self.payload.hex(), self.freq, self.sf, self.bw, self.invert_iq)
+
+
+class SimRadio(object):
+    """ Software model of an SX127x behind its SPI: a flat register file with burst auto-increment, the 256 byte FIFO,
+        write-1-to-clear IRQ flags with IRQ_FLAGS_MASK, DIO0..3 lines raised on the rising edge of their mapped flag,
+        TX/RXCONT/RXSINGLE/CAD modes with simulated airtime, and packet injection with configurable loss.
+        It also stands in for the spidev.SpiDev object (open, close, xfer).
+
+        Events run on a scheduler thread, which calls the DIO callbacks just like the RPi.GPIO threads do.
+    """
+
+    RESET = {
+        0x01: 0x09, 0x06: 0x6C, 0x07: 0x80, 0x08: 0x00, 0x09: 0x4F, 0x0A: 0x09, 0x0B: 0x2B, 0x0C: 0x20,
+        0x0E: 0x80, 0x0F: 0x00, 0x1D: 0x72, 0x1E: 0x70, 0x1F: 0x64, 0x21: 0x08, 0x22: 0x01, 0x23: 0xFF,
+        0x26: 0x04, 0x31: 0xC3, 0x33: 0x27, 0x37: 0x0A, 0x39: 0x12, 0x3B: 0x82, 0x42: 0x12, 0x4B: 0x09, 0x4D: 0x84,
+    }
+    READ_ONLY = frozenset([0x10, 0x13, 0x14, 0x15, 0x16, 0x17, 0x18, 0x19, 0x1A, 0x1B, 0x1C, 0x25, 0x28, 0x29, 0x2A,
+                           0x42])
+    DIO_PINS = {22: 0, 23: 1, 24: 2, 25: 3}
+    PREAMBLE_DETECT = 4     # symbols into the preamble at which the receiver has to be listening
+
+    def __init__(self, speed=1.0, loss=0.0, crc_error_rate=0.0, seed=None):
+        """ Power on the simulated chip.
+        :param speed: Run airtime and timeouts this many times faster than real time
+        :param loss: Probability an injected packet is not received at all
+        :param crc_error_rate: Probability an injected packet is received with a payload CRC error
+        :param seed: Seed of the loss model
+        """
+        self.speed = speed
+        self.loss = loss
+        self.crc_error_rate = crc_error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.cond = threading.Condition(self.lock)
+        self.callbacks = {}
+        self.listeners = []
+        self.transmitted = []
+        self.events = []
+        self.sequence = 0
+        self.generation = 0
+        self.thread = None
+        self.xfers = 0
+        self.stats = dict(transmitted=0, received=0, lost=0, crc_errors=0, missed=0, rx_timeouts=0)
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.regs = [0] * 0x80
+            for address, value in self.RESET.items():
+                self.regs[address] = value
+            self.fifo = bytearray(256)
+            self.generation += 1
+
+    # spidev.SpiDev interface
+
+    def open(self, spi_bus, spi_cs):
+        pass
+
+    def close(self):
+        pass
+
+    def xfer(self, data):
+        with self.lock:
+            self.xfers += 1
+            address = data[0] & 0x7F
+            write = data[0] & 0x80
+            regs = self.regs
+            out = [0]
+            for value in data[1:]:
+                if address == REG.LORA.FIFO:
+                    ptr = regs[REG.LORA.FIFO_ADDR_PTR]
+                    out.append(self.fifo[ptr])
+                    if write:
+                        self.fifo[ptr] = value
+                    regs[REG.LORA.FIFO_ADDR_PTR] = (ptr + 1) & 0xFF
+                    continue
+                out.append(regs[address])
+                if write:
+                    self.write_register(address, value & 0xFF)
+                address = (address + 1) & 0x7F
+            return out
+
+    xfer2 = xfer
+
+    def write_register(self, address, value):
+        if address == REG.LORA.IRQ_FLAGS:
+            self.regs[address] &= ~value & 0xFF
+        elif address == REG.LORA.OP_MODE:
+            self.set_mode(value)
+        elif address == REG.FSK.IMAGE_CAL:
+            # the calibration finishes instantly: ImageCalStart clears itself, ImageCalRunning stays 0
+            self.regs[address] = value & ~0x60
+        elif address not in self.READ_ONLY:
+            self.regs[address] = value
+
+    # Radio state
+
+    def get_mode(self):
+        return self.regs[REG.LORA.OP_MODE] & 0x07
+
+    def lora_mode(self):
+        return self.regs[REG.LORA.OP_MODE] & 0x80
+
+    def config(self):
+        regs = self.regs
+        return dict(
+                freq      = (regs[0x06] << 16 | regs[0x07] << 8 | regs[0x08]) / 16384.,
+                sf        = regs[REG.LORA.MODEM_CONFIG_2] >> 4,
+                bw        = regs[REG.LORA.MODEM_CONFIG_1] >> 4,
+                cr        = regs[REG.LORA.MODEM_CONFIG_1] >> 1 & 0x07,
+                implicit  = regs[REG.LORA.MODEM_CONFIG_1] & 0x01,
+                crc       = regs[REG.LORA.MODEM_CONFIG_2] >> 2 & 0x01,
+                preamble  = regs[REG.LORA.PREAMBLE_MSB] << 8 | regs[REG.LORA.PREAMBLE_MSB + 1],
+                ldro      = regs[REG.LORA.MODEM_CONFIG_3] >> 3 & 0x01,
+                invert_iq = regs[REG.LORA.INVERT_IQ] >> 6 & 0x01,
+                symb_timeout = (regs[REG.LORA.MODEM_CONFIG_2] & 0x03) << 8 | regs[REG.LORA.SYMB_TIMEOUT_LSB]
+            )
+
+    def symbol_time(self, config):
+        return (1 << config['sf']) / BW_HZ[config['bw']]
+
+    def set_mode(self, value):
+        old = self.get_mode()
+        self.regs[REG.LORA.OP_MODE] = value
+        self.generation += 1            # cancels a pending TxDone, RxTimeout or CadDone
+        if not value & 0x80:
+            return
+        mode = value & 0x07
+        config = self.config()
+        if mode == TX:
+            self.start_tx(config)
+        elif mode in (RXCONT, RXSINGLE):
+            if old not in (RXCONT, RXSINGLE):
+                self.regs[REG.LORA.FIFO_RX_BYTE_ADDR] = self.regs[REG.LORA.FIFO_RX_BASE_ADDR]
+            if mode == RXSINGLE:
+                self.schedule(config['symb_timeout'] * self.symbol_time(config), self.rx_timeout, self.generation)
+        elif mode == CAD:
+            self.schedule(2 * self.symbol_time(config), self.cad_done, self.generation)
+
+    def start_tx(self, config):
+        length = self.regs[REG.LORA.PAYLOAD_LENGTH]
+        base = self.regs[REG.LORA.FIFO_TX_BASE_ADDR]
+        payload = bytes(self.fifo[(base + i) & 0xFF] for i in range(length))
+        packet = SimPacket(payload, config['freq'], config['sf'], config['bw'], config['cr'], config['invert_iq'])
+        airtime = time_on_air(length, config['sf'], config['bw'], config['cr'], config['preamble'], config['crc'],
+                              config['implicit'], config['ldro'])
+        packet.start = time.monotonic()
+        self.schedule(airtime, self.tx_done, self.generation, packet)
+
+    def dio_levels(self):
+        flags = self.regs[REG.LORA.IRQ_FLAGS]
+        mapping = self.regs[REG.LORA.DIO_MAPPING_1]
+        dio0 = (RX_DONE, TX_DONE, CAD_DONE, 0)[mapping >> 6]
+        dio1 = (RX_TIMEOUT, FHSS_CHANGE, CAD_DETECTED, 0)[mapping >> 4 & 0x03]
+        dio3 = (CAD_DONE, VALID_HEADER, CRC_ERROR, 0)[mapping & 0x03]
+        return [bool(flags & dio0), bool(flags & dio1), bool(flags & FHSS_CHANGE), bool(flags & dio3)]
+
+    def set_irq(self, bits):
+        """ Set IRQ flags and return the DIO lines that went high. """
+        before = self.dio_levels()
+        self.regs[REG.LORA.IRQ_FLAGS] |= bits & ~self.regs[REG.LORA.IRQ_FLAGS_MASK]
+        after = self.dio_levels()
+        return [dio for dio in range(4) if after[dio] and not before[dio]]
+
+    # Events, these run on the scheduler thread with the lock held. They return the DIO lines to raise and
+    # functions to call once the lock is released.
+
+    def tx_done(self, packet):
+        packet.end = time.monotonic()
+        self.regs[REG.LORA.OP_MODE] = (self.regs[REG.LORA.OP_MODE] & 0xF8) | STDBY
+        self.generation += 1
+        self.transmitted.append(packet)
+        self.stats['transmitted'] += 1
+        return self.set_irq(TX_DONE), [lambda listener=listener: listener(packet) for listener in self.listeners]
+
+    def rx_timeout(self):
+        self.regs[REG.LORA.OP_MODE] = (self.regs[REG.LORA.OP_MODE] & 0xF8) | STDBY
+        self.generation += 1
+        self.stats['rx_timeouts'] += 1
+        return self.set_irq(RX_TIMEOUT), []
+
+    def cad_done(self):
+        self.regs[REG.LORA.OP_MODE] = (self.regs[REG.LORA.OP_MODE] & 0xF8) | STDBY
+        self.generation += 1
+        return self.set_irq(CAD_DONE), []
+
+    def receive_start(self, packet):
+        """ The receiver locks onto a packet only if it is listening on matching settings while the preamble is
+            detected. In RXSINGLE this also stops the symbol timeout. """
+        if self.lora_mode() and self.get_mode() in (RXCONT, RXSINGLE) and self.matches(packet, self.config()):
+            packet.detected = True
+            if self.get_mode() == RXSINGLE:
+                self.generation += 1
+        return [], []
+
+    def receive_end(self, packet):
+        packet.end = time.monotonic()
+        config = self.config()
+        if not packet.detected or not self.lora_mode() or self.get_mode() not in (RXCONT, RXSINGLE) or \
+                not self.matches(packet, config):
+            self.stats['missed'] += 1
+            return [], []
+        if self.random.random() < self.loss:
+            self.stats['lost'] += 1
+            return [], []
+        regs = self.regs
+        address = regs[REG.LORA.FIFO_RX_BYTE_ADDR]
+        for i, value in enumerate(packet.payload):
+            self.fifo[(address + i) & 0xFF] = value
+        regs[REG.LORA.FIFO_RX_CURR_ADDR] = address
+        regs[REG.LORA.FIFO_RX_BYTE_ADDR] = (address + len(packet.payload)) & 0xFF
+        regs[REG.LORA.RX_NB_BYTES] = len(packet.payload)
+        regs[REG.LORA.PKT_SNR_VALUE] = int(round(packet.snr * 4)) & 0xFF
+        regs[REG.LORA.PKT_RSSI_VALUE] = max(0, min(255, int(packet.rssi) + 157))
+        headers = (regs[0x14] << 8 | regs[0x15]) + 1
+        regs[0x14], regs[0x15] = headers >> 8 & 0xFF, headers & 0xFF
+        bits = RX_DONE | VALID_HEADER
+        if packet.crc_error or self.random.random() < self.crc_error_rate:
+            bits |= CRC_ERROR
+            self.stats['crc_errors'] += 1
+        else:
+            packets = (regs[0x16] << 8 | regs[0x17]) + 1
+            regs[0x16], regs[0x17] = packets >> 8 & 0xFF, packets & 0xFF
+            self.stats['received'] += 1
+        if self.get_mode() == RXSINGLE:
+            regs[REG.LORA.OP_MODE] = (regs[REG.LORA.OP_MODE] & 0xF8) | STDBY
+            self.generation += 1
+        return self.set_irq(bits), []
+
+    def matches(self, packet, config):
+        if packet.freq is not None and \
+                RadioProfile.freq_to_frf(packet.freq) != RadioProfile.freq_to_frf(config['freq']):
+            return False
+        for name in ('sf', 'bw', 'invert_iq'):
+            if getattr(packet, name) is not None and getattr(packet, name) != config[name]:
+                return False
+        return True
+
+    # Scheduler
+
+    def schedule(self, delay, func, generation=None, *args):
+        """ Run func(*args) after delay seconds of simulated time, unless generation is given and the radio has changed
+            mode since.
+        """
+        with self.cond:
+            self.sequence += 1
+            heapq.heappush(self.events, (time.monotonic() + delay / self.speed, self.sequence, generation, func, args))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='sx127x-sim', daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.events or self.events[0][0] > time.monotonic():
+                    self.cond.wait(self.events[0][0] - time.monotonic() if self.events else None)
+                due, sequence, generation, func, args = heapq.heappop(self.events)
+                if generation is not None and generation != self.generation:
+                    continue
+                edges, calls = func(*args)
+                callbacks = [(self.callbacks.get(dio), pin) for pin, dio in self.DIO_PINS.items() if dio in edges]
+            for callback, pin in callbacks:
+                if callback is not None:
+                    callback(pin)
+            for call in calls:
+                call()
+
+    # Air interface
+
+    def inject(self, payload, delay=0.0, **params):
+        """ Put a packet on the air. It starts after delay seconds and is received when its airtime is over, if the
+            radio was listening on matching settings when the preamble was detected and still is.
+        :param payload: Packet bytes
+        :param params: SimPacket parameters: freq (MHz), sf, bw, cr, invert_iq, rssi, snr, crc_error
+        :return: SimPacket
+        """
+        packet = SimPacket(payload, **params)
+        with self.lock:
+            config = self.config()
+        sf = packet.sf if packet.sf is not None else config['sf']
+        bw = packet.bw if packet.bw is not None else config['bw']
+        cr = packet.cr if packet.cr is not None else config['cr']
+        ldro = int((1 << sf) / BW_HZ[bw] > 0.016)
+        airtime = time_on_air(len(packet.payload), sf, bw, cr, low_data_rate_optim=ldro)
+        packet.start = time.monotonic() + delay / self.speed
+        self.schedule(delay + self.PREAMBLE_DETECT * (1 << sf) / BW_HZ[bw], self.receive_start, None, packet)
+        self.schedule(delay + airtime, self.receive_end, None, packet)
+        return packet
+
+    def add_listener(self, listener):
+        """ Call listener(SimPacket) from the scheduler thread after every transmitted packet. """
+        self.listeners.append(listener)
+
+
+class BOARD:
+    """ Board initialisation/teardown and pin configuration of the simulated board. The SimRadio is in BOARD.radio. """
+    DIO0 = 22
+    DIO1 = 23
+    DIO2 = 24
+    DIO3 = 25
+    LED  = 18
+    SWITCH = 4
+
+    radio = SimRadio(speed=float(os.environ.get('SX127X_SIM_SPEED', 1)),
+                     loss=float(os.environ.get('SX127X_SIM_LOSS', 0)),
+                     seed=os.environ.get('SX127X_SIM_SEED'))
+    spi = None
+    led = 0
+
+    @staticmethod
+    def setup():
+        BOARD.led_off()
+
+    @staticmethod
+    def teardown():
+        BOARD.spi.close()
+
+    @staticmethod
+    def SpiDev(spi_bus=0, spi_cs=0):
+        BOARD.spi = BOARD.radio
+        BOARD.spi.open(spi_bus, spi_cs)
+        return BOARD.spi
+
+    @staticmethod
+    def add_event_detect(dio_number, callback):
+        BOARD.radio.callbacks[SimRadio.DIO_PINS[dio_number]] = callback
+
+    @staticmethod
+    def add_events(cb_dio0, cb_dio1, cb_dio2, cb_dio3, cb_dio4, cb_dio5, switch_cb=None):
+        BOARD.add_event_detect(BOARD.DIO0, callback=cb_dio0)
+        BOARD.add_event_detect(BOARD.DIO1, callback=cb_dio1)
+        BOARD.add_event_detect(BOARD.DIO2, callback=cb_dio2)
+        BOARD.add_event_detect(BOARD.DIO3, callback=cb_dio3)
+
+    @staticmethod
+    def led_on(value=1):
+        BOARD.led = value
+        return value
+
+    @staticmethod
+    def led_off():
+        BOARD.led = 0
+        return 0
+
+    @staticmethod
+    def blink(time_sec, n_blink):
+        BOARD.led_off()
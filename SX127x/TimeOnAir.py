@@ -0,0 +1,82 @@
+""" Defines the LoRa time on air calculation and a cache of results per (modem config, payload length). """
+
+from collections import namedtuple, OrderedDict
+
+from .constants import *
+from .RadioProfile import BW_HZ
+
+
+ModemConfig = namedtuple('ModemConfig', ['spreading_factor', 'bw', 'coding_rate', 'preamble', 'implicit_header_mode',
+                                         'rx_crc', 'low_data_rate_optim'])
+
+
+def modem_config_from_registers(modem_config_1, modem_config_2, modem_config_3, preamble=8):
+    """ Build a ModemConfig from the MODEM_CONFIG_1..3 register values, e.g. a ChannelPlan lookup """
+    return ModemConfig(modem_config_2 >> 4 & 0x0F, modem_config_1 >> 4 & 0x0F, modem_config_1 >> 1 & 0x07, preamble,
+                       modem_config_1 & 0x01, modem_config_2 >> 2 & 0x01, modem_config_3 >> 3 & 0x01)
+
+
+def modem_config_from_profile(profile):
+    """ Build the ModemConfig of a RadioProfile """
+    registers = profile.registers
+    return modem_config_from_registers(registers[REG.LORA.MODEM_CONFIG_1], registers[REG.LORA.MODEM_CONFIG_2],
+                                       registers[REG.LORA.MODEM_CONFIG_3],
+                                       registers[REG.LORA.PREAMBLE_MSB] << 8 | registers[REG.LORA.PREAMBLE_MSB + 1])
+
+
+def modem_config_from_lora(lora):
+    """ Read the current ModemConfig of a LoRa object, served from its register shadow """
+    modem_config_1, modem_config_2 = lora.get_registers(REG.LORA.MODEM_CONFIG_1, 2)
+    return modem_config_from_registers(modem_config_1, modem_config_2, lora.get_register(REG.LORA.MODEM_CONFIG_3),
+                                       lora.get_preamble())
+
+
+def time_on_air(payload_length, sf, bw, cr=1, preamble=8, crc=1, implicit_header=0, low_data_rate_optim=0):
+    """ LoRa time on air (Semtech AN1200.13)
+    :param bw: BW register value 0..9
+    :param cr: Coding rate register value 1..4 (4/5..4/8)
+    :return: Seconds
+    :rtype: float
+    """
+    t_sym = (1 << sf) / BW_HZ[bw]
+    n = 8 * payload_length - 4 * sf + 28 + 16 * crc - 20 * implicit_header
+    d = 4 * (sf - 2 * low_data_rate_optim)
+    n_payload = 8 + max(-(-n // d) * (cr + 4), 0)
+    return (preamble + 4.25 + n_payload) * t_sym
+
+
+class TimeOnAirCache:
+    """ LRU cache of time_on_air() results keyed by (ModemConfig, payload length) """
+
+    def __init__(self, size = 4096):
+        self.size = size
+        self.results = OrderedDict()
+
+    def get(self, config, payload_length):
+        """ Time on air of a payload
+        :param config: ModemConfig
+        :param payload_length: Bytes
+        :return: Seconds
+        :rtype: float
+        """
+        key = (config, payload_length)
+        try:
+            airtime = self.results[key]
+            self.results.move_to_end(key)
+        except KeyError:
+            airtime = time_on_air(payload_length, config.spreading_factor, config.bw, config.coding_rate,
+                                  config.preamble, config.rx_crc, config.implicit_header_mode,
+                                  config.low_data_rate_optim)
+            self.results[key] = airtime
+            if len(self.results) > self.size:
+                self.results.popitem(last=False)
+        return airtime
+
+    def symbol_time(self, config):
+        return (1 << config.spreading_factor) / BW_HZ[config.bw]
+
+    def clear(self):
+        self.results.clear()
+
+
+time_on_air_cache = TimeOnAirCache()
@@ -20,11 +20,16 @@
 # <http://www.gnu.org/licenses/>.
 
 
-import RPi.GPIO as GPIO
-import spidev
-
+import os
 import time
 
+# SX127X_BOARD=sim replaces this board by the simulated one in SimBoard.py
+BOARD_TYPE = os.environ.get('SX127X_BOARD', 'rpi')
+
+if BOARD_TYPE == 'rpi':
+    import RPi.GPIO as GPIO
+    import spidev
+
 
 class BOARD:
     """ Board initialisation/teardown and pin configuration is kept here.
@@ -124,3 +129,7 @@ class BOARD:
             time.sleep(time_sec)
             BOARD.led_on()
         BOARD.led_off()
+
+
+if BOARD_TYPE == 'sim':
+    from .SimBoard import BOARD
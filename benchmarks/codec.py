@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+#
+# offline microbenchmarks for the LoRaWAN codec. every case is timed with
+# timeit and run once more under tracemalloc, results go out as json:
+#
+#   python3 benchmarks/codec.py [-o results.json] [-f filter]
+#
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Crypto.Cipher import AES
+import LoRaWAN
+from LoRaWAN.MHDR import MHDR
+from LoRaWAN.AES_CMAC import AES_CMAC, cmac_cache
+
+NWKEY = bytes(range(16))
+APPKEY = bytes(range(16, 32))
+DEVADDR = [0x26, 0x01, 0x11, 0x5F]
+DEVEUI = [0x00, 0x47, 0x64, 0xB1, 0xAB, 0xC6, 0x4F, 0x7C]
+APPEUI = [0x70, 0xB3, 0xD5, 0x7E, 0xF0, 0x00, 0x51, 0x34]
+DEVNONCE = [0x12, 0x34]
+SIZES = [0, 11, 51, 115, 222]
+DATA_TYPES = [('unconf_data_up', MHDR.UNCONF_DATA_UP), ('conf_data_up', MHDR.CONF_DATA_UP)]
+
+def data_frame(mtype, size):
+    lorawan = LoRaWAN.new(NWKEY, APPKEY)
+    lorawan.create(mtype, {'devaddr': DEVADDR, 'fcnt': 1, 'data': bytes(size)})
+    return lorawan.to_raw()
+
+def join_request_frame():
+    lorawan = LoRaWAN.new(APPKEY, APPKEY)
+    lorawan.create(MHDR.JOIN_REQUEST, {'deveui': DEVEUI, 'appeui': APPEUI, 'devnonce': DEVNONCE})
+    return lorawan.to_raw()
+
+def join_accept_frame(cflist):
+    clear = bytes([0x01, 0x02, 0x03, 0x13, 0x00, 0x00]) + bytes(reversed(DEVADDR)) + bytes([0x00, 0x01])
+    if cflist:
+        clear += bytes(16)
+    mic = AES_CMAC(APPKEY).mac(bytes([MHDR.JOIN_ACCEPT]) + clear)[:4]
+    return bytes([MHDR.JOIN_ACCEPT]) + AES.new(APPKEY, AES.MODE_ECB).decrypt(clear + mic)
+
+def reader(packet, nwkey = NWKEY, appkey = APPKEY):
+    def read():
+        lorawan = LoRaWAN.new(nwkey, appkey)
+        lorawan.read(packet)
+        return lorawan
+    return read
+
+def parsed(packet, nwkey = NWKEY, appkey = APPKEY):
+    return reader(packet, nwkey, appkey)()
+
+def cases():
+    for name, mtype in DATA_TYPES:
+        for size in SIZES:
+            packet = data_frame(mtype, size)
+            lorawan = parsed(packet)
+            yield '%s/read/%d' % (name, size), reader(packet)
+            yield '%s/valid_mic/%d' % (name, size), lorawan.valid_mic
+            yield '%s/get_payload/%d' % (name, size), lorawan.get_payload
+            yield '%s/create_to_raw/%d' % (name, size), (lambda mtype=mtype, size=size: data_frame(mtype, size))
+
+    packet = join_request_frame()
+    lorawan = parsed(packet, APPKEY, APPKEY)
+    yield 'join_request/read', reader(packet, APPKEY, APPKEY)
+    yield 'join_request/valid_mic', lorawan.valid_mic
+    yield 'join_request/create_to_raw', join_request_frame
+
+    for cflist in (False, True):
+        name = 'join_accept_cflist' if cflist else 'join_accept'
+        packet = join_accept_frame(cflist)
+        lorawan = parsed(packet, [], APPKEY)
+        lorawan.get_payload()
+        yield '%s/read' % name, reader(packet, [], APPKEY)
+        yield '%s/get_payload' % name, lorawan.get_payload
+        yield '%s/valid_mic' % name, lorawan.valid_mic
+        yield '%s/derive_nwskey' % name, lambda lorawan=lorawan: lorawan.derive_nwskey(DEVNONCE)
+        yield '%s/derive_appskey' % name, lambda lorawan=lorawan: lorawan.derive_appskey(DEVNONCE)
+
+    for size in (16, 32, 64, 256):
+        message = bytes(size)
+        yield 'aes_cmac/encode/%d' % size, lambda message=message: AES_CMAC().encode(NWKEY, message)
+        yield 'aes_cmac/encode_uncached/%d' % size, lambda message=message: (cmac_cache.clear(), AES_CMAC().encode(NWKEY, message))
+
+def measure(func, min_time):
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    while elapsed < min_time:
+        number *= 2
+        elapsed = timer.timeit(number)
+    best = min([elapsed] + timer.repeat(repeat=2, number=number)) / number
+
+    func()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1] - start
+    tracemalloc.stop()
+    del result
+    retained = sys.getallocatedblocks() - blocks
+
+    return dict(
+            ops_per_sec = 1.0 / best,
+            ns_per_op = best * 1e9,
+            peak_bytes_per_op = peak,
+            retained_blocks_per_op = retained
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="LoRaWAN codec microbenchmarks")
+    parser.add_argument('--output', '-o', help="Write the json results to this file instead of stdout")
+    parser.add_argument('--filter', '-f', default='', help="Only run cases whose name contains this string")
+    parser.add_argument('--min-time', '-t', type=float, default=0.2, help="Minimum timing run per case in seconds")
+    args = parser.parse_args()
+
+    results = {}
+    for name, func in cases():
+        if args.filter in name:
+            results[name] = measure(func, args.min_time)
+            sys.stderr.write("%-45s %12.0f ns/op\n" % (name, results[name]['ns_per_op']))
+
+    report = dict(
+            timestamp = time.time(),
+            python = platform.python_version(),
+            machine = platform.machine(),
+            results = results
+        )
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+#
+# compare two codec.py result files, exits with 1 when any case got slower
+# than the allowed threshold:
+#
+#   python3 benchmarks/compare.py base.json new.json [--threshold 10]
+#
+import argparse
+import json
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10.0, help="Allowed slowdown in percent. Default is 10.")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)['results']
+    with open(args.new) as f:
+        new = json.load(f)['results']
+
+    regressions = 0
+    for name in sorted(set(base) & set(new)):
+        before = base[name]['ns_per_op']
+        after = new[name]['ns_per_op']
+        change = (after - before) / before * 100.0
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print("%-45s %10.0f %10.0f %+7.1f%%%s" % (name, before, after, change, flag))
+    for name in sorted(set(base) ^ set(new)):
+        print("%-45s only in %s" % (name, args.base if name in base else args.new))
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# SX127x driver hot paths on the simulated board, no Raspberry Pi needed.
+# results go out as json like codec.py, with the SPI transfers per call added,
+# so benchmarks/compare.py works on them too:
+#
+#   python3 benchmarks/driver.py [-o results.json] [-f filter]
+#
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+os.environ['SX127X_BOARD'] = 'sim'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from codec import measure
+from SX127x.LoRa import LoRa, MODE
+from SX127x.board_config import BOARD
+from SX127x.ChannelPlan import EU868
+from SX127x.RadioProfile import RadioProfile
+from SX127x.RxRing import RxRing
+
+def cases(lora):
+    radio = BOARD.radio
+    uplink = RadioProfile(freq=868.1, dio_mapping=[1, 0, 0, 0, 0, 0])
+    rx_window = uplink.replace(invert_iq=1, dio_mapping=[0, 0, 0, 0, 0, 0])
+    lora.set_mode(MODE.STDBY)
+    lora.apply_profile(uplink)
+
+    yield 'driver/str', lambda: str(lora)
+    yield 'driver/set_freq', lambda: lora.set_freq(868.1)
+
+    channels = [EU868.uplink(channel, 5) for channel in range(2)]
+    hop = [0]
+    def set_channel():
+        hop[0] ^= 1
+        frf, config = channels[hop[0]]
+        lora.set_frf(frf)
+        lora.set_modem_config(config)
+    yield 'driver/set_frf_hop', set_channel
+
+    profiles = [uplink, rx_window]
+    def apply_profile():
+        hop[0] ^= 1
+        lora.apply_profile(profiles[hop[0]])
+    yield 'driver/apply_profile_changed', apply_profile
+    yield 'driver/apply_profile_unchanged', lambda: lora.apply_profile(uplink)
+
+    payload = bytes(range(51))
+    yield 'driver/write_payload/51', lambda: lora.write_payload(payload)
+
+    lora.set_mode(MODE.RXCONT)
+    radio.fifo[:51] = payload
+    radio.regs[0x13] = 51
+    yield 'driver/read_payload/51', lambda: lora.read_payload(nocheck=True)
+
+    ring = RxRing(16)
+    def drain():
+        radio.regs[0x12] = 0x50
+        lora.drain_rx_fifo(ring)
+        return ring.get(0)
+    yield 'driver/drain_rx_fifo/51', drain
+
+def main():
+    parser = argparse.ArgumentParser(description="SX127x driver benchmarks on the simulated board")
+    parser.add_argument('--output', '-o', help="Write the json results to this file instead of stdout")
+    parser.add_argument('--filter', '-f', default='', help="Only run cases whose name contains this string")
+    parser.add_argument('--min-time', '-t', type=float, default=0.2, help="Minimum timing run per case in seconds")
+    args = parser.parse_args()
+
+    BOARD.setup()
+    lora = LoRa(verbose=False)
+    results = {}
+    for name, func in cases(lora):
+        if args.filter in name:
+            func()
+            func()
+            xfers = BOARD.radio.xfers
+            func()
+            spi_xfers = BOARD.radio.xfers - xfers
+            results[name] = measure(func, args.min_time)
+            results[name]['spi_xfers_per_op'] = spi_xfers
+            sys.stderr.write("%-45s %12.0f ns/op %4d xfers\n" % (name, results[name]['ns_per_op'], spi_xfers))
+
+    report = dict(
+            timestamp = time.time(),
+            python = platform.python_version(),
+            machine = platform.machine(),
+            results = results
+        )
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
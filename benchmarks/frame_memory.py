@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+#
+# bytes held per decoded frame: N uplinks are read (and optionally decrypted)
+# and kept alive, tracemalloc reports what they cost.
+#
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import LoRaWAN
+from LoRaWAN.MHDR import MHDR
+
+NWKEY = bytes(range(16))
+APPKEY = bytes(range(16, 32))
+
+def frames(n, size):
+    raw = []
+    for i in range(n):
+        lorawan = LoRaWAN.new(NWKEY, APPKEY)
+        lorawan.create(MHDR.UNCONF_DATA_UP, {'devaddr': [0x26, 0x01, i >> 8 & 0xff, i & 0xff], 'fcnt': i, 'data': bytes(size)})
+        raw.append(lorawan.to_raw())
+    return raw
+
+def measure(raw, decrypt = False, lazy = False):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    decoded = []
+    for packet in raw:
+        lorawan = LoRaWAN.new(NWKEY, APPKEY)
+        lorawan.read(packet, lazy)
+        if decrypt:
+            lorawan.get_payload()
+        decoded.append(lorawan)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / len(raw)
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    raw = frames(n, 20)
+    print("read            %6.0f bytes/frame" % measure(raw))
+    print("read lazy       %6.0f bytes/frame" % measure(raw, lazy=True))
+    print("read+decrypt    %6.0f bytes/frame" % measure(raw, decrypt=True))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+#
+# decode throughput of BatchDecoder in this process against ShardedPipeline
+# with 1..N worker processes, on frames of many devices. results go out as
+# json like codec.py, ns_per_op is per frame:
+#
+#   python3 benchmarks/pipeline.py [-o results.json] [-w 4] [-n 100000]
+#
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import LoRaWAN
+from LoRaWAN.MHDR import MHDR
+from LoRaWAN.AES_CMAC import cmac_cache
+from LoRaWAN.BatchDecoder import BatchDecoder
+
+def traffic(devices, count):
+    sessions = [LoRaWAN.Session((0x26000000 + i).to_bytes(4, 'big'), os.urandom(16), os.urandom(16))
+                for i in range(devices)]
+    frames = []
+    for n in range(count):
+        session = sessions[n % devices]
+        lorawan = LoRaWAN.new(session.nwkey, session.appkey)
+        lorawan.create(MHDR.UNCONF_DATA_UP, {'devaddr': session.devaddr, 'fcnt': n // devices + 1, 'data': bytes(20)})
+        frames.append(lorawan.to_raw())
+    return sessions, frames
+
+def store(sessions):
+    sessions_store = LoRaWAN.SessionStore()
+    for session in sessions:
+        sessions_store.add(LoRaWAN.Session(session.devaddr, session.nwkey, session.appkey))
+    return sessions_store
+
+def result(frames, elapsed):
+    return dict(ops_per_sec = len(frames) / elapsed, ns_per_op = elapsed / len(frames) * 1e9)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded decode pipeline benchmark")
+    parser.add_argument('--output', '-o', help="Write the json results to this file instead of stdout")
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count(), help="Highest number of workers to run")
+    parser.add_argument('--frames', '-n', type=int, default=100000, help="Number of frames. Default is 100000.")
+    parser.add_argument('--devices', '-d', type=int, default=1000, help="Number of devices. Default is 1000.")
+    args = parser.parse_args()
+
+    sessions, frames = traffic(args.devices, args.frames)
+    cmac_cache.size = max(cmac_cache.size, 2 * args.devices)
+    cmac_cache.clear()
+    results = {}
+
+    start = time.perf_counter()
+    BatchDecoder(store(sessions)).decode(frames)
+    results['pipeline/in_process'] = result(frames, time.perf_counter() - start)
+
+    workers = 1
+    while workers <= args.workers:
+        with LoRaWAN.ShardedPipeline(sessions, workers=workers) as pipeline:
+            start = time.perf_counter()
+            decoded = pipeline.decode(frames)
+            results['pipeline/workers/%d' % workers] = result(frames, time.perf_counter() - start)
+        assert all(frame.error == BatchDecoder.OK for frame in decoded)
+        workers *= 2
+
+    for name in sorted(results):
+        sys.stderr.write("%-45s %12.0f ns/frame %10.0f frames/s\n" % (name, results[name]['ns_per_op'],
+                                                                      results[name]['ops_per_sec']))
+    report = dict(
+            timestamp = time.time(),
+            python = platform.python_version(),
+            machine = platform.machine(),
+            cpus = os.cpu_count(),
+            results = results
+        )
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
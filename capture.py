@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+#
+# summarize capture files (capture log or LoRaTap pcap) per devaddr: frames,
+# bytes, mic failures and frame counter gaps. the files are streamed, memory
+# only grows with the number of devices. mics are checked for the devaddrs
+# given with --session:
+#
+#   python3 capture.py capture.pcap [--session 2601115f:<nwskey>:<appskey>] [--json]
+#
+import argparse
+import json
+import sys
+from LoRaWAN.BatchDecoder import BatchDecoder
+from LoRaWAN.Capture import read_capture, decode_capture, CaptureSummary
+
+ERRORS = dict((getattr(BatchDecoder, name), name.lower()) for name in
+              ('OK', 'MALFORMED', 'UNSUPPORTED_MTYPE', 'UNKNOWN_DEVADDR', 'INVALID_MIC', 'INVALID_FCNT'))
+
+parser = argparse.ArgumentParser(description="Summarize LoRaWAN capture files")
+parser.add_argument('files', nargs='+', help="Capture logs or LoRaTap pcap files")
+parser.add_argument('--session', '-s', action='append', default=[], metavar='DEVADDR:NWSKEY:APPSKEY',
+                    help="Session keys in hex to check mics with, can be repeated")
+parser.add_argument('--batch', type=int, default=4096, help="Frames decoded per batch. Default is 4096.")
+parser.add_argument('--json', action='store_true', help="Print the summary as json")
+args = parser.parse_args()
+
+keys = {}
+for session in args.session:
+    devaddr, nwskey, appskey = session.split(':')
+    keys[bytes.fromhex(devaddr)] = (bytes.fromhex(nwskey), bytes.fromhex(appskey))
+
+summary = CaptureSummary()
+for path in args.files:
+    for record, frame in decode_capture(read_capture(path), keys.get, args.batch):
+        summary.add(record, frame)
+
+report = summary.report()
+report['errors'] = dict((ERRORS.get(error, str(error)), count) for error, count in sorted(report['errors'].items()))
+if args.json:
+    print(json.dumps(report, indent=2, sort_keys=True))
+    sys.exit(0)
+
+print("%d frames" % report['frames'])
+for error, count in report['errors'].items():
+    print("  %-20s %d" % (error, count))
+print("\n%-14s %10s %12s %8s %8s %8s %8s" % ('devaddr', 'frames', 'bytes', 'mic_err', 'repeats', 'gaps', 'resets'))
+for name, device in report['devices'].items():
+    print("%-14s %10d %12d %8d %8d %8d %8d" % (name, device['frames'], device['bytes'], device['mic_failures'],
+                                                 device['repeats'], device['fcnt_gaps'], device['fcnt_resets']))
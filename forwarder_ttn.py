@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+#
+# network server side of the semtech udp packet forwarder: receives the
+# uplinks of the gateways, decodes them with the example session and answers
+# confirmed uplinks with an ack in rx1. --fake runs a fake gateway against
+# it that sends the example uplinks:
+#
+#   python3 forwarder_ttn.py [--port 1700] [--fake 10]
+#
+import argparse
+import asyncio
+import binascii
+import LoRaWAN
+from LoRaWAN.MHDR import MHDR
+from LoRaWAN.BatchDecoder import BatchDecoder
+
+parser = argparse.ArgumentParser(description="Semtech UDP packet forwarder server")
+parser.add_argument('--host', default='0.0.0.0')
+parser.add_argument('--port', type=int, default=1700)
+parser.add_argument('--fake', type=int, default=0, help="Run a fake gateway sending this many uplinks, then stop")
+args = parser.parse_args()
+
+# Init
+devaddr = [0x26, 0x01, 0x11, 0x5F]
+nwskey = [0xC3, 0x24, 0x64, 0x98, 0xDE, 0x56, 0x5D, 0x8C, 0x55, 0x88, 0x7C, 0x05, 0x86, 0xF9, 0x82, 0x26]
+appskey = [0x15, 0xF6, 0xF4, 0xD4, 0x2A, 0x95, 0xB0, 0x97, 0x53, 0x27, 0xB7, 0xC1, 0x45, 0x6E, 0xC5, 0x45]
+sessions = LoRaWAN.SessionStore()
+sessions.add(LoRaWAN.Session(devaddr, nwskey, appskey))
+fcnt_down = [0]
+
+def on_uplinks(uplinks):
+    for uplink in uplinks:
+        frame = uplink.frame
+        print("%s (%d gateways) rssi %s snr %s: %s" % (uplink.gateway.hex(), len(uplink.gateways),
+                                                       uplink.rxpk.get('rssi'), uplink.rxpk.get('lsnr'),
+                                                       uplink.payload.hex()))
+        if frame.error != BatchDecoder.OK:
+            print("Error %d" % frame.error)
+            continue
+        print("".join("%02x" % x for x in frame.devaddr), frame.fcnt, frame.payload)
+        if frame.mtype == MHDR.CONF_DATA_UP:
+            fcnt_down[0] += 1
+            ack = LoRaWAN.new(nwskey, appskey)
+            ack.create(MHDR.UNCONF_DATA_DOWN, {'devaddr': devaddr, 'fcnt': fcnt_down[0], 'fctrl': 0x20})
+            server.reply(uplink, ack.to_raw())
+
+async def fake_gateway(server_addr, count):
+    gateway = await LoRaWAN.FakeForwarder(bytes.fromhex('b827ebfffe000001'), server_addr).start()
+    await gateway.pull()
+    for fcnt in range(1, count + 1):
+        lorawan = LoRaWAN.new(nwskey, appskey)
+        lorawan.create(MHDR.CONF_DATA_UP if fcnt % 2 else MHDR.UNCONF_DATA_UP,
+                       {'devaddr': devaddr, 'fcnt': fcnt, 'data': b'Python rules! %d' % fcnt})
+        await gateway.push([lorawan.to_raw()])
+        if fcnt % 2:
+            txpk = await gateway.receive(timeout=1)
+            downlink = LoRaWAN.new(nwskey, appskey)
+            downlink.read(binascii.a2b_base64(txpk['data']))
+            print("downlink fcnt %d ack %s" % (downlink.get_mac_payload().get_fhdr().get_fcnt32(),
+                                               bool(downlink.get_mac_payload().get_fhdr().get_fctrl() & 0x20)))
+    gateway.close()
+
+async def main():
+    address = await server.start(args.host, args.port)
+    print("Listening on %s:%d\n" % address[:2])
+    ingest = asyncio.ensure_future(server.run())
+    try:
+        if args.fake:
+            await fake_gateway(('127.0.0.1', address[1]), args.fake)
+            await asyncio.sleep(0.1)
+        else:
+            await ingest
+    finally:
+        ingest.cancel()
+        server.close()
+        print(server.stats())
+
+server = LoRaWAN.PacketForwarderServer(sessions, on_uplinks, dedup=LoRaWAN.Deduplicator(window=0.2))
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    print("\nKeyboardInterrupt")
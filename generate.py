@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# write synthetic uplink traffic of many devices for load tests, as capture
+# log, journal, LoRaTap pcap or one semtech PUSH_DATA json object (rxpk) per
+# line. the device sessions go to a SQLiteSessionStore for replay.py:
+#
+#   python3 generate.py traffic.log --devices 10000 --frames 1000000 [--join-storm 0.2] [--sqlite sessions.db]
+#   python3 replay.py traffic.log --asap --sqlite sessions.db
+#
+import argparse
+import binascii
+import heapq
+import json
+import random
+import time
+import LoRaWAN
+from LoRaWAN.Capture import LogWriter, PcapWriter
+from LoRaWAN.TrafficGenerator import TrafficGenerator
+
+CHANNELS = (868.1, 868.3, 868.5, 867.1, 867.3, 867.5, 867.7, 867.9)
+
+parser = argparse.ArgumentParser(description="Generate synthetic LoRaWAN uplink traffic")
+parser.add_argument('output', help="Output file")
+parser.add_argument('--format', '-f', choices=('log', 'journal', 'pcap', 'rxpk'), default='log',
+                    help="Capture log, journal, LoRaTap pcap or rxpk json lines. Default is log.")
+parser.add_argument('--devices', '-d', type=int, default=1000, help="Number of devices. Default is 1000.")
+parser.add_argument('--frames', '-n', type=int, default=100000, help="Number of data frames. Default is 100000.")
+parser.add_argument('--period', type=float, default=60.0, help="Seconds between uplinks of a device. Default is 60.")
+parser.add_argument('--sizes', default='5,11,24,51', help="Payload sizes to pick from. Default is 5,11,24,51.")
+parser.add_argument('--confirmed', type=float, default=0.1, help="Share of confirmed frames. Default is 0.1.")
+parser.add_argument('--loss', type=float, default=0.01, help="Share of lost frames. Default is 0.01.")
+parser.add_argument('--join-storm', type=float, default=0.0, metavar='FRACTION',
+                    help="Share of the devices sending a join request at the start")
+parser.add_argument('--storm-window', type=float, default=10.0, help="Seconds the join storm lasts. Default is 10.")
+parser.add_argument('--sf', type=int, default=7, help="Spreading factor. Default is 7.")
+parser.add_argument('--per-push', type=int, default=16, help="rxpk objects per PUSH_DATA line. Default is 16.")
+parser.add_argument('--seed', type=int, help="Random seed, the same seed gives the same traffic")
+parser.add_argument('--sqlite', help="Write the device sessions to this SQLiteSessionStore")
+args = parser.parse_args()
+
+generator = TrafficGenerator(args.devices, period=args.period, sizes=[int(size) for size in args.sizes.split(',')],
+                             confirmed=args.confirmed, loss=args.loss, seed=args.seed)
+if args.sqlite:
+    store = LoRaWAN.SQLiteSessionStore(args.sqlite)
+    generator.sessions(store)
+    store.close()
+
+start = time.time()
+rng = random.Random(args.seed)
+traffic = generator.frames(args.frames)
+if args.join_storm:
+    traffic = heapq.merge(generator.join_storm(args.join_storm, 0.0, args.storm_window), traffic)
+
+def rxpk(timestamp, frame, freq, rssi, snr):
+    return dict(tmst=int(timestamp * 1e6) & 0xFFFFFFFF, time=time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)),
+                chan=CHANNELS.index(freq), rfch=0, freq=freq, stat=1, modu='LORA', datr='SF%dBW125' % args.sf,
+                codr='4/5', rssi=rssi, lsnr=snr, size=len(frame),
+                data=binascii.b2a_base64(frame, newline=False).decode('ascii'))
+
+count = 0
+began = time.perf_counter()
+if args.format == 'journal':
+    journal = LoRaWAN.Journal(args.output, background=False)
+    for timestamp, frame in traffic:
+        journal.append(frame, start + timestamp, rng.choice(CHANNELS), args.sf, rng.randint(-120, -40),
+                       rng.uniform(-10, 10))
+        count += 1
+    journal.close()
+else:
+    with open(args.output, 'ab' if args.format != 'rxpk' else 'a') as f:
+        if args.format == 'rxpk':
+            push = []
+            for timestamp, frame in traffic:
+                push.append(rxpk(start + timestamp, frame, rng.choice(CHANNELS), rng.randint(-120, -40),
+                                 round(rng.uniform(-10, 10), 1)))
+                count += 1
+                if len(push) >= args.per_push:
+                    f.write(json.dumps({'rxpk': push}, separators=(',', ':')) + '\n')
+                    push = []
+            if push:
+                f.write(json.dumps({'rxpk': push}, separators=(',', ':')) + '\n')
+        elif args.format == 'pcap':
+            writer = PcapWriter(f)
+            for timestamp, frame in traffic:
+                writer.write(frame, start + timestamp, rng.choice(CHANNELS), args.sf, rssi=rng.randint(-120, -40),
+                             snr=rng.uniform(-10, 10))
+                count += 1
+        else:
+            writer = LogWriter(f)
+            for timestamp, frame in traffic:
+                writer.write(frame, start + timestamp)
+                count += 1
+elapsed = time.perf_counter() - began
+
+print("%d frames of %d devices in %.3f s: %.0f frames/s, %d lost" % (count, args.devices, elapsed, count / elapsed,
+                                                                    generator.lost))
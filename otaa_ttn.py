@@ -2,6 +2,9 @@
 import sys
 from time import sleep
 from SX127x.LoRa import *
+from SX127x.RadioProfile import RadioProfile
+from SX127x.ChannelPlan import EU868
+from SX127x.RxWindows import RxWindowScheduler
 from SX127x.LoRaArgumentParser import LoRaArgumentParser
 from SX127x.board_config import BOARD
 import LoRaWAN
@@ -14,12 +17,20 @@ parser = LoRaArgumentParser("LoRaWAN sender")
 class LoRaWANotaa(LoRa):
     def __init__(self, verbose = False):
         super(LoRaWANotaa, self).__init__(verbose)
+        self.windows = RxWindowScheduler(self, self.on_downlink, rx1_delay=JOIN_ACCEPT_DELAY1)
 
     def on_rx_done(self):
         print("RxDone")
+        self.windows.rx_done()
 
-        self.clear_irq_flags(RxDone=1)
-        payload = self.read_payload(nocheck=True)
+    def on_rx_timeout(self):
+        self.windows.rx_timeout()
+
+    def on_downlink(self, payload, window):
+        if payload is None:
+            print("No join accept in RX1 or RX2")
+            print(self.windows.jitter[1].stats())
+            return
 
         lorawan = LoRaWAN.new([], appkey)
         lorawan.read(payload)
@@ -27,32 +38,28 @@ class LoRaWANotaa(LoRa):
         print(lorawan.get_mhdr().get_mversion())
 
         if lorawan.get_mhdr().get_mtype() == MHDR.JOIN_ACCEPT:
-            print("Got LoRaWAN join accept")
+            print("Got LoRaWAN join accept in RX%d" % window)
             print(lorawan.valid_mic())
             print(lorawan.get_devaddr())
             print(lorawan.derive_nwskey(devnonce))
             print(lorawan.derive_appskey(devnonce))
+            print(self.windows.jitter[window].stats())
             print("\n")
             sys.exit(0)
 
-        print("Got LoRaWAN message continue listen for join accept")
+        print("Got LoRaWAN message instead of a join accept")
 
     def on_tx_done(self):
-        self.clear_irq_flags(TxDone=1)
+        self.windows.tx_done()
         print("TxDone")
 
-        self.set_mode(MODE.STDBY)
-        self.set_dio_mapping([0,0,0,0,0,0])
-        self.set_invert_iq(1)
-        self.reset_ptr_rx()
-        self.set_mode(MODE.RXCONT)
-
     def start(self):
         self.tx_counter = 1
 
         lorawan = LoRaWAN.new(appkey)
         lorawan.create(MHDR.JOIN_REQUEST, {'deveui': deveui, 'appeui': appeui, 'devnonce': devnonce})
 
+        self.windows.arm(rx1_window, rx2_window)
         self.write_payload(lorawan.to_raw())
         self.set_mode(MODE.TX)
         while True:
@@ -60,6 +67,7 @@ class LoRaWANotaa(LoRa):
 
 
 # Init
+JOIN_ACCEPT_DELAY1 = 5.0
 deveui = [0x00, 0x47, 0x64, 0xB1, 0xAB, 0xC6, 0x4F, 0x7C]
 appeui = [0x70, 0xB3, 0xD5, 0x7E, 0xF0, 0x00, 0x51, 0x34]
 appkey = [0xA1, 0x0F, 0x0E, 0x87, 0x0A, 0x15, 0x58, 0x40, 0x89, 0x73, 0xC0, 0x60, 0x1E, 0x19, 0xC3, 0xD1]
@@ -67,14 +75,11 @@ devnonce = [randrange(256), randrange(256)]
 lora = LoRaWANotaa(False)
 
 # Setup
+uplink = RadioProfile(freq=868.1, spreading_factor=7, dio_mapping=[1,0,0,0,0,0])
+rx1_window = EU868.profile(EU868.rx1(0, 5), uplink=False)
+rx2_window = EU868.profile(EU868.rx2(), uplink=False)
 lora.set_mode(MODE.SLEEP)
-lora.set_dio_mapping([1,0,0,0,0,0])
-lora.set_freq(868.1)
-lora.set_pa_config(pa_select=1)
-lora.set_spreading_factor(7)
-lora.set_pa_config(max_power=0x0F, output_power=0x0E)
-lora.set_sync_word(0x34)
-lora.set_rx_crc(True)
+lora.apply_profile(uplink)
 
 print(lora)
 assert(lora.get_agc_auto_on() == 1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+#
+# replay recorded frames (hex lines, capture log, journal or LoRaTap pcap)
+# through read, mic check, decryption and the frame counter checks, and report
+# throughput, latency percentiles and the results per kind:
+#
+#   python3 replay.py rx_ttn.jnl [--speed 10 | --asap] [--session 2601115f:<nwskey>:<appskey>] [--sqlite sessions.db]
+#
+# with --appkey the join requests go through a JoinServer. it hands out its
+# own devaddrs and keys, not those of the recorded join accepts, so uplinks of
+# devices that joined during the recording only decode with their session
+# given by --session or --sqlite.
+#
+import argparse
+import json
+import sqlite3
+import LoRaWAN
+from LoRaWAN.Capture import read_capture
+from LoRaWAN.Replay import Replay
+
+def speed(value):
+    value = float(value)
+    if not value > 0:
+        raise argparse.ArgumentTypeError("speed must be greater than 0, use --asap to replay as fast as possible")
+    return value
+
+parser = argparse.ArgumentParser(description="Replay recorded LoRaWAN traffic through the codec")
+parser.add_argument('files', nargs='+', help="Hex, capture log, journal or LoRaTap pcap files")
+parser.add_argument('--speed', type=speed, default=1.0, help="Replay this many times faster than recorded. Default is 1.")
+parser.add_argument('--asap', action='store_true', help="Replay as fast as possible")
+parser.add_argument('--session', '-s', action='append', default=[], metavar='DEVADDR:NWSKEY:APPSKEY',
+                    help="Session keys in hex, can be repeated")
+parser.add_argument('--sqlite', help="Load the sessions from this SQLiteSessionStore, it is opened read-only")
+parser.add_argument('--appkey', '-a', action='append', default=[], metavar='DEVEUI:APPKEY',
+                    help="Answer the join requests of this device, in hex, can be repeated")
+parser.add_argument('--netid', default='000013', help="NetID of the join server in hex. Default is 000013.")
+parser.add_argument('--json', action='store_true', help="Print the report as json")
+args = parser.parse_args()
+
+store = LoRaWAN.SessionStore()
+if args.sqlite:
+    try:
+        sqlite = LoRaWAN.SQLiteSessionStore(args.sqlite, readonly=True)
+    except sqlite3.Error as e:
+        parser.error("%s: %s" % (args.sqlite, e))
+    for session in sqlite:
+        store.add(LoRaWAN.Session(session.devaddr, session.nwkey, session.appkey, session.deveui))
+    sqlite.db.close()
+for session in args.session:
+    devaddr, nwskey, appskey = session.split(':')
+    store.add(LoRaWAN.Session(bytes.fromhex(devaddr), bytes.fromhex(nwskey), bytes.fromhex(appskey)))
+join_server = None
+if args.appkey:
+    join_server = LoRaWAN.JoinServer(bytes.fromhex(args.netid), store)
+    for device in args.appkey:
+        deveui, appkey = device.split(':')
+        join_server.add_device(bytes.fromhex(deveui), bytes.fromhex(appkey))
+
+def records():
+    for path in args.files:
+        yield from read_capture(path)
+
+replay = Replay(store, speed=None if args.asap else args.speed, join_server=join_server)
+try:
+    report = replay.run(records())
+except KeyboardInterrupt:
+    report = replay.report()
+
+if args.json:
+    print(json.dumps(report, indent=2, sort_keys=True))
+else:
+    print("%d frames, %d bytes in %.3f s: %.0f frames/s, %d late" % (report['frames'], report['bytes'], report['elapsed'],
+                                                                      report['frames_per_sec'] or 0, report['late']))
+    for name, value in report.get('latency_us', {}).items():
+        print("  latency %-6s %10.1f us" % (name, value))
+    for result, count in report['results'].items():
+        print("  %-24s %d" % (result, count))
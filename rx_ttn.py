@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
+import time
 from time import sleep
 from SX127x.LoRa import *
 from SX127x.LoRaArgumentParser import LoRaArgumentParser
 from SX127x.board_config import BOARD
 import LoRaWAN
+from LoRaWAN.BatchDecoder import BatchDecoder
+from SX127x.RxRing import RxRing, RxConsumerPool
 
 BOARD.setup()
 parser = LoRaArgumentParser("LoRaWAN receiver")
@@ -13,25 +16,8 @@ class LoRaWANrcv(LoRa):
         super(LoRaWANrcv, self).__init__(verbose)
 
     def on_rx_done(self):
-        print("RxDone")
-
-        self.clear_irq_flags(RxDone=1)
-        payload = self.read_payload(nocheck=True)
-        print("".join(format(x, '02x') for x in bytes(payload)))
-
-        lorawan = LoRaWAN.new(nwskey, appskey)
-        lorawan.read(payload)
-        print(lorawan.get_mhdr().get_mversion())
-        print(lorawan.get_mhdr().get_mtype())
-        print(lorawan.get_mic())
-        print(lorawan.compute_mic())
-        print(lorawan.valid_mic())
-        print("".join(list(map(chr, lorawan.get_payload()))))
-        print("\n")
-
-        self.set_mode(MODE.SLEEP)
-        self.reset_ptr_rx()
-        self.set_mode(MODE.RXCONT)
+        # runs in the GPIO callback thread: only copy the packet out, the consumer decodes it
+        self.drain_rx_fifo(ring)
 
     def start(self):
         self.reset_ptr_rx()
@@ -40,17 +26,45 @@ class LoRaWANrcv(LoRa):
             sleep(.5)
 
 
+def on_packets(packets):
+    for packet in packets:
+        journal.append(packet.payload, packet.timestamp + clock_offset, freq, sf, packet.rssi, packet.snr)
+    frames = LoRaWAN.decode_batch([packet.payload for packet in packets], sessions)
+    for packet, frame in zip(packets, frames):
+        print("RxDone rssi %d snr %.2f" % (packet.rssi, packet.snr))
+        print("".join(format(x, '02x') for x in packet.payload))
+        print(frame.mtype)
+        if frame.error == BatchDecoder.OK:
+            print("".join("%02x" % x for x in frame.devaddr), frame.fcnt)
+            print("".join(list(map(chr, frame.payload))))
+        elif frame.error == BatchDecoder.UNKNOWN_DEVADDR:
+            print("Unknown device")
+        else:
+            print("Error %d" % frame.error)
+        print("\n")
+
+
 # Init
+devaddr = [0x26, 0x01, 0x11, 0x5F]
 nwskey = [0xC3, 0x24, 0x64, 0x98, 0xDE, 0x56, 0x5D, 0x8C, 0x55, 0x88, 0x7C, 0x05, 0x86, 0xF9, 0x82, 0x26]
 appskey = [0x15, 0xF6, 0xF4, 0xD4, 0x2A, 0x95, 0xB0, 0x97, 0x53, 0x27, 0xB7, 0xC1, 0x45, 0x6E, 0xC5, 0x45]
+sessions = LoRaWAN.SessionStore()
+sessions.add(LoRaWAN.Session(devaddr, nwskey, appskey))
+freq = 868.1
+sf = 7
+# rx timestamps are monotonic, the journal keeps wall clock time
+clock_offset = time.time() - time.monotonic()
+journal = LoRaWAN.Journal('rx_ttn.jnl')
+ring = RxRing(slots=64)
+consumers = RxConsumerPool(ring, on_packets).start()
 lora = LoRaWANrcv(False)
 
 # Setup
 lora.set_mode(MODE.SLEEP)
 lora.set_dio_mapping([0] * 6)
-lora.set_freq(868.1)
+lora.set_freq(freq)
 lora.set_pa_config(pa_select=1)
-lora.set_spreading_factor(7)
+lora.set_spreading_factor(sf)
 lora.set_sync_word(0x34)
 lora.set_rx_crc(True)
 
@@ -64,6 +78,10 @@ except KeyboardInterrupt:
     sys.stdout.flush()
     print("\nKeyboardInterrupt")
 finally:
+    consumers.stop()
+    journal.close()
+    print(ring.stats())
+    print(journal.stats())
     sys.stdout.flush()
     lora.set_mode(MODE.SLEEP)
     BOARD.teardown()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# run otaa_ttn.py, rx_ttn.py or tx_ttn.py against the simulated SX127x board
+# instead of a Raspberry Pi. otaa gets its join accept from a local join
+# server, rx gets uplinks from a simulated device:
+#
+#   python3 simulate.py otaa|rx|tx [--speed 10] [--loss 0.1] [--duration 10]
+#
+import argparse
+import os
+import runpy
+import sys
+import threading
+import time
+import _thread
+
+parser = argparse.ArgumentParser(description="Run a script on the simulated SX127x board")
+parser.add_argument('script', choices=['otaa', 'rx', 'tx'])
+parser.add_argument('--speed', type=float, default=10.0, help="Simulated time runs this many times faster. Default is 10.")
+parser.add_argument('--loss', type=float, default=0.0, help="Probability an uplink or downlink is lost. Default is 0.")
+parser.add_argument('--seed', default=None, help="Seed of the loss model")
+parser.add_argument('--duration', type=float, default=10.0, help="Stop the script after this many seconds. Default is 10.")
+parser.add_argument('--interval', type=float, default=5.0, help="rx: simulated seconds between uplinks. Default is 5.")
+args = parser.parse_args()
+
+os.environ['SX127X_BOARD'] = 'sim'
+os.environ['SX127X_SIM_SPEED'] = str(args.speed)
+os.environ['SX127X_SIM_LOSS'] = str(args.loss)
+if args.seed is not None:
+    os.environ['SX127X_SIM_SEED'] = args.seed
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from SX127x.board_config import BOARD
+import LoRaWAN
+from LoRaWAN.MHDR import MHDR
+from LoRaWAN.MalformedPacketException import MalformedPacketException
+
+radio = BOARD.radio
+JOIN_ACCEPT_DELAY1 = 5.0
+
+# keys of the example scripts
+DEVEUI = [0x00, 0x47, 0x64, 0xB1, 0xAB, 0xC6, 0x4F, 0x7C]
+APPKEY = [0xA1, 0x0F, 0x0E, 0x87, 0x0A, 0x15, 0x58, 0x40, 0x89, 0x73, 0xC0, 0x60, 0x1E, 0x19, 0xC3, 0xD1]
+DEVADDR = [0x26, 0x01, 0x11, 0x5F]
+NWSKEY = [0xC3, 0x24, 0x64, 0x98, 0xDE, 0x56, 0x5D, 0x8C, 0x55, 0x88, 0x7C, 0x05, 0x86, 0xF9, 0x82, 0x26]
+APPSKEY = [0x15, 0xF6, 0xF4, 0xD4, 0x2A, 0x95, 0xB0, 0x97, 0x53, 0x27, 0xB7, 0xC1, 0x45, 0x6E, 0xC5, 0x45]
+
+def print_transmit(packet):
+    print("[sim] transmitted %s on %.3f MHz SF%d" % (packet.payload.hex(), packet.freq, packet.sf))
+
+def join_server():
+    server = LoRaWAN.JoinServer([0x00, 0x00, 0x13], LoRaWAN.SessionStore())
+    server.add_device(DEVEUI, APPKEY)
+
+    def on_transmit(packet):
+        print_transmit(packet)
+        if LoRaWAN.peek_mtype(packet.payload) != MHDR.JOIN_REQUEST:
+            return
+        try:
+            accept, session = server.join(packet.payload)
+        except MalformedPacketException as e:
+            print("[sim] join request rejected: %s" % e)
+            return
+        print("[sim] join accepted, devaddr %s" % session.devaddr.hex())
+        # the device opens its RX1 window JOIN_ACCEPT_DELAY1 real seconds after TxDone
+        delay = (JOIN_ACCEPT_DELAY1 - (time.monotonic() - packet.end)) * args.speed
+        radio.inject(accept, delay=delay, freq=packet.freq, sf=packet.sf, bw=packet.bw, invert_iq=1)
+    radio.add_listener(on_transmit)
+
+def uplinks():
+    fcnt = [0]
+
+    def send():
+        fcnt[0] += 1
+        lorawan = LoRaWAN.new(NWSKEY, APPSKEY)
+        lorawan.create(MHDR.UNCONF_DATA_UP, {'devaddr': DEVADDR, 'fcnt': fcnt[0], 'data': b'Python rules! %d' % fcnt[0]})
+        radio.inject(lorawan.to_raw(), freq=868.1, sf=7, bw=7, invert_iq=0, rssi=-70, snr=8.5)
+        radio.schedule(args.interval, send)
+        return [], []
+    radio.schedule(1.0, send)
+
+def stop():
+    print("[sim] stopping after %.1f s: %s" % (args.duration, radio.stats))
+    _thread.interrupt_main()
+
+if args.script == 'otaa':
+    join_server()
+elif args.script == 'rx':
+    uplinks()
+else:
+    radio.add_listener(print_transmit)
+
+timer = threading.Timer(args.duration, stop)
+timer.daemon = True
+timer.start()
+script = os.path.join(os.path.dirname(os.path.abspath(__file__)), '%s_ttn.py' % args.script)
+sys.argv = [script]
+try:
+    runpy.run_path(script, run_name='__main__')
+except (KeyboardInterrupt, SystemExit):
+    pass
@@ -2,6 +2,7 @@
 import sys
 from time import sleep
 from SX127x.LoRa import *
+from SX127x.RadioProfile import RadioProfile
 from SX127x.LoRaArgumentParser import LoRaArgumentParser
 from SX127x.board_config import BOARD
 import LoRaWAN
@@ -40,14 +41,9 @@ appskey = [0x15, 0xF6, 0xF4, 0xD4, 0x2A, 0x95, 0xB0, 0x97, 0x53, 0x27, 0xB7, 0xC
 lora = LoRaWANsend(False)
 
 # Setup
+uplink = RadioProfile(freq=868.1, spreading_factor=7, dio_mapping=[1,0,0,0,0,0])
 lora.set_mode(MODE.SLEEP)
-lora.set_dio_mapping([1,0,0,0,0,0])
-lora.set_freq(868.1)
-lora.set_pa_config(pa_select=1)
-lora.set_spreading_factor(7)
-lora.set_pa_config(max_power=0x0F, output_power=0x0E)
-lora.set_sync_word(0x34)
-lora.set_rx_crc(True)
+lora.apply_profile(uplink)
 
 print(lora)
 assert(lora.get_agc_auto_on() == 1)